@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'main.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,7 +61,7 @@ ROOT_URLCONF = 'config_pro.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'main.template_backends.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -136,10 +137,107 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Login attempts allowed per phone number and per client IP within a
+# sliding LOGIN_ATTEMPT_WINDOW seconds; further attempts are refused before
+# any password hashing. A successful login resets the phone's count.
+# The client IP is REMOTE_ADDR unless LOGIN_TRUSTED_PROXIES reverse proxies
+# sit in front, each appending to X-Forwarded-For; set it to their number so
+# the per-IP limit counts clients rather than the proxy.
+LOGIN_ATTEMPT_WINDOW = 300
+LOGIN_ATTEMPTS_PER_PHONE = 5
+LOGIN_ATTEMPTS_PER_IP = 20
+LOGIN_TRUSTED_PROXIES = int(os.environ.get('TRADEX_TRUSTED_PROXIES', 0))
+
 # Caching Configuration for Performance
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'tradex-performance-cache',
+# Production shares one SQLite-backed cache between every worker process on
+# the host, so each quote is fetched and held once rather than per worker.
+# Point TRADEX_CACHE_PATH at /dev/shm to keep it in memory on Linux.
+if DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tradex-performance-cache',
+        }
     }
-}
\ No newline at end of file
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'main.cache_backends.SQLiteCache',
+            'LOCATION': os.environ.get('TRADEX_CACHE_PATH', str(BASE_DIR / 'cache.sqlite3')),
+        }
+    }
+
+# Market data fetching
+# QUOTE_FETCH_MODE is 'batch' (one bulk upstream request per page) or
+# 'concurrent' (chunks fetched in parallel on a shared thread pool, bounded
+# by QUOTE_FETCH_DEADLINE seconds; late symbols fall back to the last
+# known quote, marked stale).
+QUOTE_CACHE_TTL = 300
+QUOTE_STALE_TTL = 24 * 60 * 60
+QUOTE_FETCH_MODE = 'batch'
+QUOTE_FETCH_WORKERS = 8
+QUOTE_FETCH_CHUNK_SIZE = 5
+QUOTE_FETCH_DEADLINE = 0.4
+QUOTE_FETCH_TIMEOUT = 10
+
+# Background refresher (`manage.py refresh_quotes`). QUOTE_CACHE_ONLY keeps
+# page renders off the upstream entirely once the refresher is running; it
+# only makes sense with a cache shared between the refresher and the web
+# workers.
+QUOTE_REFRESH_INTERVAL = 60
+QUOTE_CACHE_ONLY = False
+
+# Quotes older than QUOTE_CACHE_TTL are served stale while one background
+# fetch per symbol revalidates them. Symbols the upstream cannot price are
+# not retried for QUOTE_NEGATIVE_TTL seconds, doubling per consecutive
+# failure up to QUOTE_NEGATIVE_MAX_TTL.
+QUOTE_NEGATIVE_TTL = 30
+QUOTE_NEGATIVE_MAX_TTL = 15 * 60
+
+# Per-request metrics (main.middleware.RequestMetricsMiddleware), served in
+# Prometheus text format at /metrics/ to staff users or to requests bearing
+# METRICS_TOKEN. Each worker copies its metrics into the shared cache every
+# METRICS_PUBLISH_INTERVAL seconds so any worker reports for all of them;
+# METRICS_WORKER_SLOTS bounds how many live workers are reported.
+# Set SLOW_REQUEST_THRESHOLD (seconds) to log slow requests with their
+# slowest queries as warnings on the main.middleware logger.
+METRICS_TOKEN = os.environ.get('TRADEX_METRICS_TOKEN')
+METRICS_PUBLISH_INTERVAL = 10
+METRICS_WORKER_TTL = 60 * 60
+METRICS_WORKER_SLOTS = 64
+SLOW_REQUEST_THRESHOLD = None
+
+# Dashboard and watchlist sections are cached as rendered HTML. Shared
+# sections are keyed on the quotes they show, per-user ones also on a
+# version token moved whenever the user's transactions, holdings or
+# watchlist change; FRAGMENT_CACHE_TTL only bounds how long they linger.
+FRAGMENT_CACHE_TTL = 300
+
+# Symbol search and validation use an in-memory index of the Stock table
+# (the instrument master). Each process re-reads the shared version key at
+# most every INSTRUMENT_INDEX_RECHECK seconds and rebuilds if it moved.
+INSTRUMENT_INDEX_RECHECK = 30
+
+# Risk metrics on the investment summary use this much daily bar history
+# (see ingest_prices), cached per user and portfolio version for the day.
+RISK_LOOKBACK_DAYS = 5 * 365
+
+# SIP projections simulate SIP_PROJECTION_PATHS paths from returns
+# bootstrapped out of SIP_PROJECTION_LOOKBACK_DAYS of the instrument's daily
+# bars, memoized per symbol, frequency and horizon for the day.
+SIP_PROJECTION_PATHS = 10000
+SIP_PROJECTION_LOOKBACK_DAYS = 10 * 365
+
+# Market-data provider behind get_stock_data / get_multiple_stocks. For
+# offline load tests use 'main.providers.SimulatedProvider' (options: seed,
+# drift, volatility, tick_seconds) or 'main.providers.ReplayProvider'
+# (options: path, speed, loop).
+MARKET_DATA_PROVIDER = 'main.providers.YFinanceProvider'
+MARKET_DATA_PROVIDER_OPTIONS = {}
+
+# Live quote push (`/stream/quotes/`, served over ASGI). Each process polls
+# every subscribed symbol once per QUOTE_STREAM_INTERVAL seconds in one
+# batch; idle connections get a keep-alive comment every
+# QUOTE_STREAM_HEARTBEAT seconds.
+QUOTE_STREAM_INTERVAL = 5
+QUOTE_STREAM_HEARTBEAT = 15
@@ -0,0 +1,176 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from . import fragments, instruments, projection
+from .forms import SIPProjectionForm
+from .models import Transaction, Watchlist
+from .pagination import keyset_page
+from .utils import get_multiple_stocks
+from .valuation import PortfolioValuationEngine
+
+MAX_SYMBOLS = 50
+
+QUOTE_FIELDS = ['symbol', 'price', 'change', 'change_percent', 'fetched_at']
+HOLDING_FIELDS = ['symbol', 'quantity', 'avg_price', 'price', 'value', 'pnl', 'pnl_percent', 'stale']
+INSTRUMENT_FIELDS = ['symbol', 'name', 'exchange', 'isin', 'currency']
+PROJECTION_FIELDS = ['period', 'years', 'invested', 'p10', 'p50', 'p90']
+TRANSACTION_FIELDS = ['id', 'timestamp', 'type', 'symbol', 'quantity', 'price', 'realized_pnl']
+
+
+def _etag(*parts):
+    return quote_etag(hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest())
+
+
+def _quote_stamps(quotes):
+    return tuple(sorted((sym, data.get('fetched_at'), bool(data.get('stale'))) for sym, data in quotes.items()))
+
+
+def _ledger_version(user):
+    # The fragment version also moves when a lot rebuild rewrites realized P&L
+    # without adding a transaction.
+    return (Transaction.objects.filter(user=user).aggregate(last=Max('id'))['last'],
+            fragments.user_version(user.id))
+
+
+def _conditional(request, etag, build):
+    """
+    304 when the client already holds `etag`, otherwise the payload from
+    `build()`. ETags are computed from cheap version data (quote fetch
+    times and stale flags, the user's last transaction id and fragment
+    version) so an unchanged poll skips valuation and serialisation
+    entirely.
+    """
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = Response(status=304)
+    else:
+        response = Response(build())
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _quote_row(data):
+    return [data['symbol'], data['price'], data['change'], data['change_percent'], round(data.get('fetched_at', 0))]
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def quotes(request):
+    symbols = [s.strip().upper() for s in request.query_params.get('symbols', '').split(',') if s.strip()]
+    symbols = list(dict.fromkeys(symbols))[:MAX_SYMBOLS]
+    data = get_multiple_stocks(symbols)
+    return _conditional(request, _etag('quotes', _quote_stamps(data)), lambda: {
+        'fields': QUOTE_FIELDS,
+        'rows': [_quote_row(q) for q in data.values()],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def portfolio(request):
+    engine = PortfolioValuationEngine()
+    rows = engine.load(request.user)
+    data = get_multiple_stocks([h.stock.symbol for h in rows])
+    etag = _etag('portfolio', _ledger_version(request.user), _quote_stamps(data))
+
+    def build():
+        valuation = engine.value_rows(rows, data)
+        return {
+            'fields': HOLDING_FIELDS,
+            'rows': [[h.stock.symbol, h.quantity, h.avg_price, h.current_price, h.current_value,
+                      h.pnl, h.pnl_percent, h.stale] for h in valuation.holdings],
+            'invested': valuation.total_invested,
+            'value': valuation.current_value,
+            'pnl': valuation.profit_loss,
+            'pnl_percent': valuation.pnl_percent,
+        }
+    return _conditional(request, etag, build)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def watchlist(request):
+    items = Watchlist.objects.filter(user=request.user)
+    version = items.aggregate(n=Count('id'), last=Max('id'))
+    symbols = list(items.order_by('stock__symbol').values_list('stock__symbol', flat=True))
+    data = get_multiple_stocks(symbols)
+    return _conditional(request, _etag('watchlist', version['n'], version['last'], _quote_stamps(data)), lambda: {
+        'fields': QUOTE_FIELDS,
+        'rows': [_quote_row(data[sym]) for sym in symbols if sym in data],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def transactions(request):
+    after = request.query_params.get('after')
+    etag = _etag('transactions', _ledger_version(request.user), after)
+
+    def build():
+        txs = Transaction.objects.filter(user=request.user).select_related('stock')
+        page, _, older = keyset_page(txs, after=after, size=100)
+        return {
+            'fields': TRANSACTION_FIELDS,
+            'rows': [[tx.id, tx.timestamp, tx.transaction_type, tx.stock.symbol, tx.quantity, tx.price,
+                      tx.realized_pnl] for tx in page],
+            'next': older,
+        }
+    return _conditional(request, etag, build)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def instrument_search(request):
+    """
+    Autocomplete over the instrument master, served from the in-memory
+    prefix index. Results only change when the master does, so clients
+    may cache them briefly.
+    """
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), MAX_SYMBOLS)
+    except ValueError:
+        limit = 10
+    matches = instruments.search(request.query_params.get('q', ''), limit)
+    response = Response({
+        'fields': INSTRUMENT_FIELDS,
+        'rows': [[i.symbol, i.name, i.exchange, i.isin, i.currency] for i in matches],
+    })
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sip_projection(request):
+    """
+    Monte Carlo projection of a SIP's corpus for the SIP page: p10/p50/p90
+    bands over time from returns bootstrapped out of the instrument's own
+    daily history. Memoized, so repeat requests skip the simulation.
+    """
+    form = SIPProjectionForm(request.query_params)
+    if not form.is_valid():
+        return Response({'errors': form.errors}, status=400)
+    instrument = instruments.resolve(form.cleaned_data['symbol'])
+    if instrument is None:
+        return Response({'detail': "Stock not found"}, status=404)
+    try:
+        result = projection.project(instrument.symbol, form.cleaned_data['amount'],
+                                    form.cleaned_data['frequency'], form.cleaned_data['years'])
+    except projection.ProjectionError as e:
+        return Response({'detail': str(e)}, status=404)
+    response = Response({
+        'symbol': instrument.symbol,
+        'frequency': form.cleaned_data['frequency'],
+        'years': form.cleaned_data['years'],
+        'paths': result['paths'],
+        'history_days': result['history_days'],
+        'fields': PROJECTION_FIELDS,
+        'rows': result['rows'],
+    })
+    response['Cache-Control'] = 'private, max-age=300'
+    return response
@@ -1,23 +1,70 @@
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
-from .models import Profile
+from django.core.exceptions import PermissionDenied
+
+from .throttle import SlidingWindow
+
+
+def login_throttles():
+    window = getattr(settings, 'LOGIN_ATTEMPT_WINDOW', 300)
+    return (SlidingWindow('login:phone', getattr(settings, 'LOGIN_ATTEMPTS_PER_PHONE', 5), window),
+            SlidingWindow('login:ip', getattr(settings, 'LOGIN_ATTEMPTS_PER_IP', 20), window))
+
+
+def client_ip(request):
+    """
+    The address a request came from. Behind LOGIN_TRUSTED_PROXIES reverse
+    proxies that each append to X-Forwarded-For, it is the entry that many
+    places from the right, which the nearest proxy vouches for; entries
+    further left are whatever the client sent. Without trusted proxies, or
+    when the header is shorter than that, it is REMOTE_ADDR.
+    """
+    proxies = getattr(settings, 'LOGIN_TRUSTED_PROXIES', 0)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR')
+
 
 class PhoneBackend(ModelBackend):
     """
     Authenticates against Profile.phone_number.
+
+    Every attempt is counted per phone number and per client IP before any
+    password is hashed; once either is over its limit for the sliding
+    window the attempt is refused outright with PermissionDenied, which
+    also stops the backends after this one, so a credential-stuffing burst
+    costs a few cache round trips per request rather than a PBKDF2 run.
     """
     def authenticate(self, request, username=None, password=None, **kwargs):
         phone_number = username # In our login form, the 'phone' field is submitted as 'username'
-        if not phone_number:
+        if not phone_number or password is None:
+            return None
+
+        # Normalize phone number (digits only)
+        normalized_phone = ''.join(filter(str.isdigit, str(phone_number)))
+        per_phone, per_ip = login_throttles()
+        ip = client_ip(request) if request is not None else None
+        over = per_phone.hit(normalized_phone or str(phone_number)) > per_phone.limit
+        if ip and per_ip.hit(ip) > per_ip.limit:
+            over = True
+        if over:
+            if request is not None:
+                request.login_throttled = True
+            raise PermissionDenied
+
+        if not normalized_phone:
             return None
-        
-        try:
-            # Normalize phone number (digits only)
-            normalized_phone = ''.join(filter(str.isdigit, str(phone_number)))
-            profile = Profile.objects.get(phone_number=normalized_phone)
-            user = profile.user
-            if user.check_password(password):
-                return user
-        except (Profile.DoesNotExist, User.DoesNotExist):
+        user = User.objects.filter(profile__phone_number=normalized_phone).first()
+        if user is None:
+            # ModelBackend runs next and hashes a dummy password for unknown
+            # usernames, so this path takes as long as a wrong password.
             return None
-        return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            per_phone.clear(normalized_phone)
+            return user
+        # The account was found and its password checked; don't let
+        # ModelBackend hash the same password again.
+        raise PermissionDenied
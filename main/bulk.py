@@ -0,0 +1,21 @@
+from django.db import connection
+
+
+def update_rows(model, fields, rows):
+    """
+    Writes back `fields` for each (value, ..., pk) row with a single
+    executemany of UPDATE ... WHERE pk = %s. QuerySet.bulk_update builds a
+    CASE expression per row and field, which costs more than the writes
+    themselves once there are thousands of rows.
+    """
+    if not rows:
+        return
+    meta = model._meta
+    qn = connection.ops.quote_name
+    columns = [meta.get_field(name) for name in fields]
+    sql = "UPDATE {} SET {} WHERE {} = %s".format(
+        qn(meta.db_table), ', '.join(f"{qn(field.column)} = %s" for field in columns), qn(meta.pk.column))
+    params = [[field.get_db_prep_save(value, connection) for field, value in zip(columns, row)] + [row[-1]]
+              for row in rows]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
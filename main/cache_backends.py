@@ -0,0 +1,168 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit.
+_MAX_PARAMS = 500
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache backend backed by a single SQLite file shared by every worker
+    process on the host.
+
+    Unlike LocMemCache, each quote is fetched and stored once per host
+    instead of once per worker. The file runs in WAL mode, so reads never
+    block on each other or on the writer, and SQLite serialises writers.
+    No external service is needed. LOCATION is the database file path;
+    /dev/shm keeps it in memory on Linux.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5000)
+        self._mmap_size = options.get('MMAP_SIZE', 256 * 1024 * 1024)
+        # Expired rows are purged on roughly one write in PURGE_FREQUENCY.
+        self._purge_frequency = options.get('PURGE_FREQUENCY', 1000)
+        self._writes = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections are per thread and must not survive a fork.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=self._busy_timeout / 1000,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # Read through a shared memory map rather than a private page
+            # cache, so workers don't each hold a copy of hot pages.
+            conn.execute(f'PRAGMA mmap_size={int(self._mmap_size)}')
+            conn.execute('PRAGMA cache_size=-256')
+            conn.execute(f'PRAGMA busy_timeout={int(self._busy_timeout)}')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL'
+                ') WITHOUT ROWID'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _alive(expires, now):
+        return expires is None or expires > now
+
+    def _after_write(self, conn, count=1):
+        self._writes += count
+        if self._writes >= self._purge_frequency:
+            self._writes = 0
+            conn.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or not self._alive(row[1], time.time()):
+            return default
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        conn = self._connection()
+        now = time.time()
+        results = {}
+        backend_keys = list(key_map)
+        for i in range(0, len(backend_keys), _MAX_PARAMS):
+            chunk = backend_keys[i:i + _MAX_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f'SELECT key, value, expires FROM cache WHERE key IN ({placeholders})', chunk
+            )
+            for key, value, expires in rows:
+                if self._alive(expires, now):
+                    results[key_map[key]] = pickle.loads(value)
+        return results
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if not data:
+            return []
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self.make_and_validate_key(key, version=version),
+             pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+            for key, value in data.items()
+        ]
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', rows)
+        self._after_write(conn, len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        # Insert, or take over a row whose entry has already expired.
+        cursor = conn.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             self.get_backend_timeout(timeout), time.time()),
+        )
+        self._after_write(conn)
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        backend_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        conn = self._connection()
+        for i in range(0, len(backend_keys), _MAX_PARAMS):
+            chunk = backend_keys[i:i + _MAX_PARAMS]
+            conn.execute(f"DELETE FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        return row is not None and self._alive(row[0], time.time())
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None or not self._alive(row[1], time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            conn.execute('UPDATE cache SET value = ? WHERE key = ?',
+                         (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+        return value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
@@ -1,6 +1,6 @@
 from django import forms
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import Profile, Transaction
 
 class TradeXRegistrationForm(forms.Form):
     full_name = forms.CharField(
@@ -66,7 +66,39 @@ class TradeXLoginForm(forms.Form):
         })
     )
 
-class BuyStockForm(forms.Form):
+class OrderTypeForm(forms.Form):
+    ORDER_TYPES = [
+        ('MARKET', 'Market'),
+        ('LIMIT', 'Limit'),
+        ('STOP', 'Stop'),
+    ]
+    order_type = forms.ChoiceField(
+        choices=ORDER_TYPES,
+        initial='MARKET',
+        label="Order Type",
+        widget=forms.Select(attrs={
+            'class': 'w-full bg-[#1a1c1e] border border-white/10 rounded-2xl px-6 py-4 text-sm focus:outline-none focus:border-groww transition text-white'
+        })
+    )
+    trigger_price = forms.DecimalField(
+        label="Trigger Price",
+        required=False,
+        min_value=0.01,
+        max_digits=12,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={
+            'placeholder': 'Limit or stop price',
+            'class': 'w-full bg-white/5 border border-white/10 rounded-2xl px-6 py-4 text-sm focus:outline-none focus:border-groww transition'
+        })
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('order_type', 'MARKET') != 'MARKET' and not cleaned_data.get('trigger_price'):
+            self.add_error('trigger_price', "Limit and stop orders need a trigger price.")
+        return cleaned_data
+
+class BuyStockForm(OrderTypeForm):
     quantity = forms.IntegerField(
         label="Quantity",
         min_value=1,
@@ -77,7 +109,7 @@ class BuyStockForm(forms.Form):
         })
     )
 
-class SellStockForm(forms.Form):
+class SellStockForm(OrderTypeForm):
     quantity = forms.IntegerField(
         label="Quantity to Sell",
         min_value=1,
@@ -93,8 +125,17 @@ class SIPForm(forms.Form):
         ('WEEKLY', 'Weekly'),
         ('MONTHLY', 'Monthly'),
     ]
+    symbol = forms.CharField(
+        label="Stock Symbol",
+        max_length=20,
+        widget=forms.TextInput(attrs={
+            'placeholder': 'e.g. RELIANCE.NS',
+            'class': 'w-full bg-white/5 border border-white/10 rounded-2xl px-6 py-4 text-sm focus:outline-none focus:border-groww transition'
+        })
+    )
     amount = forms.DecimalField(
         label="Monthly Investment Amount",
+        min_value=1,
         max_digits=12,
         decimal_places=2,
         widget=forms.NumberInput(attrs={
@@ -109,3 +150,44 @@ class SIPForm(forms.Form):
             'class': 'w-full bg-[#1a1c1e] border border-white/10 rounded-2xl px-6 py-4 text-sm focus:outline-none focus:border-groww transition text-white'
         })
     )
+
+class SIPProjectionForm(SIPForm):
+    years = forms.IntegerField(min_value=1, max_value=30, required=False)
+
+    def clean_years(self):
+        return self.cleaned_data['years'] or 10
+
+class TransactionFilterForm(forms.Form):
+    TYPE_CHOICES = [('', 'All')] + list(Transaction.TYPES)
+    type = forms.ChoiceField(
+        choices=TYPE_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'bg-[#1a1c1e] border border-white/10 rounded-2xl px-4 py-3 text-sm focus:outline-none focus:border-groww transition text-white'
+        })
+    )
+    symbol = forms.CharField(
+        required=False,
+        max_length=20,
+        widget=forms.TextInput(attrs={
+            'placeholder': 'Symbol',
+            'class': 'bg-white/5 border border-white/10 rounded-2xl px-4 py-3 text-sm focus:outline-none focus:border-groww transition'
+        })
+    )
+    start = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={
+            'type': 'date',
+            'class': 'bg-white/5 border border-white/10 rounded-2xl px-4 py-3 text-sm focus:outline-none focus:border-groww transition'
+        })
+    )
+    end = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={
+            'type': 'date',
+            'class': 'bg-white/5 border border-white/10 rounded-2xl px-4 py-3 text-sm focus:outline-none focus:border-groww transition'
+        })
+    )
+
+    def clean_symbol(self):
+        return self.cleaned_data['symbol'].strip().upper()
@@ -0,0 +1,77 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+def _user_key(user_id):
+    return f'fragments:user:{user_id}'
+
+
+def _digest(parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def quote_version(quotes):
+    """
+    Changes whenever any of the quotes is refetched, so a fragment keyed on
+    it is rendered once per quote refresh.
+    """
+    return tuple(sorted((sym, data.get('fetched_at')) for sym, data in quotes.items()))
+
+
+def user_version(user_id):
+    """
+    Current token for a user's cached fragments. A missing token (never
+    set, or evicted) is replaced, which orphans anything cached under the
+    old one.
+    """
+    version = cache.get(_user_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        cache.set(_user_key(user_id), version, None)
+    return version
+
+
+def invalidate_users(user_ids):
+    """
+    Moves the fragment version of each user, once the surrounding
+    transaction commits so a concurrent render cannot re-cache the old rows.
+    """
+    user_ids = list(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: cache.set_many(
+            {_user_key(uid): time.time_ns() for uid in user_ids}, None))
+
+
+def render_fragment(name, template, build, *version, user_id=None):
+    """
+    HTML of `template` rendered with the context `build()` returns, cached
+    under `name` and `version`, plus the user's fragment version for
+    per-user fragments. `build` only runs on a miss, so a hit skips both
+    the queries and the template.
+    """
+    parts = (name, version) if user_id is None else (name, user_id, user_version(user_id), version)
+    key = f'fragment:{name}:{_digest(parts)}'
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(template, build())
+        cache.set(key, html, getattr(settings, 'FRAGMENT_CACHE_TTL', 300))
+    return mark_safe(html)
+
+
+def cached_for_user(name, user_id, build):
+    """
+    Plain data (lists of symbols and the like) cached under the user's
+    fragment version, so working out a fragment's key needs no queries.
+    """
+    key = f'fragment:{name}:{_digest((name, user_id, user_version(user_id)))}'
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, getattr(settings, 'FRAGMENT_CACHE_TTL', 300))
+    return value
@@ -0,0 +1,174 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Stock
+
+VERSION_KEY = 'instruments:version'
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+@dataclass(frozen=True, slots=True)
+class Instrument:
+    id: int
+    symbol: str
+    name: str
+    exchange: str
+    isin: str
+    currency: str
+
+
+def tokens(text):
+    return _TOKEN.findall(text.lower())
+
+
+class InstrumentIndex:
+    """
+    Immutable in-memory view of the active instruments. Symbols and every
+    word of the company name are held in sorted arrays, so a prefix search
+    is one bisect plus a walk over the matches it returns; exact symbol and
+    ISIN lookups are dict hits. Nothing here touches the database or the
+    network once built.
+    """
+
+    def __init__(self, instruments, version=None):
+        self.version = version
+        self.instruments = list(instruments)
+        self.by_symbol = {}
+        self.by_isin = {}
+        self._words = []
+        symbol_keys, name_keys = [], []
+        for i, inst in enumerate(self.instruments):
+            self.by_symbol[inst.symbol.upper()] = i
+            if inst.isin:
+                self.by_isin[inst.isin.upper()] = i
+            symbol_keys.append((inst.symbol.lower(), i))
+            words = tokens(inst.name)
+            self._words.append(' ' + ' '.join(words))
+            name_keys.extend((word, i) for word in set(words))
+        symbol_keys.sort()
+        name_keys.sort()
+        self._symbol_keys = [k for k, _ in symbol_keys]
+        self._symbol_ids = [i for _, i in symbol_keys]
+        self._name_keys = [k for k, _ in name_keys]
+        self._name_ids = [i for _, i in name_keys]
+
+    def __len__(self):
+        return len(self.instruments)
+
+    @classmethod
+    def load(cls, version=None, chunk_size=5000):
+        rows = (Stock.objects.filter(is_active=True).order_by('symbol')
+                .values_list('id', 'symbol', 'name', 'exchange', 'isin', 'currency')
+                .iterator(chunk_size=chunk_size))
+        return cls((Instrument(*row) for row in rows), version)
+
+    def resolve(self, text):
+        """
+        The instrument for an exact symbol or ISIN, case-insensitively, or None.
+        """
+        index = self._exact(text)
+        return None if index is None else self.instruments[index]
+
+    def _exact(self, text):
+        key = (text or '').strip().upper()
+        index = self.by_symbol.get(key)
+        return self.by_isin.get(key) if index is None else index
+
+    @staticmethod
+    def _prefixed(keys, ids, prefix):
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix):
+            yield ids[i]
+            i += 1
+
+    def _name_matches(self, word):
+        keys = self._name_keys
+        return bisect_left(keys, word + '\uffff') - bisect_left(keys, word)
+
+    def search(self, query, limit=10):
+        """
+        Up to `limit` instruments for `query`: an exact symbol or ISIN
+        first, then symbols starting with it, then names with a word
+        starting with each word of the query.
+        """
+        query = (query or '').strip().lower()
+        words = tokens(query)
+        if not words or limit <= 0:
+            return []
+        results, seen = [], set()
+
+        def take(index):
+            if index not in seen:
+                seen.add(index)
+                results.append(self.instruments[index])
+            return len(results) >= limit
+
+        exact = self._exact(query)
+        if exact is not None and take(exact):
+            return results
+        for index in self._prefixed(self._symbol_keys, self._symbol_ids, query):
+            if take(index):
+                return results
+        # Walk the rarest query word; the others are checked as word-start
+        # substrings of the candidate's space-joined name.
+        lead = min(words, key=self._name_matches)
+        rest = [' ' + q for q in words if q != lead]
+        for index in self._prefixed(self._name_keys, self._name_ids, lead):
+            if all(q in self._words[index] for q in rest) and take(index):
+                break
+        return results
+
+
+_index = None
+_checked = 0.0
+_lock = threading.Lock()
+
+
+def invalidate():
+    """
+    Marks the instrument master as changed, once the surrounding
+    transaction commits so no process rebuilds from the old rows under the
+    new version. This process rebuilds on its next lookup; other processes
+    notice through the shared cache within INSTRUMENT_INDEX_RECHECK seconds.
+    """
+    transaction.on_commit(_bump)
+
+
+def _bump():
+    global _index
+    cache.set(VERSION_KEY, time.time_ns(), None)
+    _index = None
+
+
+def get_index():
+    """
+    The process-wide index, built on first use and rebuilt when the shared
+    version key moves. The version is only read every
+    INSTRUMENT_INDEX_RECHECK seconds so lookups stay in memory.
+    """
+    global _index, _checked
+    now = time.monotonic()
+    index = _index
+    if index is not None and now - _checked < getattr(settings, 'INSTRUMENT_INDEX_RECHECK', 30):
+        return index
+    version = cache.get(VERSION_KEY)
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = InstrumentIndex.load(version)
+        _checked = now
+        return _index
+
+
+def resolve(symbol):
+    return get_index().resolve(symbol)
+
+
+def search(query, limit=10):
+    return get_index().search(query, limit)
@@ -0,0 +1,139 @@
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import F
+from django.utils import timezone
+
+from . import fragments
+from .bulk import update_rows
+from .models import Lot, Profile, Transaction
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+
+@dataclass(frozen=True)
+class LotPosition:
+    quantity: int
+    cost: Decimal
+    unrealized: Decimal
+    holding_days: int
+    opened_at: datetime
+
+
+def fifo_consume(book, quantity, price):
+    """
+    Takes `quantity` shares from `book`, a deque of [quantity, cost_price,
+    ...] lots oldest first, popping the lots it empties. Returns (realized
+    P&L, emptied lots, shares the book could not cover).
+    """
+    realized = ZERO
+    emptied = []
+    while quantity and book:
+        lot = book[0]
+        take = min(quantity, lot[0])
+        realized += (price - lot[1]) * take
+        lot[0] -= take
+        quantity -= take
+        if not lot[0]:
+            emptied.append(book.popleft())
+    return realized, emptied, quantity
+
+
+def open_lot(user, stock, quantity, price, opened_at):
+    return Lot.objects.create(user=user, stock=stock, quantity=quantity, cost_price=price, opened_at=opened_at)
+
+
+def close_lots(user, stock, quantity, price, fallback_cost):
+    """
+    Consumes a sale from the user's lots in `stock`, oldest first, and
+    returns the realized P&L. Only the lots the sale reaches are read; the
+    emptied ones are deleted and a partly sold one is shrunk in place.
+    Shares not covered by lots (an account from before lot tracking that
+    rebuild_lots has not reached) are costed at `fallback_cost`.
+
+    Must run inside the seller's transaction with their holding row
+    locked, as execute_sell does, so sells of one stock cannot interleave.
+    """
+    book = deque()
+    needed = quantity
+    for lot_id, lot_qty, cost in (Lot.objects.filter(user=user, stock=stock).order_by('opened_at', 'id')
+                                  .values_list('id', 'quantity', 'cost_price').iterator(chunk_size=50)):
+        book.append([lot_qty, cost, lot_id])
+        needed -= lot_qty
+        if needed <= 0:
+            break
+
+    realized, emptied, uncovered = fifo_consume(book, quantity, price)
+    realized += (price - fallback_cost) * uncovered
+    if emptied:
+        Lot.objects.filter(id__in=[lot[2] for lot in emptied]).delete()
+    if book and needed < 0:
+        Lot.objects.filter(id=book[0][2]).update(quantity=book[0][0])
+    return realized.quantize(CENT)
+
+
+def book_realized(user, amount):
+    Profile.objects.filter(user=user).update(realized_pnl=F('realized_pnl') + amount)
+
+
+def lot_positions(user, prices):
+    """
+    FIFO view of a user's open holdings from their lots alone:
+    {stock_id: LotPosition}, with the quantity-weighted average days held.
+    `prices` is {symbol: Decimal}; a stock without a price shows no
+    unrealized P&L.
+    """
+    now = timezone.now()
+    totals = defaultdict(lambda: [0, ZERO, 0.0, None, None])
+    for stock_id, symbol, quantity, cost, opened_at in (Lot.objects.filter(user=user)
+                                                        .values_list('stock_id', 'stock__symbol', 'quantity',
+                                                                     'cost_price', 'opened_at')):
+        entry = totals[stock_id]
+        entry[0] += quantity
+        entry[1] += cost * quantity
+        entry[2] += (now - opened_at).total_seconds() / 86400 * quantity
+        entry[3] = min(entry[3], opened_at) if entry[3] else opened_at
+        entry[4] = symbol
+    positions = {}
+    for stock_id, (quantity, cost, share_days, opened_at, symbol) in totals.items():
+        price = prices.get(symbol)
+        unrealized = (price * quantity - cost).quantize(CENT) if price is not None else ZERO
+        positions[stock_id] = LotPosition(quantity, cost.quantize(CENT), unrealized,
+                                          int(share_days / quantity), opened_at)
+    return positions
+
+
+def rebuild_user_lots(user_id, chunk_size=2000):
+    """
+    Replays a user's whole ledger in FIFO order and replaces their lots,
+    the realized_pnl of each sell and their lifetime realized P&L. Used to
+    backfill accounts; normal trading keeps lots current incrementally.
+    Returns (transactions replayed, open lots).
+    """
+    books = defaultdict(deque)
+    realized = []
+    total = ZERO
+    replayed = 0
+    ledger = (Transaction.objects.filter(user_id=user_id).order_by('timestamp', 'id')
+              .values_list('id', 'stock_id', 'transaction_type', 'quantity', 'price', 'timestamp'))
+    for tx_id, stock_id, tx_type, quantity, price, timestamp in ledger.iterator(chunk_size=chunk_size):
+        replayed += 1
+        if tx_type == 'BUY':
+            books[stock_id].append([quantity, price, timestamp])
+            continue
+        pnl, _, _ = fifo_consume(books[stock_id], quantity, price)
+        pnl = pnl.quantize(CENT)
+        realized.append((pnl, tx_id))
+        total += pnl
+
+    lots = [Lot(user_id=user_id, stock_id=stock_id, quantity=quantity, cost_price=cost, opened_at=opened_at)
+            for stock_id, book in books.items() for quantity, cost, opened_at in book]
+    Lot.objects.filter(user_id=user_id).delete()
+    Lot.objects.bulk_create(lots, batch_size=1000)
+    update_rows(Transaction, ['realized_pnl'], realized)
+    Profile.objects.filter(user_id=user_id).update(realized_pnl=total)
+    fragments.invalidate_users([user_id])
+    return replayed, len(lots)
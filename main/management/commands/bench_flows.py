@@ -0,0 +1,230 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from main.models import Lot, Portfolio, Profile, Stock, Transaction, Watchlist
+
+STARTING_BALANCE = Decimal('10000000.00')
+
+# (name, weight, method, url builder) for one simulated user session; the
+# builders get the user's held stock ids and the client's RNG.
+FLOWS = [
+    ('dashboard', 5, 'get', lambda held, rng: reverse('dashboard')),
+    ('portfolio', 3, 'get', lambda held, rng: reverse('portfolio')),
+    ('watchlist', 3, 'get', lambda held, rng: reverse('watchlist')),
+    ('transactions', 2, 'get', lambda held, rng: reverse('transactions')),
+    ('investment_summary', 1, 'get', lambda held, rng: reverse('investment_summary')),
+    ('buy_stock', 1, 'post', lambda held, rng: reverse('buy_stock', args=[rng.choice(held)])),
+    ('sell_stock', 1, 'post', lambda held, rng: reverse('sell_stock', args=[rng.choice(held)])),
+]
+ORDER = {'quantity': 1, 'order_type': 'MARKET'}
+
+
+def seed(users, holdings, watchlist, history, rng):
+    """
+    Creates `users` accounts, each holding `holdings` stocks (with one lot
+    apiece), watching `watchlist` stocks and with `history` past
+    transactions spread over the last year. Returns {user_id: [held stock ids]}.
+    """
+    universe = max(holdings, watchlist) * 4 or 1
+    stocks = Stock.objects.bulk_create([Stock(symbol=f'FLOW{i:05d}.NS', name=f'Flow Company {i}', exchange='NSE')
+                                        for i in range(universe)])
+    now = timezone.now()
+    accounts = {}
+    for i in range(users):
+        user = User.objects.create_user(username=f'flow-{i}')
+        Profile.objects.create(user=user, balance=STARTING_BALANCE)
+        held = rng.sample(stocks, holdings)
+        Portfolio.objects.bulk_create([Portfolio(user=user, stock=s, quantity=1000, avg_price=Decimal('100.00'))
+                                       for s in held])
+        Lot.objects.bulk_create([Lot(user=user, stock=s, quantity=1000, cost_price=Decimal('100.00'),
+                                     opened_at=now - timedelta(days=400)) for s in held])
+        Watchlist.objects.bulk_create([Watchlist(user=user, stock=s) for s in rng.sample(stocks, watchlist)])
+        Transaction.objects.bulk_create([
+            Transaction(user=user, stock=rng.choice(held or stocks), transaction_type=rng.choice(('BUY', 'SELL')),
+                        quantity=rng.randint(1, 20), price=Decimal(rng.randint(50, 150)),
+                        timestamp=now - timedelta(minutes=rng.randint(1, 525600)))
+            for _ in range(history)
+        ], batch_size=1000)
+        accounts[user.id] = [s.id for s in held]
+    return accounts
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def run_flows(accounts, clients=8, requests=50, warmup=5, seed=0):
+    """
+    Runs `clients` threads, each logged in as a random seeded user and
+    issuing `requests` weighted page views and orders after `warmup`
+    unrecorded ones. Returns per-flow latency percentiles (ms), throughput
+    and mean query count, plus the overall totals.
+    """
+    samples = defaultdict(list)
+    queries = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    names, weights = [f[0] for f in FLOWS], [f[1] for f in FLOWS]
+    flows = {f[0]: f for f in FLOWS}
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        user_id = rng.choice(list(accounts))
+        held = accounts[user_id]
+        browser = Client()
+        browser.force_login(User.objects.get(id=user_id))
+        count = [0]
+
+        def counting(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            for i in range(warmup + requests):
+                name = rng.choices(names, weights)[0]
+                _, _, method, url = flows[name]
+                count[0] = 0
+                started = time.perf_counter()
+                with connection.execute_wrapper(counting):
+                    if method == 'get':
+                        response = browser.get(url(held, rng))
+                    else:
+                        response = browser.post(url(held, rng), ORDER)
+                elapsed = time.perf_counter() - started
+                if i < warmup:
+                    continue
+                with lock:
+                    if response.status_code >= 400:
+                        errors[name] += 1
+                    samples[name].append(elapsed)
+                    queries[name].append(count[0])
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    wall = time.perf_counter() - started
+
+    views = {}
+    for name in names:
+        timings = sorted(samples[name])
+        if not timings:
+            continue
+        views[name] = {
+            'requests': len(timings),
+            'errors': errors[name],
+            'p50_ms': round(_percentile(timings, 0.50) * 1000, 2),
+            'p95_ms': round(_percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(_percentile(timings, 0.99) * 1000, 2),
+            'throughput_rps': round(len(timings) / wall, 2),
+            'queries': round(sum(queries[name]) / len(queries[name]), 1),
+        }
+    total = sum(v['requests'] for v in views.values())
+    return {'views': views, 'requests': total, 'seconds': round(wall, 3),
+            'throughput_rps': round(total / wall, 2) if wall else 0.0}
+
+
+def compare(results, baseline, threshold):
+    """
+    Regressions against a stored run: flows whose p95 latency or mean
+    query count grew by more than `threshold` (a fraction). Query counts
+    are means because cache hits vary with thread interleaving.
+    """
+    regressions = []
+    for name, current in results['views'].items():
+        before = baseline.get('views', {}).get(name)
+        if not before:
+            continue
+        if current['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['queries'] > before['queries'] * (1 + threshold):
+            regressions.append(f"{name}: queries {before['queries']} -> {current['queries']}")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database and drive the trading pages and orders with concurrent clients '
+            'against the simulated provider, reporting latency percentiles, throughput and queries per view')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--holdings', type=int, default=20)
+        parser.add_argument('--watchlist', type=int, default=10)
+        parser.add_argument('--history', type=int, default=500, help='Past transactions per user')
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50, help='Recorded requests per client')
+        parser.add_argument('--warmup', type=int, default=5, help='Unrecorded requests per client')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against results saved by an earlier run')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed p95 growth over the baseline before failing (fraction)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        workdir = tempfile.mkdtemp(prefix='bench-flows-')
+        if connection.vendor == 'sqlite':
+            # A file, not the shared in-memory database, so client threads
+            # wait on each other's writes instead of failing with "locked".
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'db.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(MARKET_DATA_PROVIDER='main.providers.SimulatedProvider',
+                                   MARKET_DATA_PROVIDER_OPTIONS={'seed': options['seed']},
+                                   CACHES={'default': {'BACKEND': 'main.cache_backends.SQLiteCache',
+                                                       'LOCATION': os.path.join(workdir, 'cache.sqlite3')}},
+                                   QUOTE_CACHE_ONLY=False,
+                                   ALLOWED_HOSTS=['testserver']):
+                started = time.perf_counter()
+                accounts = seed(options['users'], options['holdings'], options['watchlist'], options['history'],
+                                random.Random(options['seed']))
+                self.stdout.write(f"Seeded {len(accounts)} users in {time.perf_counter() - started:.1f}s")
+                results = run_flows(accounts, options['clients'], options['requests'], options['warmup'],
+                                    options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        results['config'] = {key: options[key] for key in
+                             ('users', 'holdings', 'watchlist', 'history', 'clients', 'requests', 'seed')}
+        results['database'] = connection.vendor
+        self.stdout.write(f"{'flow':<20}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                          f"{'req/s':>8}{'queries':>9}")
+        for name, v in results['views'].items():
+            self.stdout.write(f"{name:<20}{v['requests']:>6}{v['errors']:>5}{v['p50_ms']:>9.1f}{v['p95_ms']:>9.1f}"
+                              f"{v['p99_ms']:>9.1f}{v['throughput_rps']:>8.1f}{v['queries']:>9.1f}")
+        self.stdout.write(f"{results['requests']} requests in {results['seconds']:.1f}s = "
+                          f"{results['throughput_rps']:.1f} req/s")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError("Regressed against baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"Within {options['threshold']:.0%} of the baseline"))
@@ -0,0 +1,67 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.instruments import Instrument, InstrumentIndex
+
+WORDS = ['industries', 'bank', 'finance', 'tata', 'motors', 'power', 'energy', 'pharma', 'steel', 'capital',
+         'infra', 'textiles', 'chemicals', 'foods', 'technologies', 'holdings', 'cement', 'auto', 'realty',
+         'insurance', 'ltd', 'india', 'global', 'united', 'national', 'reliance', 'adani', 'bajaj', 'mahindra']
+SYLLABLES = ['ka', 'ra', 'ma', 'ta', 'sun', 'in', 'dra', 'vi', 'jay', 'shri', 'lak', 'ash', 'ok', 'pa', 'ne',
+             'hin', 'du', 'go', 'del', 'bha', 'rat', 'ti', 'ko', 'ven', 'zen']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark instrument prefix search and symbol resolution over a synthetic instrument master'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--instruments', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=50_000)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        instruments = []
+        for i in range(options['instruments']):
+            base = ''.join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 9)))
+            exchange = rng.choice(['NSE', 'BSE', 'NASDAQ'])
+            suffix = {'NSE': '.NS', 'BSE': '.BO', 'NASDAQ': ''}[exchange]
+            brand = ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 3)))
+            name = ' '.join([brand] + rng.sample(WORDS, rng.randint(1, 3))).title()
+            instruments.append(Instrument(i, f'{base}{i}{suffix}', name, exchange, f'IN{i:010d}', 'INR'))
+
+        started = time.perf_counter()
+        index = InstrumentIndex(instruments)
+        build = time.perf_counter() - started
+
+        queries = []
+        for _ in range(options['queries']):
+            inst = rng.choice(instruments)
+            kind = rng.random()
+            if kind < 0.4:
+                queries.append(inst.symbol[:rng.randint(1, 4)])
+            elif kind < 0.8:
+                queries.append(rng.choice(inst.name.split())[:rng.randint(2, 6)])
+            else:
+                queries.append(' '.join(word[:3] for word in inst.name.split()[:2]))
+        symbols = [rng.choice(instruments).symbol.lower() for _ in range(options['queries'])]
+
+        timings, hits = [], 0
+        for q in queries:
+            started = time.perf_counter()
+            hits += len(index.search(q, options['limit']))
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+
+        started = time.perf_counter()
+        resolved = sum(index.resolve(sym) is not None for sym in symbols)
+        resolve = time.perf_counter() - started
+
+        n = options['queries']
+        self.stdout.write(f"Indexed {len(index)} instruments in {build:.2f}s")
+        self.stdout.write(f"search: p50 {timings[n // 2] * 1e6:.1f}µs, p99 {timings[int(n * 0.99)] * 1e6:.1f}µs, "
+                          f"mean {sum(timings) / n * 1e6:.1f}µs per query ({hits / n:.1f} results avg)")
+        self.stdout.write(f"resolve: {resolve / n * 1e6:.2f}µs per symbol ({resolved}/{n} found)")
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from main.models import Profile
+
+UNLIMITED = 10 ** 9
+
+
+class Command(BaseCommand):
+    help = ('Replay a credential-stuffing burst against authenticate() with and without the login throttle '
+            'and report attempts/s, CPU per attempt and password hashes run')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--attempts', type=int, default=5000, help='Attack attempts with the throttle on')
+        parser.add_argument('--unthrottled-attempts', type=int, default=24,
+                            help='Attack attempts with the throttle off (each costs a full hash)')
+        parser.add_argument('--ips', type=int, default=5, help='Attacker source addresses')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                       'LOCATION': 'bench-login'}}):
+                phones = self.seed(options['users'])
+                for label, attempts, limits in (
+                        ('throttle off', options['unthrottled_attempts'], (UNLIMITED, UNLIMITED)),
+                        ('throttle on', options['attempts'], None)):
+                    overrides = {} if limits is None else {'LOGIN_ATTEMPTS_PER_PHONE': limits[0],
+                                                           'LOGIN_ATTEMPTS_PER_IP': limits[1]}
+                    with override_settings(**overrides):
+                        self.report(label, self.attack(phones, attempts, options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, users):
+        phones = []
+        for i in range(users):
+            phone = f'9{i:09d}'
+            user = User.objects.create_user(username=phone, password='correct horse battery staple')
+            Profile.objects.create(user=user, phone_number=phone)
+            phones.append(phone)
+        return phones
+
+    def attack(self, phones, attempts, options):
+        rng = random.Random(options['seed'])
+        # Mostly known phones with guessed passwords, some unknown ones, from
+        # a small pool of addresses.
+        plan = [(rng.choice(phones) if rng.random() < 0.8 else f'8{rng.randint(0, 10 ** 9):09d}',
+                 f'guess-{i}', f'203.0.113.{rng.randrange(options["ips"])}') for i in range(attempts)]
+        factory = RequestFactory()
+        cursor = iter(plan)
+        lock = threading.Lock()
+        outcomes = {'refused': 0, 'rejected': 0, 'hashes': 0}
+        refused = []
+        encode = PBKDF2PasswordHasher.encode
+
+        def counting_encode(hasher, *args, **kwargs):
+            with lock:
+                outcomes['hashes'] += 1
+            return encode(hasher, *args, **kwargs)
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        attempt = next(cursor, None)
+                    if attempt is None:
+                        return
+                    phone, password, ip = attempt
+                    request = factory.post('/login/', REMOTE_ADDR=ip)
+                    started = time.perf_counter()
+                    authenticate(request, username=phone, password=password)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        if getattr(request, 'login_throttled', False):
+                            outcomes['refused'] += 1
+                            refused.append(elapsed)
+                        else:
+                            outcomes['rejected'] += 1
+            finally:
+                connection.close()
+
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode', counting_encode):
+            cpu, started = time.process_time(), time.perf_counter()
+            pool = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+            elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu
+        refused.sort()
+        return dict(outcomes, attempts=attempts, seconds=elapsed, cpu=cpu,
+                    refused_p50=refused[len(refused) // 2] if refused else 0.0)
+
+    def report(self, label, r):
+        self.stdout.write(
+            f"{label}: {r['attempts']} attempts in {r['seconds']:.2f}s = {r['attempts'] / r['seconds']:.0f}/s, "
+            f"CPU {r['cpu'] / r['attempts'] * 1000:.2f}ms per attempt, {r['hashes']} password hashes, "
+            f"{r['refused']} refused before hashing (p50 {r['refused_p50'] * 1e6:.0f}µs each)")
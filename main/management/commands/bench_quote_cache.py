@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from main.cache_backends import SQLiteCache
+
+
+def _make_cache(backend, path):
+    if backend == 'locmem':
+        return LocMemCache('bench-quotes', {'TIMEOUT': 300, 'OPTIONS': {'MAX_ENTRIES': 1000000}})
+    return SQLiteCache(path, {'TIMEOUT': 300})
+
+
+def _fake_quote(symbol):
+    return {'symbol': symbol, 'name': f'{symbol} Ltd', 'price': 100.0, 'change': 1.0,
+            'change_percent': 1.0, 'fetched_at': time.time()}
+
+
+def _worker(backend, path, symbols, requests, page_size, seed, queue):
+    """
+    Simulates one web worker rendering pages that each look up a page's
+    worth of symbols, fetching (and caching) whatever misses.
+    """
+    cache = _make_cache(backend, path)
+    rng = random.Random(seed)
+    # Popular symbols are requested far more often than the long tail.
+    weights = [1 / (rank + 1) for rank in range(len(symbols))]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    lookups = misses = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        page = set(rng.choices(symbols, weights=weights, k=page_size))
+        keys = [f'stock_data_{sym}' for sym in page]
+        found = cache.get_many(keys)
+        lookups += len(keys)
+        missing = [key for key in keys if key not in found]
+        misses += len(missing)
+        if missing:
+            cache.set_many({key: _fake_quote(key) for key in missing})
+    elapsed = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # LocMemCache keeps pickled values in a private dict per worker; the
+    # SQLite store keeps them once in the shared file.
+    held = sum(len(value) for value in cache._cache.values()) if backend == 'locmem' else 0
+    queue.put((lookups, misses, elapsed, rss_after - rss_before, held))
+
+
+class Command(BaseCommand):
+    help = 'Compare per-worker LocMemCache with the shared SQLite quote cache across worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--symbols', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=2000, help='Page renders per worker')
+        parser.add_argument('--page-size', type=int, default=25, help='Symbols looked up per page')
+
+    def handle(self, *args, **options):
+        symbols = [f'SYM{i}.NS' for i in range(options['symbols'])]
+        for backend in ('locmem', 'sqlite'):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'quotes.sqlite3')
+                self.run_backend(backend, path, symbols, options)
+
+    def run_backend(self, backend, path, symbols, options):
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        procs = [
+            ctx.Process(target=_worker, args=(backend, path, symbols, options['requests'],
+                                              options['page_size'], seed, queue))
+            for seed in range(options['workers'])
+        ]
+        started = time.perf_counter()
+        for proc in procs:
+            proc.start()
+        stats = [queue.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+        wall = time.perf_counter() - started
+
+        lookups = sum(s[0] for s in stats)
+        misses = sum(s[1] for s in stats)
+        rss_kb = sum(s[3] for s in stats)
+        held = sum(s[4] for s in stats)
+        if os.path.exists(path):
+            held += os.path.getsize(path)
+        self.stdout.write(
+            f"{backend:>7}: hit rate {100 * (1 - misses / lookups):6.2f}%  "
+            f"upstream fetches {misses:>7}  lookups/s {lookups / wall:>10.0f}  "
+            f"quote data held {held / 2 ** 20:6.1f} MiB  "
+            f"worker RSS growth {rss_kb / 1024:6.1f} MiB (includes shared mapped pages)"
+        )
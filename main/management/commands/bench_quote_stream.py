@@ -0,0 +1,129 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from main import streaming
+from main.models import Profile, Stock, Watchlist
+
+
+class Command(BaseCommand):
+    help = ('Open thousands of concurrent /stream/quotes/ connections through the ASGI application '
+            'against the simulated provider and report fan-out throughput and delivery lag')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--symbols', type=int, default=200)
+        parser.add_argument('--per-user', type=int, default=10, help='Watched symbols per user')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to stream for')
+        parser.add_argument('--interval', type=float, default=1.0, help='Hub poll interval')
+        parser.add_argument('--slow', type=float, default=0.1,
+                            help='Fraction of clients that read with a delay (to show coalescing)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(MARKET_DATA_PROVIDER='main.providers.SimulatedProvider',
+                                   MARKET_DATA_PROVIDER_OPTIONS={'seed': options['seed'], 'tick_seconds': 0.2},
+                                   QUOTE_STREAM_INTERVAL=options['interval'],
+                                   QUOTE_CACHE_ONLY=False,
+                                   ALLOWED_HOSTS=['testserver']):
+                cookies = self.seed(options)
+                asyncio.run(self.run(cookies, options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        stocks = Stock.objects.bulk_create([Stock(symbol=f'LIVE{i:04d}.NS', name=f'Live {i}')
+                                            for i in range(options['symbols'])])
+        cookies = []
+        for i in range(options['users']):
+            user = User.objects.create_user(username=f'stream-{i}')
+            Profile.objects.create(user=user)
+            Watchlist.objects.bulk_create([Watchlist(user=user, stock=stock)
+                                           for stock in rng.sample(stocks, options['per_user'])])
+            session = SessionStore()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.create()
+            cookies.append(f'{settings.SESSION_COOKIE_NAME}={session.session_key}'.encode())
+        return cookies
+
+    async def run(self, cookies, options):
+        app = get_asgi_application()
+        rng = random.Random(options['seed'])
+        stop = asyncio.Event()
+        stats = {'connected': 0, 'events': 0, 'quotes': 0, 'lags': [], 'connect': []}
+
+        async def client(cookie, slow):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': '/stream/quotes/', 'raw_path': b'/stream/quotes/',
+                'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+                'headers': [(b'host', b'testserver'), (b'cookie', cookie), (b'accept', b'text/event-stream')],
+            }
+            started = time.monotonic()
+            sent = False
+
+            async def receive():
+                nonlocal sent
+                if not sent:
+                    sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await stop.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    if message['status'] == 200:
+                        stats['connected'] += 1
+                        stats['connect'].append(time.monotonic() - started)
+                    return
+                body = message.get('body', b'')
+                if body.startswith(b'event: quotes'):
+                    now = time.time()
+                    data = json.loads(body.split(b'data: ', 1)[1])
+                    stats['events'] += 1
+                    stats['quotes'] += len(data)
+                    stats['lags'].extend(now - fetched_at for _, _, fetched_at in data.values() if fetched_at)
+                if slow:
+                    await asyncio.sleep(options['interval'] * 3)
+
+            await app(scope, receive, send)
+
+        tasks = [asyncio.create_task(client(cookies[i % len(cookies)], rng.random() < options['slow']))
+                 for i in range(options['clients'])]
+        started = time.monotonic()
+        await asyncio.sleep(options['duration'])
+        elapsed = time.monotonic() - started
+        hub = streaming.get_hub()
+        polls, coalesced = hub.polls, sum(sub.coalesced for subs in hub.subscribers.values() for sub in subs)
+        subscribed = len(hub.subscribers)
+        stop.set()
+        await asyncio.wait(tasks, timeout=30)
+
+        lags = sorted(stats['lags']) or [0.0]
+        connects = sorted(stats['connect']) or [0.0]
+        self.stdout.write(f"{stats['connected']}/{options['clients']} clients connected "
+                          f"(p50 {statistics.median(connects) * 1000:.0f}ms, max {connects[-1] * 1000:.0f}ms)")
+        self.stdout.write(f"{subscribed} symbols polled {polls} times in {elapsed:.1f}s "
+                          f"(one batched fetch per poll, shared by every client)")
+        self.stdout.write(f"{stats['events']} events / {stats['quotes']} quotes delivered = "
+                          f"{stats['quotes'] / elapsed:.0f} quotes/s; lag since fetch p50 "
+                          f"{lags[len(lags) // 2] * 1000:.0f}ms, p99 {lags[int(len(lags) * 0.99)] * 1000:.0f}ms")
+        self.stdout.write(f"{coalesced} updates coalesced for slow readers instead of queued")
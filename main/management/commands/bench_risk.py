@@ -0,0 +1,87 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from main import fragments, risk
+from main.models import Portfolio, PriceBar, Stock
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database with daily bars for a portfolio and its benchmarks and time the '
+            'risk metrics cold, with cached closes, fully cached and as the bare matrix computation')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--holdings', type=int, default=50)
+        parser.add_argument('--years', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                       'LOCATION': 'bench-risk'}},
+                                   RISK_LOOKBACK_DAYS=options['years'] * 365 + 7):
+                user, days = self.seed(options)
+                holdings = list(Portfolio.objects.filter(user=user).select_related('stock'))
+                self.stdout.write(f"{len(holdings)} holdings x {days} trading days")
+
+                cold = self.best(lambda: (cache.clear(), risk.portfolio_risk(user, holdings)), options['repeat'])
+
+                def closes_cached():
+                    # A new portfolio version misses the result but not the closes.
+                    fragments.invalidate_users([user.id])
+                    risk.portfolio_risk(user, holdings)
+                warm = self.best(closes_cached, options['repeat'])
+                cached = self.best(lambda: risk.portfolio_risk(user, holdings), options['repeat'])
+
+                rng = np.random.default_rng(options['seed'])
+                prices = 100 * np.cumprod(1 + rng.normal(0.0004, 0.015, (days, options['holdings'])), axis=0)
+                indices = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, (days, 2)), axis=0)
+                weights = np.full(options['holdings'], 1 / options['holdings'])
+                bare = self.best(lambda: risk.compute(prices, weights, indices), options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for label, seconds in (('cold (query + compute)', cold), ('closes cached', warm),
+                               ('result cached', cached), ('compute() only', bare)):
+            self.stdout.write(f"{label:<24}{seconds * 1000:9.2f}ms")
+
+    def seed(self, options):
+        rng = np.random.default_rng(options['seed'])
+        days = options['years'] * 252
+        start = datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        calendar = [start - timedelta(days=int(d)) for d in np.arange(days)[::-1] * 7 // 5]
+        symbols = [f'RISK{i:03d}.NS' for i in range(options['holdings'])] + list(risk.BENCHMARKS.values())
+        benchmarks = set(risk.BENCHMARKS.values())
+        stocks = Stock.objects.bulk_create([Stock(symbol=sym, name=sym, is_active=sym not in benchmarks)
+                                            for sym in symbols])
+        returns = rng.normal(0.0004, 0.015, (days, len(stocks)))
+        closes = 100 * np.cumprod(1 + returns, axis=0)
+        for col, stock in enumerate(stocks):
+            PriceBar.objects.bulk_create([
+                PriceBar(stock=stock, interval='1d', timestamp=ts, open=c, high=c, low=c, close=c)
+                for ts, c in zip(calendar, closes[:, col].tolist())
+            ], batch_size=5000)
+        user = User.objects.create_user(username='risk-bench')
+        Portfolio.objects.bulk_create([Portfolio(user=user, stock=s, quantity=int(rng.integers(1, 100)),
+                                                 avg_price=Decimal('100.00'))
+                                       for s in stocks[:options['holdings']]])
+        return user, days
+
+    @staticmethod
+    def best(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,79 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from main import projection
+from main.models import PriceBar, Stock
+
+SYMBOL = 'SIPBENCH.NS'
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database with daily bars for one instrument and time SIP projections '
+            'cold, with cached closes and memoized, for each frequency and horizon')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, nargs='+', default=[10, 30], help='Horizons to project')
+        parser.add_argument('--history', type=int, default=10, help='Years of daily bars to bootstrap from')
+        parser.add_argument('--paths', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                       'LOCATION': 'bench-sip-projection'}},
+                                   SIP_PROJECTION_PATHS=options['paths'],
+                                   SIP_PROJECTION_LOOKBACK_DAYS=options['history'] * 365 + 7):
+                days = self.seed(options)
+                self.stdout.write(f"{options['paths']} paths bootstrapped from {days} daily bars")
+                self.stdout.write(f"{'frequency':<10}{'years':>6}{'cold ms':>10}{'closes cached':>15}{'memoized':>10}")
+                for frequency in projection.PERIODS:
+                    for years in options['years']:
+                        self.report(frequency, years, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def report(self, frequency, years, repeat):
+        def cold():
+            cache.clear()
+            projection.project(SYMBOL, 5000, frequency, years)
+
+        def simulated():
+            # Drops the memoized bands but keeps the day's closes.
+            cache.delete(projection._key(SYMBOL, frequency, years, timezone.localdate()))
+            projection.project(SYMBOL, 5000, frequency, years)
+
+        timings = [self.best(cold, repeat), self.best(simulated, repeat),
+                   self.best(lambda: projection.project(SYMBOL, 7500, frequency, years), repeat)]
+        self.stdout.write(f"{frequency:<10}{years:>6}{timings[0] * 1000:>10.1f}{timings[1] * 1000:>15.1f}"
+                          f"{timings[2] * 1000:>10.2f}")
+
+    def seed(self, options):
+        rng = np.random.default_rng(options['seed'])
+        days = options['history'] * 252
+        start = datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        closes = 100 * np.cumprod(1 + rng.normal(0.0005, 0.015, days))
+        stock = Stock.objects.create(symbol=SYMBOL, name=SYMBOL)
+        PriceBar.objects.bulk_create([
+            PriceBar(stock=stock, interval='1d', timestamp=start - timedelta(days=int(d)), open=c, high=c, low=c, close=c)
+            for d, c in zip(np.arange(days)[::-1] * 7 // 5, closes.tolist())
+        ], batch_size=5000)
+        return days
+
+    @staticmethod
+    def best(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
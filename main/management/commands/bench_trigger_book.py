@@ -0,0 +1,74 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.trigger_book import TriggerBook
+
+
+class Command(BaseCommand):
+    help = 'Benchmark TriggerBook price-update matching against a linear scan of pending orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--symbols', type=int, default=1_000)
+        parser.add_argument('--updates', type=int, default=20_000, help='Price updates to replay')
+        parser.add_argument('--scan-updates', type=int, default=200,
+                            help='Updates to replay through the linear scan (it is slow)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        symbols = [f'SYM{i:04d}.NS' for i in range(options['symbols'])]
+        prices = {sym: 100.0 for sym in symbols}
+        orders = [(order_id, rng.choice(symbols), round(rng.uniform(80, 120), 2), rng.random() < 0.5)
+                  for order_id in range(1, options['orders'] + 1)]
+        ticks = []
+        for _ in range(options['updates']):
+            sym = rng.choice(symbols)
+            prices[sym] = max(1.0, prices[sym] * (1 + rng.gauss(0, 0.01)))
+            ticks.append((sym, prices[sym]))
+
+        started = time.perf_counter()
+        book = TriggerBook()
+        for order_id, sym, trigger, fires_on_fall in orders:
+            book.add(order_id, sym, trigger, fires_on_fall)
+        build = time.perf_counter() - started
+
+        # Time the ticks the linear scan also replays separately, so the two
+        # are compared on the same updates.
+        split = options['scan_updates']
+        started = time.perf_counter()
+        book_hits = [book.crossed(sym, price) for sym, price in ticks[:split]]
+        head_time = time.perf_counter() - started
+        book_hits += [book.crossed(sym, price) for sym, price in ticks[split:]]
+        book_time = time.perf_counter() - started
+
+        # The naive alternative: every update scans all open orders.
+        resting = list(orders)
+        scan_ticks = ticks[:split]
+        started = time.perf_counter()
+        scan_hits = []
+        for sym, price in scan_ticks:
+            hit = [o[0] for o in resting
+                   if o[1] == sym and (o[2] >= price if o[3] else o[2] <= price)]
+            if hit:
+                done = set(hit)
+                resting = [o for o in resting if o[0] not in done]
+            scan_hits.append(hit)
+        scan_time = time.perf_counter() - started
+
+        mismatches = sum(sorted(a) != sorted(b) for a, b in zip(book_hits, scan_hits))
+        per_book = book_time / len(ticks) * 1e6 if ticks else 0.0
+        per_scan = scan_time / len(scan_ticks) * 1e6 if scan_ticks else 0.0
+        per_head = head_time / len(scan_ticks) * 1e6 if scan_ticks else 0.0
+        self.stdout.write(f"{len(orders)} orders over {len(symbols)} symbols, built in {build:.2f}s")
+        self.stdout.write(f"TriggerBook: {len(ticks)} updates, {sum(map(len, book_hits))} fills, "
+                          f"{per_book:.1f}us/update, {len(book)} resting")
+        self.stdout.write(f"Linear scan: {len(scan_ticks)} updates, {per_scan:.1f}us/update vs "
+                          f"{per_head:.1f}us/update for the book on the same updates "
+                          f"({per_scan / per_head if per_head else 0:.1f}x slower)")
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"{mismatches} updates matched different orders"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Both matchers agree"))
@@ -0,0 +1,24 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from main.nav import build_all_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Bring every user\'s daily NAV snapshots up to date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users per batch')
+        parser.add_argument('--until', type=date.fromisoformat, default=None,
+                            help='Last date to snapshot (YYYY-MM-DD, default today)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        users = written = 0
+        for users, written in build_all_snapshots(options['chunk_size'], options['until']):
+            self.stdout.write(f"{users} users, {written} snapshots")
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {written} snapshots for {users} users in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from main.models import Stock, Portfolio, Watchlist, PriceBar
+from main.providers import get_provider, INTERVAL_SECONDS
+from main.risk import BENCHMARKS
+from main.utils import MARKET_SYMBOLS, POPULAR_SYMBOLS
+
+
+class Command(BaseCommand):
+    help = 'Backfill OHLCV price bars from the market-data provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*',
+                            help='Symbols to ingest (default: every held, watched and dashboard symbol '
+                                 'and the risk benchmarks)')
+        parser.add_argument('--all-stocks', action='store_true', help='Ingest every Stock row')
+        parser.add_argument('--interval', default='1d', choices=sorted(INTERVAL_SECONDS))
+        parser.add_argument('--days', type=int, default=5 * 365, help='How far back to backfill')
+        parser.add_argument('--symbols-per-request', type=int, default=20)
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        symbols = self.target_symbols(options)
+        if not symbols:
+            raise CommandError("No symbols to ingest")
+
+        # Benchmark indices get bars for the risk metrics but are not
+        # listed, searchable or tradable instruments.
+        benchmarks = set(BENCHMARKS.values())
+        Stock.objects.bulk_create([Stock(symbol=sym, name=sym, is_active=sym not in benchmarks) for sym in symbols],
+                                  ignore_conflicts=True)
+        Stock.objects.filter(symbol__in=benchmarks.intersection(symbols), is_active=True).update(is_active=False)
+        stock_ids = dict(Stock.objects.filter(symbol__in=symbols).values_list('symbol', 'id'))
+
+        end = timezone.now()
+        start = end - timedelta(days=options['days'])
+        provider = get_provider()
+        # MySQL upserts on any unique key and rejects an explicit target.
+        conflict_target = (['stock', 'interval', 'timestamp']
+                           if connection.features.supports_update_conflicts_with_target else None)
+        per_request = options['symbols_per_request']
+        fetch_time = write_time = 0.0
+        total = 0
+        for i in range(0, len(symbols), per_request):
+            batch = symbols[i:i + per_request]
+            started = time.monotonic()
+            history = provider.get_history(batch, start, end, options['interval'])
+            fetch_time += time.monotonic() - started
+
+            started = time.monotonic()
+            rows = [
+                PriceBar(stock_id=stock_ids[sym], interval=options['interval'], timestamp=ts,
+                         open=o, high=h, low=l, close=c, volume=v)
+                for sym, bars in history.items()
+                for ts, o, h, l, c, v in bars
+            ]
+            # Re-ingesting a range overwrites bars in place (e.g. today's
+            # still-forming daily bar).
+            PriceBar.objects.bulk_create(
+                rows, batch_size=options['chunk_size'],
+                update_conflicts=True, unique_fields=conflict_target,
+                update_fields=['open', 'high', 'low', 'close', 'volume'],
+            )
+            write_time += time.monotonic() - started
+            total += len(rows)
+            self.stdout.write(f"{min(i + per_request, len(symbols))}/{len(symbols)} symbols, {total} bars")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {total} {options['interval']} bars for {len(symbols)} symbols "
+            f"(fetch {fetch_time:.1f}s, write {write_time:.1f}s)"
+        ))
+
+    def target_symbols(self, options):
+        if options['symbols']:
+            return list(dict.fromkeys(sym.upper() for sym in options['symbols']))
+        if options['all_stocks']:
+            return list(Stock.objects.order_by('symbol').values_list('symbol', flat=True))
+        symbols = set(MARKET_SYMBOLS + POPULAR_SYMBOLS + list(BENCHMARKS.values()))
+        symbols.update(Portfolio.objects.values_list('stock__symbol', flat=True))
+        symbols.update(Watchlist.objects.values_list('stock__symbol', flat=True))
+        return sorted(symbols)
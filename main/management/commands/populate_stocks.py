@@ -1,27 +1,43 @@
+import time
+
 from django.core.management.base import BaseCommand
-from main.models import Stock
-from decimal import Decimal
+from django.db import transaction
+
+from main.universe import DEFAULT_UNIVERSE, UniverseLoader
+
 
 class Command(BaseCommand):
-    help = 'Populate initial stock data'
+    help = ('Load the instrument universe from exchange dumps (NSE EQUITY_L.csv, BSE equity list, '
+            'nasdaqlisted.txt), upserting in chunks and deactivating delisted instruments. '
+            'With no files, seeds the default symbols the app suggests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nse', action='append', default=[], metavar='PATH')
+        parser.add_argument('--bse', action='append', default=[], metavar='PATH')
+        parser.add_argument('--nasdaq', action='append', default=[], metavar='PATH')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--keep-missing', action='store_true',
+                            help="Don't deactivate instruments the files no longer list")
+
+    def handle(self, *args, **options):
+        sources = [(exchange, path) for exchange in ('NSE', 'BSE', 'NASDAQ')
+                   for path in options[exchange.lower()]]
+        loader = UniverseLoader(chunk_size=options['chunk_size'])
+        started = time.perf_counter()
+        with transaction.atomic():
+            if sources:
+                for exchange, path in sources:
+                    loader.load_file(exchange, path)
+            else:
+                for exchange in ('NSE', 'NASDAQ'):
+                    loader.load(exchange, [(symbol, name, isin, currency, True)
+                                           for symbol, name, ex, isin, currency in DEFAULT_UNIVERSE
+                                           if ex == exchange])
+            # The default seed is not a full listing, so it never deactivates.
+            loader.finish(deactivate=bool(sources) and not options['keep_missing'])
+        total = time.perf_counter() - started
 
-    def handle(self, *args, **kwargs):
-        stocks = [
-            {'symbol': 'RELIANCE', 'company_name': 'Reliance Industries Ltd', 'price': 2540.35},
-            {'symbol': 'TCS', 'company_name': 'Tata Consultancy Services', 'price': 3420.10},
-            {'symbol': 'HDFCBANK', 'company_name': 'HDFC Bank Ltd', 'price': 1650.00},
-            {'symbol': 'INFY', 'company_name': 'Infosys Ltd', 'price': 1480.50},
-            {'symbol': 'ICICIBANK', 'company_name': 'ICICI Bank Ltd', 'price': 940.25},
-            {'symbol': 'AAPL', 'company_name': 'Apple Inc.', 'price': 15600.00},
-            {'symbol': 'TSLA', 'company_name': 'Tesla Inc.', 'price': 21000.00},
-            {'symbol': 'AMZN', 'company_name': 'Amazon.com Inc.', 'price': 12500.00},
-        ]
-        
-        for s in stocks:
-            Stock.objects.update_or_create(
-                symbol=s['symbol'],
-                defaults={
-                    'name': s['company_name'],
-                }
-            )
-        self.stdout.write(self.style.SUCCESS('Successfully populated stock data'))
+        phases = ', '.join(f"{phase} {seconds:.2f}s" for phase, seconds in loader.timings.items())
+        self.stdout.write(f"{phases}, total {total:.2f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Upserted {loader.upserted} instruments, deactivated {loader.deactivated}"))
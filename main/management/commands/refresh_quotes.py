@@ -0,0 +1,93 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Count
+
+from main import metrics
+from main.models import Stock, Portfolio, Watchlist, PendingOrder
+from main.orders import settle_pending
+from main.trigger_book import TriggerBook
+from main.utils import refresh_quotes, get_cached_quotes, MARKET_SYMBOLS, POPULAR_SYMBOLS
+
+
+class Command(BaseCommand):
+    help = 'Keep the quote cache warm by refreshing every held or watched symbol on a schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'QUOTE_REFRESH_INTERVAL', 60),
+                            help='Seconds between refresh cycles')
+        parser.add_argument('--chunk-size', type=int, default=50,
+                            help='Symbols per upstream request')
+        parser.add_argument('--once', action='store_true', help='Run a single cycle and exit')
+
+    def handle(self, *args, **options):
+        self.book = TriggerBook()
+        while True:
+            started = time.monotonic()
+            self.refresh_cycle(options['chunk_size'])
+            if options['once']:
+                return
+            close_old_connections()
+            time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
+
+    def prioritized_symbols(self):
+        """
+        Orders symbols by how many users hold or watch them or have orders
+        resting on them. The market overview and popular lists are shown to
+        every user, so they rank as if everyone held them.
+        """
+        audience = Counter()
+        for symbol, users in (PendingOrder.objects.filter(status='OPEN')
+                              .values_list('stock__symbol').annotate(users=Count('user', distinct=True))):
+            audience[symbol] += users
+        for symbol, users in (Portfolio.objects.filter(quantity__gt=0)
+                              .values_list('stock__symbol').annotate(users=Count('user'))):
+            audience[symbol] += users
+        for symbol, users in Watchlist.objects.values_list('stock__symbol').annotate(users=Count('user')):
+            audience[symbol] += users
+        everyone = User.objects.count()
+        for symbol in MARKET_SYMBOLS + POPULAR_SYMBOLS:
+            audience[symbol] += everyone
+        return [symbol for symbol, _ in audience.most_common()]
+
+    def refresh_cycle(self, chunk_size):
+        self.book.sync()
+        symbols = self.prioritized_symbols()
+        names = dict(Stock.objects.filter(symbol__in=symbols).values_list('symbol', 'name'))
+
+        # Lag is how old each quote was when this cycle got to it.
+        now = time.time()
+        previous = get_cached_quotes(symbols)
+        lags = sorted(now - data['fetched_at'] for data in previous.values() if 'fetched_at' in data)
+
+        started = time.monotonic()
+        refreshed = filled = rejected = 0
+        for i in range(0, len(symbols), chunk_size):
+            quotes = refresh_quotes(symbols[i:i + chunk_size], names)
+            refreshed += len(quotes)
+            triggered = self.book.on_quotes(quotes)
+            if triggered:
+                try:
+                    done = settle_pending(triggered, {sym: data['price'] for sym, data in quotes.items()})
+                finally:
+                    # Anything still open missed settlement and must keep resting.
+                    self.book.restore(triggered)
+                filled += done[0]
+                rejected += done[1]
+        elapsed = time.monotonic() - started
+
+        metrics.incr('quote_refresh_cycles')
+        metrics.incr('quote_refresh_symbols', refreshed)
+        metrics.incr('pending_orders_filled', filled)
+        metrics.incr('pending_orders_rejected', rejected)
+        max_lag = lags[-1] if lags else 0.0
+        p50_lag = lags[len(lags) // 2] if lags else 0.0
+        self.stdout.write(
+            f"Refreshed {refreshed}/{len(symbols)} symbols in {elapsed:.2f}s "
+            f"(lag p50 {p50_lag:.1f}s, max {max_lag:.1f}s, {len(symbols) - len(previous)} never cached); "
+            f"{filled} orders filled, {rejected} rejected, {len(self.book)} resting"
+        )
@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from main.models import Portfolio, Profile, Stock, Transaction
+from main.orders import OrderError, execute_buy, execute_sell
+
+STARTING_BALANCE = Decimal('100000.00')
+
+
+def run_stress(users=5, orders=500, threads=32, stocks=3, seed=0):
+    """
+    Fires `orders` random buys and sells from `threads` threads at a handful
+    of accounts, so most orders contend for the same Profile and Portfolio
+    rows, then checks the ledger invariants. Returns a stats dict; the
+    'violations' list is empty when the ledger is consistent.
+    """
+    accounts = []
+    for i in range(users):
+        user = User.objects.create_user(username=f'stress-{seed}-{i}')
+        Profile.objects.create(user=user, balance=STARTING_BALANCE)
+        accounts.append(user)
+    instruments = [Stock.objects.get_or_create(symbol=f'STRESS{i}.NS', defaults={'name': f'Stress {i}'})[0]
+                   for i in range(stocks)]
+
+    rng = random.Random(seed)
+    plan = [(rng.choice(accounts), rng.choice(instruments), rng.choice(('BUY', 'SELL')),
+             rng.randint(1, 5), Decimal(rng.randint(50, 150))) for _ in range(orders)]
+    filled = defaultdict(int)
+    errors = []
+    lock = threading.Lock()
+    cursor = iter(plan)
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    order = next(cursor, None)
+                if order is None:
+                    return
+                user, stock, side, quantity, price = order
+                try:
+                    (execute_buy if side == 'BUY' else execute_sell)(user, stock, quantity, price)
+                    outcome = 'filled'
+                except OrderError:
+                    outcome = 'rejected'
+                except Exception as e:
+                    errors.append(repr(e))
+                    outcome = 'error'
+                with lock:
+                    filled[outcome] += 1
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'orders': orders,
+        'filled': filled['filled'],
+        'rejected': filled['rejected'],
+        'errors': errors,
+        'seconds': elapsed,
+        'orders_per_second': orders / elapsed if elapsed else 0.0,
+        'violations': check_ledger(accounts),
+    }
+
+
+def check_ledger(users):
+    """
+    Verifies, per account, that the balance and every holding agree with
+    the Transaction ledger and that nothing went negative.
+    """
+    violations = []
+    for user in users:
+        balance = Profile.objects.get(user=user).balance
+        expected_balance = STARTING_BALANCE
+        expected_qty = defaultdict(int)
+        for tx in Transaction.objects.filter(user=user).order_by('id'):
+            amount = tx.price * tx.quantity
+            if tx.transaction_type == 'BUY':
+                expected_balance -= amount
+                expected_qty[tx.stock_id] += tx.quantity
+            else:
+                expected_balance += amount
+                expected_qty[tx.stock_id] -= tx.quantity
+        if balance != expected_balance or balance < 0:
+            violations.append(f"{user.username}: balance {balance}, ledger says {expected_balance}")
+        held = dict(Portfolio.objects.filter(user=user).values_list('stock_id', 'quantity'))
+        for stock_id in set(held) | set(expected_qty):
+            if held.get(stock_id, 0) != expected_qty[stock_id] or expected_qty[stock_id] < 0:
+                violations.append(f"{user.username}: stock {stock_id} holds {held.get(stock_id, 0)}, "
+                                  f"ledger says {expected_qty[stock_id]}")
+    return violations
+
+
+class Command(BaseCommand):
+    help = ('Stress the order execution path with concurrent buys and sells on a throwaway '
+            'test database and check ledger invariants')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--stocks', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError("SQLite serialises writers and has no row locks; run this against MySQL or PostgreSQL.")
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            stats = run_stress(options['users'], options['orders'], options['threads'],
+                               options['stocks'], options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f"{stats['orders']} orders ({stats['filled']} filled, {stats['rejected']} rejected, "
+            f"{len(stats['errors'])} errors) in {stats['seconds']:.2f}s = "
+            f"{stats['orders_per_second']:.0f} orders/s"
+        )
+        for problem in stats['errors'][:10] + stats['violations']:
+            self.stdout.write(self.style.ERROR(problem))
+        if stats['errors'] or stats['violations']:
+            raise CommandError("Ledger invariants violated")
+        self.stdout.write(self.style.SUCCESS("Ledger invariants hold"))
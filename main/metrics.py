@@ -0,0 +1,284 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_histograms = {}
+
+# Upper bounds of the histogram buckets, Prometheus style; +Inf is implied.
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNTS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Worker snapshots are found through a fixed set of slot keys, each owning
+# worker's id claimed with cache.add, so no shared registry is rewritten.
+_worker = None
+_slot = None
+_published = 0.0
+_publish_lock = threading.Lock()
+
+_request = contextvars.ContextVar('request_stats', default=None)
+
+logger = logging.getLogger(__name__)
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def incr(name, value=1, **labels):
+    """
+    Increments an in-process counter, e.g. quote fetch timeouts or fallbacks.
+    """
+    with _lock:
+        _counters[name, _labels(labels)] += value
+
+
+def observe(name, value, buckets=SECONDS, **labels):
+    """
+    Records one observation in an in-process histogram.
+    """
+    key = (name, _labels(labels))
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+        entry[1][bisect_left(buckets, value)] += 1
+        entry[2] += value
+
+
+def snapshot():
+    """
+    Returns a copy of the current unlabelled counter values.
+    """
+    with _lock:
+        return {name: value for (name, labels), value in _counters.items() if not labels}
+
+
+def export():
+    """
+    This process's full state: counters and histograms keyed by
+    (name, labels), in a form that pickles into the cache.
+    """
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'histograms': {key: (b, list(counts), total) for key, (b, counts, total) in _histograms.items()},
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class RequestStats:
+    """
+    What one request spent its time on. The middleware installs it for the
+    duration of the request; the hooks below add to it from the request's
+    own context (including pool threads it waits on, which run a copy).
+    """
+    __slots__ = ('queries', 'db_time', 'upstream_calls', 'upstream_time', 'cache_hits', 'cache_misses',
+                 'render_time', 'sql', '_lock')
+
+    def __init__(self, keep_sql=False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.upstream_calls = 0
+        self.upstream_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.render_time = 0.0
+        self.sql = [] if keep_sql else None
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        connection.execute_wrapper hook timing each query.
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.sql is not None:
+                self.sql.append((elapsed, sql))
+
+    def top_queries(self, n=5):
+        return sorted(self.sql or (), reverse=True)[:n]
+
+
+def start_request(stats):
+    return _request.set(stats)
+
+
+def end_request(token):
+    _request.reset(token)
+
+
+def record_upstream(call, seconds):
+    """
+    One market-data provider round trip.
+    """
+    observe('upstream_fetch_seconds', seconds, call=call)
+    stats = _request.get()
+    if stats is not None:
+        with stats._lock:
+            stats.upstream_calls += 1
+            stats.upstream_time += seconds
+
+
+def record_cache(hits, misses):
+    """
+    Quote cache lookups made while serving the current request.
+    """
+    stats = _request.get()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def record_render(seconds):
+    stats = _request.get()
+    if stats is not None:
+        stats.render_time += seconds
+
+
+def record_request(view, status, seconds, stats):
+    observe('request_duration_seconds', seconds, view=view)
+    observe('request_db_queries', stats.queries, COUNTS, view=view)
+    observe('request_db_seconds', stats.db_time, view=view)
+    observe('request_upstream_seconds', stats.upstream_time, view=view)
+    observe('request_render_seconds', stats.render_time, view=view)
+    with _lock:
+        _counters['responses', (('status', str(status)), ('view', view))] += 1
+        _counters['upstream_calls', (('view', view),)] += stats.upstream_calls
+        _counters['quote_cache_hits', (('view', view),)] += stats.cache_hits
+        _counters['quote_cache_misses', (('view', view),)] += stats.cache_misses
+
+
+def _slot_key(slot):
+    return f'metrics:slot:{slot}'
+
+
+def _snapshot_key(worker):
+    return f'metrics:worker:{worker}'
+
+
+def worker_id():
+    """
+    This process's id, taken on first use so each process forked from a
+    preloaded parent gets its own.
+    """
+    global _worker, _slot, _published
+    pid = os.getpid()
+    if _worker is None or not _worker.startswith(f'{pid}-'):
+        _worker, _slot, _published = f'{pid}-{time.time_ns()}', None, 0.0
+    return _worker
+
+
+def _claim_slot(worker, ttl):
+    """
+    The slot this worker is listed under: its current one while it still
+    holds it, otherwise the first free one. None when every slot is taken.
+    """
+    global _slot
+    if _slot is not None and cache.get(_slot_key(_slot)) == worker:
+        cache.touch(_slot_key(_slot), ttl)
+        return _slot
+    _slot = None
+    for slot in range(getattr(settings, 'METRICS_WORKER_SLOTS', 64)):
+        if cache.add(_slot_key(slot), worker, ttl):
+            _slot = slot
+            break
+    return _slot
+
+
+def publish(force=False):
+    """
+    Copies this process's metrics into the shared cache, at most every
+    METRICS_PUBLISH_INTERVAL seconds, so any worker can report for all.
+    """
+    global _published
+    worker = worker_id()
+    now = time.monotonic()
+    if not force and now - _published < getattr(settings, 'METRICS_PUBLISH_INTERVAL', 10):
+        return
+    if not _publish_lock.acquire(blocking=False):
+        return
+    try:
+        _published = now
+        ttl = getattr(settings, 'METRICS_WORKER_TTL', 3600)
+        if _claim_slot(worker, ttl) is None:
+            logger.warning("No free metrics slot for worker %s; raise METRICS_WORKER_SLOTS", worker)
+            return
+        cache.set(_snapshot_key(worker), export(), ttl)
+    finally:
+        _publish_lock.release()
+
+
+def collect():
+    """
+    Metrics summed over every worker that published recently. A worker
+    that stops publishing drops out when its slot and snapshot expire.
+    """
+    publish(force=True)
+    slots = cache.get_many([_slot_key(slot) for slot in range(getattr(settings, 'METRICS_WORKER_SLOTS', 64))])
+    snapshots = cache.get_many([_snapshot_key(worker) for worker in set(slots.values())])
+
+    counters = defaultdict(int)
+    histograms = {}
+    for snap in snapshots.values():
+        for key, value in snap['counters'].items():
+            counters[key] += value
+        for key, (buckets, counts, total) in snap['histograms'].items():
+            merged = histograms.setdefault(key, [buckets, [0] * len(counts), 0.0])
+            merged[1] = [a + b for a, b in zip(merged[1], counts)]
+            merged[2] += total
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+
+def render_prometheus(counters, histograms, prefix='tradex_'):
+    """
+    Prometheus text exposition (version 0.0.4) of collected metrics.
+    """
+    lines = []
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for name in sorted(by_name):
+        lines.append(f'# TYPE {prefix}{name}_total counter')
+        for labels, value in sorted(by_name[name]):
+            lines.append(f'{prefix}{name}_total{_format_labels(labels)} {value}')
+
+    by_name = defaultdict(list)
+    for (name, labels), entry in histograms.items():
+        by_name[name].append((labels, entry))
+    for name in sorted(by_name):
+        lines.append(f'# TYPE {prefix}{name} histogram')
+        for labels, (buckets, counts, total) in sorted(by_name[name], key=lambda item: item[0]):
+            running = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                running += count
+                lines.append(f'{prefix}{name}_bucket{_format_labels(labels, [("le", bound)])} {running}')
+            lines.append(f'{prefix}{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{prefix}{name}_count{_format_labels(labels)} {running}')
+    return '\n'.join(lines) + '\n'
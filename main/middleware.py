@@ -0,0 +1,56 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records per-view request time, query count and database time, market
+    data round trips, quote cache hits and misses and template render time
+    into the histograms in main.metrics. With SLOW_REQUEST_THRESHOLD set,
+    requests slower than that many seconds are logged as warnings with
+    their slowest queries. Streaming responses are timed up to their first
+    byte.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD', None)
+        stats = metrics.RequestStats(keep_sql=threshold is not None)
+        token = metrics.start_request(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else 'unmatched'
+        metrics.record_request(view, response.status_code, elapsed, stats)
+        if threshold is not None and elapsed >= threshold:
+            self.log_slow(request, view, elapsed, stats)
+        metrics.publish()
+        return response
+
+    @staticmethod
+    def log_slow(request, view, elapsed, stats):
+        queries = ''.join(f"\n    {seconds * 1000:7.1f}ms  {sql[:300]}" for seconds, sql in stats.top_queries())
+        logger.warning(
+            "Slow request: %s %s (%s) took %.0fms: %d queries in %.0fms, %d upstream calls in %.0fms, "
+            "quote cache %d hits/%d misses, render %.0fms%s",
+            request.method, request.path, view, elapsed * 1000, stats.queries, stats.db_time * 1000,
+            stats.upstream_calls, stats.upstream_time * 1000, stats.cache_hits, stats.cache_misses,
+            stats.render_time * 1000, queries)
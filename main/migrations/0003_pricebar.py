@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_profile_full_name_profile_phone_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceBar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1d', 'Daily'), ('1h', 'Hourly'), ('5m', '5 Minutes'), ('1m', '1 Minute')], default='1d', max_length=3)),
+                ('timestamp', models.DateTimeField()),
+                ('open', models.FloatField()),
+                ('high', models.FloatField()),
+                ('low', models.FloatField()),
+                ('close', models.FloatField()),
+                ('volume', models.BigIntegerField(default=0)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bars', to='main.stock')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('stock', 'interval', 'timestamp'), name='unique_price_bar')],
+            },
+        ),
+    ]
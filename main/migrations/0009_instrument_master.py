@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_lots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='currency',
+            field=models.CharField(default='INR', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='exchange',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='isin',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+    ]
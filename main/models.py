@@ -6,6 +6,7 @@ class Profile(models.Model):
     full_name = models.CharField(max_length=100, blank=True)
     phone_number = models.CharField(max_length=15, unique=True, null=True, blank=True)
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=100000.00)
+    realized_pnl = models.DecimalField(max_digits=14, decimal_places=2, default=0)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -13,6 +14,10 @@ class Profile(models.Model):
 class Stock(models.Model):
     symbol = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=100)
+    exchange = models.CharField(max_length=10, blank=True)
+    isin = models.CharField(max_length=12, blank=True, db_index=True)
+    currency = models.CharField(max_length=3, default='INR')
+    is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return f"{self.symbol} - {self.name}"
@@ -40,6 +45,15 @@ class Transaction(models.Model):
     price = models.DecimalField(max_digits=12, decimal_places=2)
     transaction_type = models.CharField(max_length=4, choices=TYPES)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # FIFO gain or loss booked by a SELL; null for buys.
+    realized_pnl = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's history, optionally per stock.
+            models.Index(fields=['user', '-timestamp', '-id'], name='transaction_user_time'),
+            models.Index(fields=['user', 'stock', '-timestamp', '-id'], name='transaction_user_stock_time'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} {self.transaction_type} {self.stock.symbol} @ {self.price}"
@@ -53,3 +67,144 @@ class Watchlist(models.Model):
 
     def __str__(self):
         return f"{self.user.username} watching {self.stock.symbol}"
+
+class PriceBar(models.Model):
+    """
+    One OHLCV bar for a stock. Prices are floats rather than decimals to
+    keep the table compact; they only feed charts and analytics.
+    """
+    INTERVALS = (
+        ('1d', 'Daily'),
+        ('1h', 'Hourly'),
+        ('5m', '5 Minutes'),
+        ('1m', '1 Minute'),
+    )
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='bars')
+    interval = models.CharField(max_length=3, choices=INTERVALS, default='1d')
+    timestamp = models.DateTimeField()
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    close = models.FloatField()
+    volume = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index behind every chart's range scan.
+            models.UniqueConstraint(fields=['stock', 'interval', 'timestamp'], name='unique_price_bar'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock.symbol} {self.interval} {self.timestamp:%Y-%m-%d %H:%M} C={self.close}"
+
+class NavSnapshot(models.Model):
+    """
+    End-of-day value of a user's account: cash balance plus holdings valued
+    at that day's close. Filled by `manage.py build_nav_snapshots`; a new
+    Transaction deletes the user's snapshots from its date forward so the
+    next run recomputes only those days.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='nav_snapshots')
+    date = models.DateField()
+    cash = models.DecimalField(max_digits=14, decimal_places=2)
+    holdings_value = models.DecimalField(max_digits=14, decimal_places=2)
+    nav = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_nav_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} NAV {self.date}: {self.nav}"
+
+class PendingOrder(models.Model):
+    """
+    A limit or stop order waiting for its trigger price. Buy limits and
+    sell stops fire when the price falls to the trigger; sell limits and
+    buy stops when it rises to it. The refresh_quotes worker keeps these
+    in a TriggerBook and settles crossed orders through main.orders.
+    """
+    SIDES = Transaction.TYPES
+    ORDER_TYPES = (
+        ('LIMIT', 'Limit'),
+        ('STOP', 'Stop'),
+    )
+    STATUSES = (
+        ('OPEN', 'Open'),
+        ('FILLED', 'Filled'),
+        ('CANCELLED', 'Cancelled'),
+        ('REJECTED', 'Rejected'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_orders')
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    side = models.CharField(max_length=4, choices=SIDES)
+    order_type = models.CharField(max_length=5, choices=ORDER_TYPES)
+    quantity = models.PositiveIntegerField()
+    trigger_price = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=9, choices=STATUSES, default='OPEN')
+    note = models.CharField(max_length=200, blank=True)
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='pending_order_status'),
+        ]
+
+    @property
+    def fires_on_fall(self):
+        return (self.side == 'BUY') == (self.order_type == 'LIMIT')
+
+    def __str__(self):
+        return f"{self.user.username} {self.side} {self.order_type} {self.stock.symbol} @ {self.trigger_price}"
+
+class SIPPlan(models.Model):
+    """
+    A recurring buy of `amount` worth of whole shares of a stock. The
+    `run_sips` command settles every plan whose next_run_date has come
+    and moves it forward one period, so a plan is never charged twice for
+    the same date.
+    """
+    FREQUENCIES = (
+        ('WEEKLY', 'Weekly'),
+        ('MONTHLY', 'Monthly'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sip_plans')
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    frequency = models.CharField(max_length=7, choices=FREQUENCIES)
+    next_run_date = models.DateField()
+    last_run_date = models.DateField(null=True, blank=True)
+    last_status = models.CharField(max_length=100, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'next_run_date'], name='sip_plan_due'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} SIP {self.stock.symbol} ₹{self.amount} {self.frequency}"
+
+class Lot(models.Model):
+    """
+    Shares from one buy that are still held. Sells consume a user's lots
+    for a stock oldest first and delete the ones they empty, so this table
+    only ever holds open positions.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='lots')
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    cost_price = models.DecimalField(max_digits=12, decimal_places=2)
+    opened_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'stock', 'opened_at', 'id'], name='lot_fifo'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.quantity} {self.stock.symbol} @ {self.cost_price}"
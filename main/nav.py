@@ -0,0 +1,177 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import NavSnapshot, Portfolio, PriceBar, Profile, Transaction
+from .timeseries import CHART_RANGES, DEFAULT_CHART_POINTS, downsample_lttb
+
+CENT = Decimal('0.01')
+
+
+def _cash_flow(transaction_type, quantity, price):
+    amount = quantity * price
+    return -amount if transaction_type == 'BUY' else amount
+
+
+def invalidate_snapshots(user_id, since):
+    """
+    Drops a user's snapshots from `since` onwards; the next build recomputes
+    just those days.
+    """
+    NavSnapshot.objects.filter(user_id=user_id, date__gte=since).delete()
+
+
+def invalidate_snapshots_for(user_ids, since):
+    """
+    invalidate_snapshots for many users in one query, for bulk writers
+    that bypass the Transaction post_save signal.
+    """
+    NavSnapshot.objects.filter(user_id__in=user_ids, date__gte=since).delete()
+
+
+def build_snapshots(user_ids, until=None):
+    """
+    Brings the NAV snapshots of the given users up to `until` (default
+    today), starting the day after each user's latest snapshot. Positions
+    and cash on the day before are recovered by un-applying the user's
+    transactions since then from their current Portfolio and balance, so a
+    run costs O(new transactions + new days), not O(history).
+
+    Returns the number of snapshots written.
+    """
+    until = until or timezone.localdate()
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+
+    last = dict(NavSnapshot.objects.filter(user_id__in=user_ids)
+                .values('user_id').annotate(last=Max('date')).values_list('user_id', 'last'))
+    first_tx = dict(Transaction.objects.filter(user_id__in=user_ids)
+                    .values('user_id').annotate(first=Min('timestamp')).values_list('user_id', 'first'))
+    starts = {}
+    for uid in user_ids:
+        if uid in last:
+            starts[uid] = last[uid] + timedelta(days=1)
+        elif uid in first_tx:
+            starts[uid] = timezone.localdate(first_tx[uid])
+        else:
+            starts[uid] = until
+    starts = {uid: start for uid, start in starts.items() if start <= until}
+    if not starts:
+        return 0
+    earliest = min(starts.values())
+
+    cash = {uid: balance for uid, balance in
+            Profile.objects.filter(user_id__in=starts).values_list('user_id', 'balance')}
+    positions = defaultdict(dict)
+    fallback_price = {}
+    for uid, stock_id, quantity, avg_price in (Portfolio.objects.filter(user_id__in=starts)
+                                               .values_list('user_id', 'stock_id', 'quantity', 'avg_price')):
+        positions[uid][stock_id] = quantity
+        fallback_price.setdefault(stock_id, avg_price)
+
+    # Walk back from today's state to the day before each user's start.
+    recent = defaultdict(lambda: defaultdict(list))
+    for uid, stock_id, tx_type, quantity, price, ts in (
+            Transaction.objects.filter(user_id__in=starts, timestamp__date__gte=earliest)
+            .order_by('timestamp', 'id')
+            .values_list('user_id', 'stock_id', 'transaction_type', 'quantity', 'price', 'timestamp')):
+        day = timezone.localdate(ts)
+        if day < starts[uid]:
+            continue
+        recent[uid][day].append((stock_id, tx_type, quantity, price))
+        signed = quantity if tx_type == 'BUY' else -quantity
+        positions[uid][stock_id] = positions[uid].get(stock_id, 0) - signed
+        cash[uid] = cash.get(uid, Decimal('0.00')) - _cash_flow(tx_type, quantity, price)
+        fallback_price.setdefault(stock_id, price)
+
+    # Daily closes for every stock involved, carried forward across gaps.
+    stock_ids = {sid for held in positions.values() for sid in held}
+    closes = defaultdict(dict)
+    for stock_id, ts, close in (PriceBar.objects
+                                .filter(stock_id__in=stock_ids, interval='1d',
+                                        timestamp__date__gte=earliest - timedelta(days=7),
+                                        timestamp__date__lte=until)
+                                .order_by('timestamp')
+                                .values_list('stock_id', 'timestamp', 'close')):
+        closes[timezone.localdate(ts)][stock_id] = Decimal(str(close))
+
+    last_close = dict(fallback_price)
+    snapshots = []
+    day = earliest - timedelta(days=7)
+    user_state = {uid: dict(positions[uid]) for uid in starts}
+    while day <= until:
+        last_close.update(closes.get(day, {}))
+        for uid, start in starts.items():
+            if day < start:
+                continue
+            held = user_state[uid]
+            for stock_id, tx_type, quantity, price in recent[uid].get(day, ()):
+                signed = quantity if tx_type == 'BUY' else -quantity
+                held[stock_id] = held.get(stock_id, 0) + signed
+                cash[uid] = cash.get(uid, Decimal('0.00')) + _cash_flow(tx_type, quantity, price)
+                last_close.setdefault(stock_id, price)
+            holdings_value = sum(
+                (qty * last_close.get(stock_id, Decimal('0.00')) for stock_id, qty in held.items() if qty),
+                Decimal('0.00'),
+            ).quantize(CENT)
+            user_cash = cash.get(uid, Decimal('0.00')).quantize(CENT)
+            snapshots.append(NavSnapshot(user_id=uid, date=day, cash=user_cash,
+                                         holdings_value=holdings_value, nav=user_cash + holdings_value))
+        day += timedelta(days=1)
+
+    NavSnapshot.objects.bulk_create(snapshots, batch_size=1000, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def build_all_snapshots(chunk_size=500, until=None):
+    """
+    Runs build_snapshots over every user in chunks of `chunk_size`; yields
+    (users processed, snapshots written) after each chunk.
+    """
+    done = written = 0
+    last_id = 0
+    while True:
+        ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return
+        written += build_snapshots(ids, until)
+        done += len(ids)
+        last_id = ids[-1]
+        yield done, written
+
+
+def nav_rows(user, range_key='1M'):
+    lookback, _ = CHART_RANGES[range_key]
+    since = timezone.localdate() - lookback
+    return list(NavSnapshot.objects.filter(user=user, date__gte=since)
+                .order_by('date').values_list('date', 'holdings_value', 'nav'))
+
+
+def chart_points(rows, current_value, range_key='1M', points=DEFAULT_CHART_POINTS):
+    """
+    Chart labels and holdings values from snapshot rows, followed by today's
+    live value; None when the user has no snapshots in range.
+    """
+    if not rows:
+        return None
+    date_format = '%d %b %Y' if range_key in ('1Y', '5Y') else '%d %b'
+    series = downsample_lttb([(day.toordinal(), float(value)) for day, value, _ in rows], points)
+    labels = [date.fromordinal(int(x)).strftime(date_format) for x, _ in series] + ['Today']
+    data = [round(value, 2) for _, value in series] + [float(current_value)]
+    return labels, data
+
+
+def period_return(rows, live_nav):
+    """
+    Percentage change in NAV from the first snapshot in range to the live
+    NAV. Trades only move money between cash and holdings, so this is the
+    account's return over the period.
+    """
+    if not rows or not rows[0][2]:
+        return None
+    return ((live_nav - rows[0][2]) / rows[0][2] * 100).quantize(CENT)
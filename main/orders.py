@@ -0,0 +1,143 @@
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .lots import book_realized, close_lots, open_lot
+from .models import PendingOrder, Portfolio, Profile, Transaction
+
+CENT = Decimal('0.01')
+
+logger = logging.getLogger(__name__)
+
+
+class OrderError(Exception):
+    """
+    An order that cannot be settled; the message is safe to show the user.
+    """
+
+
+class PriceUnavailable(OrderError):
+    pass
+
+
+class InsufficientFunds(OrderError):
+    pass
+
+
+class InsufficientHoldings(OrderError):
+    pass
+
+
+def execute_buy(user, stock, quantity, price):
+    """
+    Settles a market buy in one database transaction and returns the new
+    Transaction.
+
+    The balance is debited with a conditional F() update, which locks the
+    user's Profile row until commit, and the holding row is locked with
+    select_for_update. Concurrent orders from the same account queue on
+    those two rows only; orders from other accounts are unaffected. The
+    shares bought open a new Lot.
+    """
+    if price <= 0:
+        raise PriceUnavailable("Live price unavailable, please try again.")
+    total_cost = price * quantity
+    with transaction.atomic():
+        debited = (Profile.objects.filter(user=user, balance__gte=total_cost)
+                   .update(balance=F('balance') - total_cost))
+        if not debited:
+            raise InsufficientFunds("Insufficient balance in your wallet.")
+
+        holding, created = Portfolio.objects.select_for_update().get_or_create(
+            user=user, stock=stock,
+            defaults={'quantity': quantity, 'avg_price': price},
+        )
+        if not created:
+            new_total_qty = holding.quantity + quantity
+            holding.avg_price = (((holding.avg_price * holding.quantity) + total_cost)
+                                 / new_total_qty).quantize(CENT)
+            holding.quantity = new_total_qty
+            holding.save(update_fields=['quantity', 'avg_price'])
+
+        tx = Transaction.objects.create(
+            user=user, stock=stock, quantity=quantity,
+            price=price, transaction_type='BUY'
+        )
+        open_lot(user, stock, quantity, price, tx.timestamp)
+        return tx
+
+
+def execute_sell(user, stock, quantity, price):
+    """
+    Settles a market sell in one database transaction and returns the new
+    Transaction.
+
+    Like execute_buy, the Profile row is locked first (by the F() credit)
+    and the holding second, so a buy and a sell on the same account cannot
+    deadlock; the credit rolls back if the holding is short. The shares
+    are taken from the user's lots oldest first and the FIFO gain is
+    recorded on the Transaction.
+    """
+    if price <= 0:
+        raise PriceUnavailable("Live price unavailable, please try again.")
+    total_revenue = price * quantity
+    with transaction.atomic():
+        Profile.objects.filter(user=user).update(balance=F('balance') + total_revenue)
+
+        holding = Portfolio.objects.select_for_update().filter(user=user, stock=stock).first()
+        available = holding.quantity if holding else 0
+        if quantity > available:
+            raise InsufficientHoldings(f"You only have {available} shares available to sell.")
+
+        realized = close_lots(user, stock, quantity, price, holding.avg_price)
+        book_realized(user, realized)
+        if holding.quantity == quantity:
+            holding.delete()
+        else:
+            Portfolio.objects.filter(pk=holding.pk).update(quantity=F('quantity') - quantity)
+
+        return Transaction.objects.create(
+            user=user, stock=stock, quantity=quantity,
+            price=price, transaction_type='SELL', realized_pnl=realized
+        )
+
+
+def settle_pending(order_ids, prices, batch_size=500):
+    """
+    Settles triggered PendingOrders at the market, `prices` being
+    {symbol: Decimal}. Orders are loaded `batch_size` at a time; each one
+    commits on its own, so a rejection (e.g. the balance no longer covers
+    it) is recorded on that order without holding up the rest. An
+    unexpected error rolls its order back to OPEN and is logged. Orders
+    cancelled after they were triggered are skipped.
+
+    Returns (filled, rejected).
+    """
+    filled = rejected = 0
+    order_ids = sorted(order_ids)
+    for i in range(0, len(order_ids), batch_size):
+        batch = (PendingOrder.objects.filter(id__in=order_ids[i:i + batch_size], status='OPEN')
+                 .select_related('user', 'stock').order_by('id'))
+        for order in batch:
+            execute = execute_buy if order.side == 'BUY' else execute_sell
+            try:
+                with transaction.atomic():
+                    claimed = (PendingOrder.objects.filter(pk=order.pk, status='OPEN')
+                               .update(status='FILLED', closed_at=timezone.now()))
+                    if not claimed:
+                        continue
+                    try:
+                        tx = execute(order.user, order.stock, order.quantity, prices.get(order.stock.symbol, 0))
+                    except OrderError as e:
+                        PendingOrder.objects.filter(pk=order.pk).update(status='REJECTED', note=str(e)[:200])
+                        rejected += 1
+                    else:
+                        PendingOrder.objects.filter(pk=order.pk).update(transaction=tx)
+                        filled += 1
+            except Exception:
+                # Rolled back, so the order is still OPEN for the next attempt.
+                logger.exception("Error settling pending order %s", order.pk)
+    return filled, rejected
@@ -0,0 +1,72 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(timestamp, pk):
+    raw = f"{timestamp.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns (timestamp, pk) or None for a missing or malformed cursor.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(queryset, after=None, before=None, size=50):
+    """
+    One page of `queryset`, newest first by (timestamp, id), starting just
+    past a cursor instead of at an OFFSET. `after` continues to older rows
+    and `before` goes back to newer ones. Every page is a bounded range
+    scan of a (..., -timestamp, -id) index, so it costs the same on page
+    one and page ten thousand.
+
+    Returns (rows, newer_cursor, older_cursor); a cursor is None when there
+    is nothing further in that direction.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+    if before:
+        ts, pk = before
+        rows = list(queryset.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, id__gt=pk))
+                    .order_by('timestamp', 'id')[:size + 1])
+        has_newer, has_older = len(rows) > size, True
+        rows = rows[:size][::-1]
+    else:
+        if after:
+            ts, pk = after
+            queryset = queryset.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=pk))
+        rows = list(queryset.order_by('-timestamp', '-id')[:size + 1])
+        has_newer, has_older = bool(after), len(rows) > size
+        rows = rows[:size]
+
+    newer = encode_cursor(rows[0].timestamp, rows[0].pk) if rows and has_newer else None
+    older = encode_cursor(rows[-1].timestamp, rows[-1].pk) if rows and has_older else None
+    return rows, newer, older
+
+
+def keyset_chunks(rows, chunk_size=2000):
+    """
+    Iterates a values_list queryset whose first two columns are timestamp
+    and id, oldest first, `chunk_size` rows per query. Each chunk is a
+    bounded range scan starting just past the previous one's last row, so
+    memory stays flat even where the driver would buffer a whole result
+    set client-side (mysqlclient does, even for .iterator()).
+    """
+    rows = rows.order_by('timestamp', 'id')
+    chunk = list(rows[:chunk_size])
+    while chunk:
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        ts, pk = chunk[-1][:2]
+        chunk = list(rows.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, id__gt=pk))[:chunk_size])
@@ -0,0 +1,120 @@
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .risk import load_closes
+from .timeseries import DEFAULT_CHART_POINTS
+
+# Trading days per instalment and instalments per year for each SIP frequency.
+PERIODS = {'WEEKLY': (5, 52), 'MONTHLY': (21, 12)}
+PERCENTILES = (10, 50, 90)
+MIN_HISTORY_DAYS = 60
+PROJECTION_CACHE_TTL = 24 * 60 * 60
+
+
+class ProjectionError(Exception):
+    pass
+
+
+def period_returns(closes, days):
+    """
+    Log returns over every overlapping `days`-long window of the closes, so
+    a bootstrapped period keeps the day-to-day dependence inside it.
+    """
+    log_prices = np.log(closes)
+    return log_prices[days:] - log_prices[:-days]
+
+
+def checkpoints(periods, points=DEFAULT_CHART_POINTS):
+    """
+    Up to `points` instalment numbers spread evenly over 1..periods,
+    always including the last one.
+    """
+    return np.unique(np.linspace(1, periods, min(points, periods)).round().astype(np.int64))
+
+
+def simulate(returns, periods, paths, rng, at):
+    """
+    Corpus of a SIP of 1 per period after each instalment number in `at`,
+    over `paths` paths. All periods x paths growth factors are drawn with
+    replacement from `returns` as one array; the corpus then advances a
+    period at a time across every path at once, with the instalment
+    invested at the start of the period. Returns a (len(at) x paths)
+    float32 array.
+    """
+    pool = np.exp(returns).astype(np.float32)
+    growth = pool[rng.integers(0, len(pool), size=(periods, paths), dtype=np.int32)]
+    corpus = np.zeros(paths, dtype=np.float32)
+    out = np.empty((len(at), paths), dtype=np.float32)
+    row = 0
+    for period, factors in enumerate(growth, 1):
+        corpus += 1
+        corpus *= factors
+        if period == at[row]:
+            out[row] = corpus
+            row += 1
+    return out
+
+
+def bands(corpus):
+    """
+    The PERCENTILES of each row of `corpus` across paths, from one
+    partition per row.
+    """
+    paths = corpus.shape[1]
+    ranks = [min(paths - 1, paths * q // 100) for q in PERCENTILES]
+    return np.partition(corpus, ranks, axis=1)[:, ranks]
+
+
+def _key(symbol, frequency, years, day):
+    return f'sip:projection:{symbol}:{frequency}:{years}:{day.isoformat()}'
+
+
+def unit_projection(symbol, frequency, years):
+    """
+    Percentile bands for instalments of 1, cached per symbol, frequency,
+    horizon and day. The corpus scales linearly with the instalment, so one
+    simulation serves every amount.
+    """
+    today = timezone.localdate()
+    key = _key(symbol, frequency, years, today)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    lookback = getattr(settings, 'SIP_PROJECTION_LOOKBACK_DAYS', 10 * 365)
+    _, closes = load_closes([symbol], lookback, today)[symbol]
+    if len(closes) < MIN_HISTORY_DAYS:
+        raise ProjectionError(f"Not enough price history for {symbol} to project")
+    days, per_year = PERIODS[frequency]
+    paths = getattr(settings, 'SIP_PROJECTION_PATHS', 10000)
+    # Seeded from the key so a projection does not change between misses.
+    rng = np.random.default_rng(zlib.crc32(key.encode()))
+    at = checkpoints(years * per_year)
+    corpus = simulate(period_returns(closes, days), years * per_year, paths, rng, at)
+    result = {'periods': at, 'bands': bands(corpus), 'history_days': len(closes), 'paths': paths,
+              'per_year': per_year}
+    cache.set(key, result, PROJECTION_CACHE_TTL)
+    return result
+
+
+def project(symbol, amount, frequency, years):
+    """
+    Monte Carlo projection of a SIP of `amount` per `frequency` period in
+    `symbol` over `years`: rows of instalment number, elapsed years, amount
+    invested so far and the p10/p50/p90 corpus, at up to
+    DEFAULT_CHART_POINTS instalments ending with the last.
+    """
+    unit = unit_projection(symbol, frequency, years)
+    amount = float(amount)
+    periods = unit['periods']
+    rows = np.column_stack([periods, (periods / unit['per_year']).round(3), periods * amount,
+                            (unit['bands'].astype(np.float64) * amount).round(2)])
+    return {
+        'paths': unit['paths'],
+        'history_days': unit['history_days'],
+        'rows': rows.tolist(),
+    }
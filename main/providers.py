@@ -0,0 +1,421 @@
+import bisect
+import csv
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """
+    Returns the market-data provider configured by MARKET_DATA_PROVIDER
+    (a dotted path) and MARKET_DATA_PROVIDER_OPTIONS (its keyword arguments).
+    One instance is shared by the whole process.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                path = getattr(settings, 'MARKET_DATA_PROVIDER', 'main.providers.YFinanceProvider')
+                options = getattr(settings, 'MARKET_DATA_PROVIDER_OPTIONS', {})
+                _provider = import_string(path)(**options)
+    return _provider
+
+
+@receiver(setting_changed)
+def _reset_provider(setting, **kwargs):
+    global _provider
+    if setting in ('MARKET_DATA_PROVIDER', 'MARKET_DATA_PROVIDER_OPTIONS'):
+        _provider = None
+
+
+class MarketDataProvider:
+    """
+    Source of raw prices behind get_stock_data and get_multiple_stocks.
+
+    Quotes are plain dicts with 'symbol', 'name', 'price' (last traded) and
+    'open' (session open, or None); main.utils turns them into the cached
+    quote dicts the views use. Symbols the provider cannot price are left
+    out of the result.
+    """
+
+    def get_quote(self, symbol):
+        return self.get_quotes([symbol]).get(symbol)
+
+    def get_quotes(self, symbols):
+        raise NotImplementedError
+
+    def get_history(self, symbols, start, end, interval='1d'):
+        """
+        Returns {symbol: [(timestamp, open, high, low, close, volume), ...]}
+        for bars with start <= timestamp < end, oldest first. Timestamps are
+        aware UTC datetimes.
+        """
+        raise NotImplementedError
+
+
+# Bar sizes in seconds, keyed like PriceBar.INTERVALS.
+INTERVAL_SECONDS = {'1d': 86400, '1h': 3600, '5m': 300, '1m': 60}
+
+
+def _as_utc(ts):
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=dt_timezone.utc)
+    return ts.astimezone(dt_timezone.utc)
+
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Live prices from Yahoo Finance.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def get_quote(self, symbol):
+        import yfinance as yf
+
+        ticker = yf.Ticker(symbol)
+        info = ticker.fast_info
+        last_price = info.last_price
+
+        long_name = getattr(ticker, 'info', {}).get('longName', symbol)
+
+        history = ticker.history(period="1d")
+        open_price = history['Open'].iloc[0] if not history.empty else None
+        return {'symbol': symbol, 'name': long_name, 'price': last_price, 'open': open_price}
+
+    def get_quotes(self, symbols):
+        """
+        Fetches open and last price for all symbols with a single
+        multi-symbol history download. Names are not available this way and
+        default to the symbol.
+        """
+        import yfinance as yf
+
+        frame = yf.download(
+            tickers=list(symbols), period="1d", group_by='ticker',
+            auto_adjust=False, progress=False, threads=False,
+            timeout=self.timeout or getattr(settings, 'QUOTE_FETCH_TIMEOUT', 10),
+        )
+        results = {}
+        if frame is None or frame.empty:
+            return results
+
+        tickers = set(frame.columns.get_level_values(0)) if frame.columns.nlevels > 1 else None
+        for sym in symbols:
+            if tickers is None:
+                bars = frame
+            elif sym in tickers:
+                bars = frame[sym]
+            else:
+                continue
+            bars = bars.dropna(subset=['Open', 'Close'])
+            if bars.empty:
+                continue
+            results[sym] = {
+                'symbol': sym, 'name': sym,
+                'price': float(bars['Close'].iloc[-1]), 'open': float(bars['Open'].iloc[0]),
+            }
+        return results
+
+    def get_history(self, symbols, start, end, interval='1d'):
+        import yfinance as yf
+
+        frame = yf.download(
+            tickers=list(symbols), start=start, end=end, interval=interval,
+            group_by='ticker', auto_adjust=False, progress=False, threads=False,
+            timeout=self.timeout or getattr(settings, 'QUOTE_FETCH_TIMEOUT', 10),
+        )
+        results = {}
+        if frame is None or frame.empty:
+            return results
+
+        tickers = set(frame.columns.get_level_values(0)) if frame.columns.nlevels > 1 else None
+        for sym in symbols:
+            if tickers is None:
+                bars = frame
+            elif sym in tickers:
+                bars = frame[sym]
+            else:
+                continue
+            bars = bars.dropna(subset=['Open', 'High', 'Low', 'Close'])
+            results[sym] = [
+                (_as_utc(ts.to_pydatetime()), float(o), float(h), float(l), float(c),
+                 int(v) if v == v else 0)
+                for ts, o, h, l, c, v in zip(bars.index, bars['Open'], bars['High'],
+                                             bars['Low'], bars['Close'], bars['Volume'])
+            ]
+        return results
+
+
+class SimulatedProvider(MarketDataProvider):
+    """
+    Seeded in-process feed that moves every symbol along its own geometric
+    Brownian motion, one step per `tick_seconds` of wall-clock time since
+    the provider was created.
+
+    The price of a symbol at a given tick depends only on the seed, the
+    symbol and the tick, so runs are reproducible and any number of symbols
+    can be priced without network access. The walk is drawn in blocks
+    bridged down to single ticks (see `_log_price`), so pricing a symbol
+    for the first time does not replay every tick since start-up.
+    """
+
+    BLOCK_TICKS = 256
+
+    def __init__(self, seed=0, drift=0.08, volatility=0.25, tick_seconds=1.0,
+                 ticks_per_session=22500, clock=time.time):
+        self.seed = seed
+        self.drift = drift
+        self.volatility = volatility
+        self.tick_seconds = tick_seconds
+        self.ticks_per_session = ticks_per_session
+        self.clock = clock
+        self.started_at = clock()
+        # Annualised parameters scaled to one tick (252 sessions a year).
+        dt = 1.0 / (252 * ticks_per_session)
+        self._step_mean = (drift - volatility ** 2 / 2) * dt
+        self._step_scale = volatility * math.sqrt(dt)
+        # symbol -> (superblock, log price at its start) and symbol ->
+        # (session, log price at its open). Both only ever hold values the
+        # seed determines, so threads may race to fill them without a lock.
+        self._state = {}
+        self._opens = {}
+
+    def _rng(self, symbol, salt):
+        digest = hashlib.blake2b(f'{self.seed}:{symbol}:{salt}'.encode(), digest_size=8).digest()
+        return random.Random(int.from_bytes(digest, 'big'))
+
+    def _initial_price(self, symbol):
+        # Log-uniform between 20 and 5000 so the universe looks realistic.
+        return math.exp(self._rng(symbol, 'base').uniform(math.log(20), math.log(5000)))
+
+    @staticmethod
+    def _bridge(rng, total, steps, taken, scale):
+        """
+        Walks a Brownian bridge of `steps` increments (each with standard
+        deviation `scale`) that sum to `total`, and returns the sum of the
+        first `taken` increments and the increment after them.
+        """
+        partial, remaining = 0.0, total
+        for step in range(taken + 1):
+            left = steps - step
+            move = rng.gauss(remaining / left, scale * math.sqrt((left - 1) / left))
+            if step == taken:
+                return partial, move
+            partial += move
+            remaining -= move
+
+    def _log_price(self, symbol, tick):
+        """
+        Log price of the symbol at `tick`. The walk is split into
+        superblocks of BLOCK_TICKS blocks of BLOCK_TICKS ticks: every
+        superblock's total log return is drawn from its own seed, its
+        blocks are bridged to that total and the ticks into the current
+        block are bridged to the block's total. Jumping to any tick costs
+        one draw per earlier superblock (resumed from the last one summed
+        for the symbol) and at most two bridges.
+        """
+        size = self.BLOCK_TICKS
+        super_size = size * size
+        superblock, rest = divmod(tick, super_size)
+        state = self._state.get(symbol)
+        if state is None or state[0] > superblock:
+            state = (0, math.log(self._initial_price(symbol)))
+        current, level = state
+        super_mean, super_scale = self._step_mean * super_size, self._step_scale * size
+        for i in range(current, superblock):
+            level += self._rng(symbol, f'super:{i}').gauss(super_mean, super_scale)
+        self._state[symbol] = (superblock, level)
+
+        rng = self._rng(symbol, f'super:{superblock}')
+        total = rng.gauss(super_mean, super_scale)
+        block, offset = divmod(rest, size)
+        partial, block_total = self._bridge(rng, total, size, block, self._step_scale * math.sqrt(size))
+        level += partial
+        if offset:
+            rng = self._rng(symbol, f'block:{superblock}:{block}')
+            level += self._bridge(rng, block_total, size, offset, self._step_scale)[0]
+        return level
+
+    def _price_at(self, symbol, tick):
+        """
+        Returns (price, session open) of the symbol at `tick`.
+        """
+        session = tick // self.ticks_per_session
+        opened = self._opens.get(symbol)
+        if opened is None or opened[0] != session:
+            # Priced before the tick itself so the walk only moves forward.
+            opened = (session, self._log_price(symbol, session * self.ticks_per_session))
+            self._opens[symbol] = opened
+        return math.exp(self._log_price(symbol, tick)), math.exp(opened[1])
+
+    def current_tick(self):
+        return int((self.clock() - self.started_at) / self.tick_seconds)
+
+    # Simulated daily history starts here so any date range is reproducible.
+    HISTORY_ORIGIN = datetime(2015, 1, 1, tzinfo=dt_timezone.utc)
+
+    def _daily_path(self, symbol, end):
+        """
+        Yields (session date, open, close) for every weekday from
+        HISTORY_ORIGIN up to `end`.
+        """
+        rng = self._rng(symbol, 'daily')
+        dt = 1.0 / 252
+        mean = (self.drift - self.volatility ** 2 / 2) * dt
+        scale = self.volatility * math.sqrt(dt)
+        close = self._initial_price(symbol)
+        day = self.HISTORY_ORIGIN
+        while day < end:
+            if day.weekday() < 5:
+                session_open = close
+                close = session_open * math.exp(mean + scale * rng.gauss(0.0, 1.0))
+                yield day, session_open, close
+            day += timedelta(days=1)
+
+    def get_history(self, symbols, start, end, interval='1d'):
+        start, end = _as_utc(start), _as_utc(end)
+        step = INTERVAL_SECONDS[interval]
+        results = {}
+        for sym in symbols:
+            bars = []
+            for day, session_open, close in self._daily_path(sym, end):
+                if day + timedelta(days=1) <= start:
+                    continue
+                rng = self._rng(sym, f'{interval}:{day:%Y%m%d}')
+                if interval == '1d':
+                    spread = abs(rng.gauss(0.0, 0.01))
+                    bars.append((day, session_open, max(session_open, close) * (1 + spread),
+                                 min(session_open, close) * (1 - spread), close,
+                                 rng.randint(10_000, 5_000_000)))
+                    continue
+                # Intraday bars bridge the session open to its close.
+                steps = max(1, self.ticks_per_session // step)
+                session_start = datetime.combine(day.date(), dt_time(3, 45), dt_timezone.utc)
+                price = session_open
+                drift = math.log(close / session_open) / steps
+                for i in range(steps):
+                    ts = session_start + timedelta(seconds=i * step)
+                    bar_close = price * math.exp(drift + self._step_scale * math.sqrt(step) * rng.gauss(0.0, 1.0))
+                    if start <= ts < end:
+                        bars.append((ts, price, max(price, bar_close), min(price, bar_close), bar_close,
+                                     rng.randint(100, 50_000)))
+                    price = bar_close
+            results[sym] = [bar for bar in bars if start <= bar[0] < end]
+        return results
+
+    def get_quotes(self, symbols):
+        tick = self.current_tick()
+        results = {}
+        for sym in symbols:
+            price, session_open = self._price_at(sym, tick)
+            results[sym] = {'symbol': sym, 'name': sym, 'price': price, 'open': session_open}
+        return results
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Replays recorded quotes from a local CSV or Parquet file with columns
+    `timestamp` (epoch seconds), `symbol` and `price`, plus optional `open`
+    and `name`.
+
+    Recorded time advances `speed` times faster than wall-clock time from
+    the moment the provider is created, looping back to the start when the
+    recording runs out if `loop` is set.
+    """
+
+    def __init__(self, path, speed=1.0, loop=True, clock=time.time):
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+        self.started_at = clock()
+        self._times = defaultdict(list)
+        self._ticks = defaultdict(list)
+        self._names = {}
+        for row in self._read(path):
+            sym = row['symbol']
+            self._times[sym].append(float(row['timestamp']))
+            open_price = row.get('open')
+            open_price = float(open_price) if open_price not in (None, '') else None
+            if open_price is not None and math.isnan(open_price):
+                open_price = None
+            self._ticks[sym].append((float(row['price']), open_price))
+            if row.get('name'):
+                self._names[sym] = row['name']
+        for sym in self._times:
+            order = sorted(range(len(self._times[sym])), key=self._times[sym].__getitem__)
+            self._times[sym] = [self._times[sym][i] for i in order]
+            self._ticks[sym] = [self._ticks[sym][i] for i in order]
+        starts = [times[0] for times in self._times.values()]
+        ends = [times[-1] for times in self._times.values()]
+        self.first = min(starts) if starts else 0.0
+        self.span = (max(ends) - self.first) if ends else 0.0
+
+    @staticmethod
+    def _read(path):
+        path = str(path)
+        if path.endswith('.parquet'):
+            import pandas as pd
+
+            return pd.read_parquet(path).to_dict('records')
+        with open(path, newline='') as f:
+            return list(csv.DictReader(f))
+
+    def replay_time(self):
+        elapsed = (self.clock() - self.started_at) * self.speed
+        if self.loop and self.span > 0:
+            elapsed %= self.span
+        return self.first + elapsed
+
+    def get_quotes(self, symbols):
+        now = self.replay_time()
+        results = {}
+        for sym in symbols:
+            times = self._times.get(sym)
+            if not times:
+                continue
+            i = bisect.bisect_right(times, now) - 1
+            if i < 0:
+                continue
+            price, open_price = self._ticks[sym][i]
+            results[sym] = {'symbol': sym, 'name': self._names.get(sym, sym),
+                            'price': price, 'open': open_price}
+        return results
+
+    def get_history(self, symbols, start, end, interval='1d'):
+        """
+        Buckets the recorded ticks into bars; recorded timestamps are used
+        as-is rather than shifted to replay time.
+        """
+        lo, hi = _as_utc(start).timestamp(), _as_utc(end).timestamp()
+        step = INTERVAL_SECONDS[interval]
+        results = {}
+        for sym in symbols:
+            times = self._times.get(sym, [])
+            bars = []
+            for i in range(bisect.bisect_left(times, lo), bisect.bisect_left(times, hi)):
+                bucket = times[i] - times[i] % step
+                price = self._ticks[sym][i][0]
+                if bars and bars[-1][0] == bucket:
+                    _, o, h, l, _c, v = bars[-1]
+                    bars[-1] = (bucket, o, max(h, price), min(l, price), price, v)
+                else:
+                    bars.append((bucket, price, price, price, price, 0))
+            results[sym] = [
+                (datetime.fromtimestamp(bucket, dt_timezone.utc), o, h, l, c, v)
+                for bucket, o, h, l, c, v in bars
+            ]
+        return results
@@ -0,0 +1,188 @@
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import fragments
+from .models import PriceBar
+
+# Indices the portfolio's beta is measured against: label -> symbol.
+BENCHMARKS = {'NIFTY 50': '^NSEI', 'S&P 500': '^GSPC'}
+TRADING_DAYS = 252
+# One-sided normal quantiles for the parametric VaR.
+Z_SCORES = {0.95: 1.6448536, 0.99: 2.3263479}
+MIN_OBSERVATIONS = 20
+RISK_CACHE_TTL = 24 * 60 * 60
+
+
+def _closes_key(symbol, lookback_days, day):
+    return f'risk:closes:{lookback_days}:{symbol}:{day.isoformat()}'
+
+
+def load_closes(symbols, lookback_days, today=None):
+    """
+    {symbol: (day ordinals, closes)} of daily bars over the lookback, as
+    NumPy arrays. Each symbol's series is cached per lookback and day, so
+    holdings shared between users are read once; the rest come from one
+    query.
+    """
+    today = today or timezone.localdate()
+    keys = {_closes_key(sym, lookback_days, today): sym for sym in symbols}
+    cached = cache.get_many(list(keys))
+    series = {keys[key]: value for key, value in cached.items()}
+
+    missing = [sym for sym in symbols if sym not in series]
+    if missing:
+        start = timezone.now() - timedelta(days=lookback_days)
+        rows = {sym: ([], []) for sym in missing}
+        for sym, ts, close in (PriceBar.objects
+                               .filter(stock__symbol__in=missing, interval='1d', timestamp__gte=start)
+                               .order_by('timestamp')
+                               .values_list('stock__symbol', 'timestamp', 'close')):
+            days, closes = rows[sym]
+            days.append(ts.toordinal())
+            closes.append(close)
+        fresh = {sym: (np.array(days, dtype=np.int64), np.array(closes, dtype=np.float64))
+                 for sym, (days, closes) in rows.items()}
+        cache.set_many({_closes_key(sym, lookback_days, today): value for sym, value in fresh.items()},
+                       RISK_CACHE_TTL)
+        series.update(fresh)
+    return series
+
+
+def align(series, symbols):
+    """
+    Lines the series up on the union of their trading days: returns the
+    day ordinals and a (days x symbols) price matrix, forward-filled over
+    each symbol's holidays and NaN before its first bar.
+    """
+    present = [series[sym][0] for sym in symbols if len(series[sym][0])]
+    days = np.unique(np.concatenate(present)) if present else np.empty(0, dtype=np.int64)
+    prices = np.full((len(days), len(symbols)), np.nan)
+    for col, sym in enumerate(symbols):
+        sym_days, closes = series[sym]
+        prices[np.searchsorted(days, sym_days), col] = closes
+    return days, forward_fill(prices)
+
+
+def forward_fill(prices):
+    """
+    Carries the last price down each column over NaN gaps.
+    """
+    if not prices.size:
+        return prices
+    rows = np.where(np.isnan(prices), 0, np.arange(prices.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return prices[rows, np.arange(prices.shape[1])]
+
+
+def compute(prices, weights, benchmarks, confidence=0.95):
+    """
+    Risk metrics of a portfolio with fixed `weights` over the (days x
+    holdings) `prices` matrix, against the (days x indices) `benchmarks`
+    matrix on the same days. Everything is computed on the whole return
+    matrix at once; an index column is only used where it has prices.
+    """
+    returns = prices[1:] / prices[:-1] - 1
+    portfolio = returns @ weights
+    sigma = portfolio.std(ddof=1)
+
+    betas = []
+    index_returns = benchmarks[1:] / benchmarks[:-1] - 1
+    for col in range(index_returns.shape[1]):
+        market = index_returns[:, col]
+        valid = ~np.isnan(market)
+        if valid.sum() < MIN_OBSERVATIONS:
+            betas.append(None)
+            continue
+        cov = np.cov(portfolio[valid], market[valid])
+        betas.append(float(cov[0, 1] / cov[1, 1]) if cov[1, 1] else None)
+
+    growth = np.cumprod(1 + portfolio)
+    drawdown = growth / np.maximum.accumulate(np.maximum(growth, 1.0)) - 1
+
+    correlation = np.corrcoef(returns, rowvar=False) if returns.shape[1] > 1 else np.ones((1, 1))
+    return {
+        'observations': len(portfolio),
+        'volatility': float(sigma * np.sqrt(TRADING_DAYS)),
+        'betas': betas,
+        'var_historical': float(-np.percentile(portfolio, (1 - confidence) * 100)),
+        'var_parametric': float(Z_SCORES[confidence] * sigma - portfolio.mean()),
+        'max_drawdown': float(-drawdown.min()),
+        'correlation': np.nan_to_num(correlation).round(2).tolist(),
+    }
+
+
+def portfolio_risk(user, holdings, confidence=0.95):
+    """
+    Risk metrics for a user's open `holdings` (Portfolio rows), weighted by
+    their value at the latest close. Cached per user, portfolio version and
+    day. Returns None when fewer than MIN_OBSERVATIONS days of history are
+    common to every holding.
+    """
+    today = timezone.localdate()
+    key = f'risk:{user.id}:{fragments.user_version(user.id)}:{today.isoformat()}:{confidence}'
+    result = cache.get(key)
+    if result is not None:
+        return result or None
+
+    result = _portfolio_risk(holdings, confidence, today)
+    # An empty dict caches "not enough history" too.
+    cache.set(key, result or {}, RISK_CACHE_TTL)
+    return result
+
+
+def _portfolio_risk(holdings, confidence, today):
+    if not holdings:
+        return None
+    quantities = {}
+    for h in holdings:
+        quantities[h.stock.symbol] = quantities.get(h.stock.symbol, 0) + h.quantity
+    lookback = getattr(settings, 'RISK_LOOKBACK_DAYS', 5 * 365)
+    series = load_closes(list(quantities) + list(BENCHMARKS.values()), lookback, today)
+
+    symbols = [sym for sym in quantities if len(series[sym][0])]
+    without_history = [sym for sym in quantities if sym not in symbols]
+    if not symbols:
+        return None
+    days, prices = align({sym: series[sym] for sym in symbols}, symbols)
+    # Only the days on which every holding has a price.
+    first = np.argmax(~np.isnan(prices).any(axis=1)) if len(days) else 0
+    days, prices = days[first:], prices[first:]
+    if len(days) <= MIN_OBSERVATIONS or np.isnan(prices[0]).any():
+        return None
+
+    index_prices = np.column_stack([_on_days(series[sym], days) for sym in BENCHMARKS.values()])
+    values = prices[-1] * np.array([quantities[sym] for sym in symbols], dtype=np.float64)
+    total = values.sum()
+    metrics = compute(prices, values / total, index_prices, confidence)
+
+    return dict(
+        metrics,
+        confidence=int(confidence * 100),
+        value=float(total),
+        var_historical_amount=float(metrics['var_historical'] * total),
+        var_parametric_amount=float(metrics['var_parametric'] * total),
+        betas=dict(zip(BENCHMARKS, metrics['betas'])),
+        symbols=symbols,
+        correlation=list(zip(symbols, metrics['correlation'])),
+        without_history=without_history,
+        start=date.fromordinal(int(days[0])),
+        end=date.fromordinal(int(days[-1])),
+    )
+
+
+def _on_days(series, days):
+    """
+    An index's closes on the portfolio's trading days, carrying the last
+    close over the index's own holidays.
+    """
+    index_days, closes = series
+    if not len(index_days):
+        return np.full(len(days), np.nan)
+    pos = np.searchsorted(index_days, days, side='right') - 1
+    values = closes[np.maximum(pos, 0)]
+    values[pos < 0] = np.nan
+    return values
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fragments, instruments
+from .models import Portfolio, Profile, Stock, Transaction, Watchlist
+from .nav import invalidate_snapshots
+
+
+@receiver(post_save, sender=Transaction)
+def invalidate_nav_on_transaction(sender, instance, **kwargs):
+    invalidate_snapshots(instance.user_id, timezone.localdate(instance.timestamp))
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def invalidate_instrument_index(sender, **kwargs):
+    instruments.invalidate()
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Portfolio)
+@receiver(post_delete, sender=Portfolio)
+@receiver(post_save, sender=Watchlist)
+@receiver(post_delete, sender=Watchlist)
+@receiver(post_save, sender=Profile)
+def invalidate_user_fragments(sender, instance, **kwargs):
+    fragments.invalidate_users([instance.user_id])
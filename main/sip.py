@@ -0,0 +1,157 @@
+import calendar
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import fragments
+from .bulk import update_rows
+from .models import Lot, Portfolio, Profile, SIPPlan, Transaction
+from .nav import invalidate_snapshots_for
+from .orders import CENT
+from .utils import get_multiple_stocks, refresh_quotes
+
+
+def add_months(day, months=1):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def next_run(plan_date, frequency):
+    if frequency == 'WEEKLY':
+        return plan_date + timedelta(weeks=1)
+    return add_months(plan_date)
+
+
+UNPRICED = "Skipped: price unavailable, will retry"
+
+
+def fresh_quotes(names):
+    """
+    Quotes to buy at for the symbols in `names` (symbol -> company name):
+    stale ones from get_multiple_stocks are fetched upstream again, and
+    symbols that still have no fresh quote are left out.
+    """
+    quotes = get_multiple_stocks(list(names))
+    retry = [sym for sym, data in quotes.items() if data.get('stale')]
+    if retry:
+        quotes.update(refresh_quotes(retry, names))
+    return {sym: data for sym, data in quotes.items() if not data.get('stale')}
+
+
+def settle_due_chunk(today, chunk_size=1000, skip=None):
+    """
+    Settles one instalment for up to `chunk_size` plans due on or before
+    `today` in one database transaction. The chunk is priced from fresh
+    quotes before any row is locked; the plans, balances and holdings
+    involved are then locked, read as plain rows and written back with one
+    statement per table. Each plan's next_run_date moves on in the same
+    commit, so a crash rolls the whole chunk back and a rerun neither skips
+    nor repeats an instalment.
+
+    A plan without a fresh price keeps its next_run_date, so the next run
+    retries the instalment. Plan ids in `skip` are left out; the ones
+    without a price, and the ones another worker has locked, are added to it.
+
+    Returns (plans processed, instalments bought).
+    """
+    skip = set() if skip is None else skip
+    due = SIPPlan.objects.filter(is_active=True, next_run_date__lte=today)
+    if skip:
+        due = due.exclude(id__in=skip)
+    due = list(due.order_by('next_run_date', 'id').values_list('id', 'stock__symbol', 'stock__name')[:chunk_size])
+    if not due:
+        return 0, 0
+    quotes = fresh_quotes({symbol: name for _, symbol, name in due})
+    symbols = {plan_id: symbol for plan_id, symbol, _ in due}
+
+    with transaction.atomic():
+        plans = list(SIPPlan.objects.select_for_update(skip_locked=True)
+                     .filter(id__in=symbols, is_active=True, next_run_date__lte=today).order_by('id')
+                     .values_list('id', 'user_id', 'stock_id', 'amount', 'frequency', 'next_run_date'))
+        user_ids = {plan[1] for plan in plans}
+        profiles = {user_id: (pk, balance) for user_id, pk, balance in Profile.objects.select_for_update()
+                    .filter(user_id__in=user_ids).values_list('user_id', 'id', 'balance')}
+        balances = {user_id: balance for user_id, (_, balance) in profiles.items()}
+        holdings = {(user_id, stock_id): [pk, quantity, avg_price]
+                    for pk, user_id, stock_id, quantity, avg_price in Portfolio.objects.select_for_update()
+                    .filter(user_id__in=user_ids, stock_id__in={plan[2] for plan in plans})
+                    .values_list('id', 'user_id', 'stock_id', 'quantity', 'avg_price')}
+
+        # Locked by another worker, which settles them.
+        skip.update(set(symbols) - {plan[0] for plan in plans})
+        touched = set()
+        transactions = []
+        plan_rows = []
+        for plan_id, user_id, stock_id, amount, frequency, run_date in plans:
+            status = _settle_one(quotes.get(symbols[plan_id]), amount, user_id, stock_id,
+                                 balances, holdings, touched, transactions)
+            if status == UNPRICED:
+                skip.add(plan_id)
+                plan_rows.append((run_date, run_date, status, plan_id))
+            else:
+                plan_rows.append((next_run(run_date, frequency), run_date, status, plan_id))
+
+        if transactions:
+            buyers = {tx.user_id for tx in transactions}
+            update_rows(Profile, ['balance'], [(balances[uid], profiles[uid][0]) for uid in buyers])
+            Portfolio.objects.bulk_create([
+                Portfolio(user_id=key[0], stock_id=key[1], quantity=quantity, avg_price=avg_price)
+                for key, (pk, quantity, avg_price) in holdings.items() if pk is None
+            ])
+            update_rows(Portfolio, ['quantity', 'avg_price'],
+                         [(holdings[key][1], holdings[key][2], holdings[key][0])
+                          for key in touched if holdings[key][0] is not None])
+            Transaction.objects.bulk_create(transactions)
+            Lot.objects.bulk_create([Lot(user_id=tx.user_id, stock_id=tx.stock_id, quantity=tx.quantity,
+                                         cost_price=tx.price, opened_at=tx.timestamp) for tx in transactions])
+            # bulk_create skips post_save, so invalidate NAV snapshots and
+            # cached page fragments here.
+            invalidate_snapshots_for(buyers, timezone.localdate())
+            fragments.invalidate_users(buyers)
+        update_rows(SIPPlan, ['next_run_date', 'last_run_date', 'last_status'], plan_rows)
+    return len(due), len(transactions)
+
+
+def _settle_one(quote, amount, user_id, stock_id, balances, holdings, touched, transactions):
+    if not quote or not quote['price'] or user_id not in balances:
+        return UNPRICED
+    price = quote['price']
+    quantity = int(amount // price)
+    if not quantity:
+        return "Skipped: amount below one share"
+    cost = price * quantity
+    if balances[user_id] < cost:
+        return "Skipped: insufficient balance"
+
+    balances[user_id] -= cost
+    key = (user_id, stock_id)
+    holding = holdings.setdefault(key, [None, 0, price])
+    total_qty = holding[1] + quantity
+    holding[2] = ((holding[2] * holding[1] + cost) / total_qty).quantize(CENT)
+    holding[1] = total_qty
+    touched.add(key)
+    transactions.append(Transaction(user_id=user_id, stock_id=stock_id, quantity=quantity,
+                                    price=price, transaction_type='BUY'))
+    return f"Bought {quantity}"
+
+
+def run_due_plans(today=None, chunk_size=1000):
+    """
+    Settles every due instalment chunk by chunk, yielding the running
+    (plans processed, instalments bought) after each chunk. Plans that
+    missed several dates catch up one instalment per pass; plans without a
+    price, or locked by another worker, are not tried again this run.
+    """
+    today = today or timezone.localdate()
+    processed = bought = 0
+    skip = set()
+    while True:
+        plans, buys = settle_due_chunk(today, chunk_size, skip)
+        if not plans:
+            return
+        processed += plans
+        bought += buys
+        yield processed, bought
@@ -0,0 +1,91 @@
+import csv
+import gzip
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Sum, When
+from django.utils import timezone
+
+from .models import Profile, Transaction
+from .pagination import keyset_chunks
+
+CENT = Decimal('0.01')
+
+HEADER = ['Date', 'Type', 'Symbol', 'Quantity', 'Price', 'Amount', 'Cash Balance', 'Realized P&L']
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the line, so csv.writer can
+    feed a generator without buffering.
+    """
+    def write(self, value):
+        return value
+
+
+def opening_balance(user_id):
+    """
+    Cash balance before the first transaction: today's balance with every
+    buy added back and every sell taken off, in one aggregate query.
+    """
+    balance = Profile.objects.filter(user_id=user_id).values_list('balance', flat=True).first() or Decimal('0.00')
+    amount = F('price') * F('quantity')
+    net = Transaction.objects.filter(user_id=user_id).aggregate(net=Sum(
+        Case(When(transaction_type='BUY', then=-amount), default=amount),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    ))['net'] or Decimal('0.00')
+    return balance - net
+
+
+def statement_rows(user_id, chunk_size=2000):
+    """
+    Yields the header and then one row per transaction, oldest first, with
+    the running cash balance and the FIFO P&L each sell realised (against
+    average cost for sells booked before lot tracking that rebuild_lots
+    has not backfilled). Rows come from the database in keyset chunks of
+    `chunk_size` and only per-stock position state is kept, so memory does
+    not grow with the ledger.
+    """
+    yield HEADER
+    balance = opening_balance(user_id)
+    positions = {}
+    ledger = (Transaction.objects.filter(user_id=user_id)
+              .values_list('timestamp', 'id', 'transaction_type', 'stock__symbol', 'quantity', 'price',
+                           'realized_pnl'))
+    for timestamp, _, tx_type, symbol, quantity, price, booked in keyset_chunks(ledger, chunk_size):
+        amount = price * quantity
+        held, avg_cost = positions.get(symbol, (0, Decimal('0.00')))
+        realized = ''
+        if tx_type == 'BUY':
+            balance -= amount
+            avg_cost = (avg_cost * held + amount) / (held + quantity)
+            held += quantity
+        else:
+            balance += amount
+            realized = booked if booked is not None else ((price - avg_cost) * quantity).quantize(CENT)
+            held = max(held - quantity, 0)
+        positions[symbol] = (held, avg_cost)
+        yield [timezone.localtime(timestamp).strftime('%Y-%m-%d %H:%M:%S'), tx_type, symbol, quantity, price,
+               amount.quantize(CENT), balance.quantize(CENT), realized]
+
+
+def csv_lines(rows):
+    """
+    Encodes rows as CSV one line at a time, for StreamingHttpResponse.
+    """
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_user(user_id, path, chunk_size=2000):
+    """
+    Streams one user's statement into a gzip-compressed CSV at `path` and
+    returns the number of transactions written.
+    """
+    count = -1
+    with gzip.open(path, 'wt', newline='') as f:
+        writer = csv.writer(f)
+        for row in statement_rows(user_id, chunk_size):
+            writer.writerow(row)
+            count += 1
+    return count
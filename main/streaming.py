@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Stock
+from .utils import get_cached_quotes, refresh_quotes
+
+logger = logging.getLogger(__name__)
+
+
+def _fetch(symbols):
+    """
+    One batched lookup for every subscribed symbol. With QUOTE_CACHE_ONLY
+    the refresh_quotes worker owns the upstream and the hub only reads
+    what it has cached.
+    """
+    if getattr(settings, 'QUOTE_CACHE_ONLY', False):
+        return get_cached_quotes(symbols)
+    names = dict(Stock.objects.filter(symbol__in=symbols).values_list('symbol', 'name'))
+    return refresh_quotes(symbols, names)
+
+
+class Subscription:
+    """
+    One connected client. Updates are coalesced per symbol: a client that
+    has not drained its last batch only ever holds the newest quote for
+    each symbol, so a slow reader costs O(symbols), never a backlog.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = frozenset(symbols)
+        self.pending = {}
+        self.coalesced = 0
+        self._ready = asyncio.Event()
+
+    def push(self, symbol, quote):
+        if symbol in self.pending:
+            self.coalesced += 1
+        self.pending[symbol] = quote
+        self._ready.set()
+
+    async def next_batch(self, timeout=None):
+        """
+        Waits for at least one update and returns {symbol: quote}; an empty
+        dict if `timeout` passes first.
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._ready.clear()
+        batch, self.pending = self.pending, {}
+        return batch
+
+
+class QuoteHub:
+    """
+    Per-process fan-out of live quotes. However many clients watch a
+    symbol, the hub polls it once per interval, in a single batched fetch
+    covering every subscribed symbol, and pushes only quotes that changed
+    to each subscriber. The poll loop runs while anyone is subscribed.
+    """
+
+    def __init__(self, interval=None, fetch=_fetch):
+        self.interval = interval or getattr(settings, 'QUOTE_STREAM_INTERVAL', 5)
+        self.fetch = fetch
+        self.subscribers = defaultdict(set)
+        self.latest = {}
+        self.polls = 0
+        self.loop = asyncio.get_running_loop()
+        self._task = None
+
+    def subscribe(self, symbols):
+        sub = Subscription(symbols)
+        for symbol in sub.symbols:
+            self.subscribers[symbol].add(sub)
+            if symbol in self.latest:
+                sub.push(symbol, self.latest[symbol])
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub):
+        for symbol in sub.symbols:
+            watchers = self.subscribers.get(symbol)
+            if watchers is not None:
+                watchers.discard(sub)
+                if not watchers:
+                    del self.subscribers[symbol]
+
+    def publish(self, quotes):
+        for symbol, quote in quotes.items():
+            previous = self.latest.get(symbol)
+            if previous and (previous['price'], previous['change_percent']) == \
+                    (quote['price'], quote['change_percent']):
+                continue
+            self.latest[symbol] = quote
+            for sub in self.subscribers.get(symbol, ()):
+                sub.push(symbol, quote)
+
+    async def _run(self):
+        while self.subscribers:
+            started = time.monotonic()
+            symbols = list(self.subscribers)
+            try:
+                quotes = await sync_to_async(self.fetch, thread_sensitive=False)(symbols)
+            except Exception:
+                logger.exception("Quote stream poll failed")
+                quotes = {}
+            self.polls += 1
+            self.publish(quotes)
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+_hub = None
+
+
+def get_hub():
+    """
+    The hub for the running event loop, created on first use.
+    """
+    global _hub
+    if _hub is None or _hub.loop is not asyncio.get_running_loop():
+        _hub = QuoteHub()
+    return _hub
+
+
+def sse_event(batch):
+    data = {symbol: [quote['price'], quote['change_percent'], quote.get('fetched_at')]
+            for symbol, quote in batch.items()}
+    return f"event: quotes\ndata: {json.dumps(data, default=float, separators=(',', ':'))}\n\n"
+
+
+async def event_stream(hub, symbols, heartbeat=None):
+    """
+    Server-sent events for one client: a quotes event per coalesced batch
+    and a comment line every `heartbeat` seconds so proxies keep the
+    connection open. Unsubscribes when the client goes away.
+    """
+    heartbeat = heartbeat or getattr(settings, 'QUOTE_STREAM_HEARTBEAT', 15)
+    sub = hub.subscribe(symbols)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            batch = await sub.next_batch(heartbeat)
+            yield sse_event(batch) if batch else ": ping\n\n"
+    finally:
+        hub.unsubscribe(sub)
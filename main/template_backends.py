@@ -0,0 +1,35 @@
+import time
+
+from django.template.backends.django import DjangoTemplates
+
+from . import metrics
+
+
+class _TimedTemplate:
+    """
+    Wraps a backend template so every render is added to the current
+    request's render time.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.record_render(time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend with render timing for RequestMetricsMiddleware.
+    """
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
@@ -1,3 +1,1376 @@
-from django.test import TestCase
+import asyncio
+import io
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import metrics
+from .models import Profile, Stock, Portfolio, Watchlist
+from .providers import MarketDataProvider
+from .utils import get_multiple_stocks
+
+
+class FakeProvider(MarketDataProvider):
+    """
+    In-memory market-data provider that counts upstream round trips.
+    """
+    def __init__(self, slow=(), missing=()):
+        self.calls = []
+        self.slow = set(slow)
+        self.missing = set(missing)
+        self.release = threading.Event()
+
+    def get_quotes(self, symbols):
+        self.calls.append(('quotes', tuple(symbols)))
+        if self.slow.intersection(symbols):
+            self.release.wait(5)
+        return {
+            sym: {'symbol': sym, 'name': sym, 'price': 110.0, 'open': 100.0}
+            for sym in symbols if sym not in self.missing
+        }
+
+    def get_quote(self, symbol):
+        self.calls.append(('quote', symbol))
+        raise AssertionError("per-symbol lookups should not be used by batched views")
+
+
+def use_provider(test, provider):
+    patcher = mock.patch('main.utils.get_provider', return_value=provider)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class BatchedQuoteFetchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='9999999999', password='pass')
+        Profile.objects.create(user=self.user, phone_number='9999999999')
+        for i in range(20):
+            stock = Stock.objects.create(symbol=f'SYM{i}.NS', name=f'Company {i}')
+            Portfolio.objects.create(user=self.user, stock=stock, quantity=2, avg_price=Decimal('100.00'))
+            Watchlist.objects.create(user=self.user, stock=stock)
+        self.client.force_login(self.user)
+        self.fake = FakeProvider()
+        use_provider(self, self.fake)
+
+    def assertUpstreamCalls(self, url_name, expected):
+        cache.clear()
+        self.fake.calls.clear()
+        response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.fake.calls), expected, self.fake.calls)
+
+    def test_dashboard_upstream_calls(self):
+        # One bulk call for holdings and one for the market overview.
+        self.assertUpstreamCalls('dashboard', 2)
+
+    def test_portfolio_upstream_calls(self):
+        self.assertUpstreamCalls('portfolio', 1)
+
+    def test_watchlist_upstream_calls(self):
+        # One bulk call for the watchlist and one for the popular stocks.
+        self.assertUpstreamCalls('watchlist', 2)
+
+    def test_investment_summary_upstream_calls(self):
+        self.assertUpstreamCalls('investment_summary', 1)
+
+    def test_warm_cache_makes_no_upstream_calls(self):
+        self.client.get(reverse('dashboard'))
+        self.fake.calls.clear()
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(self.fake.calls, [])
+
+    def test_return_shape(self):
+        data = get_multiple_stocks(['SYM1.NS', 'SYM0.NS'])
+        self.assertEqual(list(data), ['SYM1.NS', 'SYM0.NS'])
+        quote = data['SYM0.NS']
+        self.assertEqual(quote['name'], 'Company 0')
+        self.assertEqual(quote['price'], Decimal('110.00'))
+        self.assertEqual(quote['change'], Decimal('10.00'))
+        self.assertEqual(quote['change_percent'], Decimal('10.00'))
+
+
+@override_settings(QUOTE_FETCH_MODE='concurrent', QUOTE_FETCH_CHUNK_SIZE=1, QUOTE_FETCH_DEADLINE=0.2)
+class ConcurrentQuoteFetchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.fake = FakeProvider(slow={'SLOW.NS', 'COLD.NS'})
+        use_provider(self, self.fake)
+        self.addCleanup(self.fake.release.set)
+
+    def test_late_symbols_fall_back_to_their_stale_quote(self):
+        expired = {'symbol': 'SLOW.NS', 'price': Decimal('50.00'), 'fetched_at': 0}
+        cache.set('stock_data_SLOW.NS', expired)
+        cache.set('stock_data_OLD.NS', dict(expired, symbol='OLD.NS'))
+        data = get_multiple_stocks(['FAST.NS', 'SLOW.NS', 'OLD.NS'])
+        self.assertEqual(data['FAST.NS']['price'], Decimal('110.00'))
+        self.assertNotIn('stale', data['FAST.NS'])
+        # Expired but quick to fetch: refreshed within the deadline.
+        self.assertEqual(data['OLD.NS']['price'], Decimal('110.00'))
+        self.assertNotIn('stale', data['OLD.NS'])
+        self.assertTrue(data['SLOW.NS']['stale'])
+        self.assertEqual(data['SLOW.NS']['price'], Decimal('50.00'))
+        counters = metrics.snapshot()
+        self.assertEqual(counters['quote_fetch_timeouts'], 1)
+        self.assertEqual(counters['quote_stale_fallbacks'], 1)
+
+    def test_symbols_claimed_elsewhere_are_not_fetched_again(self):
+        cache.set('stock_data_lock_BUSY.NS', 1)
+        cache.set('stock_data_BUSY.NS', {'symbol': 'BUSY.NS', 'price': Decimal('50.00'), 'fetched_at': 0})
+        data = get_multiple_stocks(['FAST.NS', 'BUSY.NS'])
+        self.assertEqual(self.fake.calls, [('quotes', ('FAST.NS',))])
+        self.assertTrue(data['BUSY.NS']['stale'])
+        self.assertNotIn('quote_fetch_timeouts', metrics.snapshot())
+
+    def test_late_symbols_without_stale_quote_are_omitted(self):
+        data = get_multiple_stocks(['FAST.NS', 'COLD.NS'])
+        self.assertEqual(list(data), ['FAST.NS'])
+        counters = metrics.snapshot()
+        self.assertEqual(counters['quote_fetch_timeouts'], 1)
+        self.assertEqual(counters['quote_fallback_misses'], 1)
+
+
+class QuoteRevalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.fake = FakeProvider(missing={'DELISTED.NS'})
+        use_provider(self, self.fake)
+
+    def test_expired_quote_is_served_stale_and_revalidated_once(self):
+        from . import utils
+        expired = {'symbol': 'RELIANCE.NS', 'name': 'Reliance', 'price': Decimal('50.00'), 'fetched_at': 0}
+        cache.set('stock_data_RELIANCE.NS', expired)
+        with mock.patch.object(utils, '_fetch_pool') as pool:
+            first = utils.get_stock_data('RELIANCE.NS')
+            second = utils.get_stock_data('RELIANCE.NS')
+        self.assertTrue(first['stale'])
+        self.assertEqual(second['price'], Decimal('50.00'))
+        # The second request finds the refresh lock held and does not queue another.
+        self.assertEqual(pool.return_value.submit.call_count, 1)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        from . import utils
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'symbol': 'TCS.NS'}
+
+        leader = threading.Thread(target=utils._single_flight, args=('TCS.NS', slow_fetch))
+        leader.start()
+        started.wait(5)
+        follower_result = []
+        follower = threading.Thread(
+            target=lambda: follower_result.append(utils._single_flight('TCS.NS', slow_fetch)))
+        follower.start()
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(follower_result, [{'symbol': 'TCS.NS'}])
+
+    @override_settings(QUOTE_FETCH_TIMEOUT=10)
+    def test_waiting_for_another_fetch_stops_when_it_fails(self):
+        from . import utils
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing_quote(symbol):
+            started.set()
+            release.wait(5)
+            raise ConnectionError("upstream down")
+
+        with mock.patch.object(self.fake, 'get_quote', side_effect=failing_quote):
+            winner = threading.Thread(target=utils._fetch_one, args=('FLAKY.NS',))
+            winner.start()
+            started.wait(5)
+            threading.Timer(0.2, release.set).start()
+            began = time.monotonic()
+            self.assertIsNone(utils._fetch_one('FLAKY.NS'))
+            winner.join()
+        self.assertLess(time.monotonic() - began, 2)
+
+    def test_failures_are_cached_with_backoff(self):
+        self.assertEqual(get_multiple_stocks(['DELISTED.NS']), {})
+        self.assertEqual(get_multiple_stocks(['DELISTED.NS']), {})
+        self.assertEqual(len(self.fake.calls), 1)
+        self.assertEqual(cache.get('stock_data_failed_DELISTED.NS')['failures'], 1)
+
+        # Once the backoff expires the symbol is retried and the backoff doubles.
+        entry = cache.get('stock_data_failed_DELISTED.NS')
+        cache.set('stock_data_failed_DELISTED.NS', dict(entry, retry_at=0))
+        get_multiple_stocks(['DELISTED.NS'])
+        self.assertEqual(len(self.fake.calls), 2)
+        entry = cache.get('stock_data_failed_DELISTED.NS')
+        self.assertEqual(entry['failures'], 2)
+
+
+class RefreshQuotesCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fake = FakeProvider()
+        use_provider(self, self.fake)
+
+    def test_refreshes_held_watched_and_shared_symbols_by_audience(self):
+        from django.core.management import call_command
+        from .management.commands.refresh_quotes import Command
+
+        users = [User.objects.create_user(username=str(i)) for i in range(3)]
+        held = Stock.objects.create(symbol='HELD.NS', name='Held')
+        watched = Stock.objects.create(symbol='WATCHED.NS', name='Watched')
+        for user in users[:2]:
+            Portfolio.objects.create(user=user, stock=held, quantity=1, avg_price=Decimal('1.00'))
+        Watchlist.objects.create(user=users[0], stock=watched)
+
+        symbols = Command().prioritized_symbols()
+        self.assertLess(symbols.index('HELD.NS'), symbols.index('WATCHED.NS'))
+        self.assertLess(symbols.index('RELIANCE.NS'), symbols.index('HELD.NS'))
+
+        call_command('refresh_quotes', once=True, chunk_size=100, stdout=mock.MagicMock())
+        self.assertEqual(len(self.fake.calls), 1)
+        with override_settings(QUOTE_CACHE_ONLY=True):
+            data = get_multiple_stocks(['HELD.NS', 'WATCHED.NS', 'AAPL'])
+        self.assertEqual(set(data), {'HELD.NS', 'WATCHED.NS', 'AAPL'})
+        self.assertEqual(len(self.fake.calls), 1)
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from .cache_backends import SQLiteCache
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = SQLiteCache(f'{tmp.name}/cache.sqlite3', {'TIMEOUT': 300})
+
+    def test_round_trip(self):
+        self.cache.set_many({'a': {'price': Decimal('1.50')}, 'b': 2})
+        self.assertEqual(self.cache.get('a'), {'price': Decimal('1.50')})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': {'price': Decimal('1.50')}, 'b': 2})
+        self.cache.delete_many(['a'])
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.incr('b', 3), 5)
+
+    def test_add_only_takes_missing_or_expired_keys(self):
+        self.assertTrue(self.cache.add('lock', 1, 60))
+        self.assertFalse(self.cache.add('lock', 2, 60))
+        self.cache.set('expired', 1, 0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('expired', 2, 60))
+        self.assertEqual(self.cache.get('expired'), 2)
+
+
+class ProviderTests(TestCase):
+    def test_simulated_feed_is_deterministic(self):
+        from .providers import SimulatedProvider
+        now = [1000.0]
+        clock = lambda: now[0]
+        a = SimulatedProvider(seed=7, clock=clock)
+        b = SimulatedProvider(seed=7, clock=clock)
+        symbols = [f'SYM{i}' for i in range(2000)]
+        now[0] += 50
+        a.get_quotes(symbols[:10])  # querying more often must not change the path
+        now[0] += 50
+        self.assertEqual(a.get_quotes(symbols), b.get_quotes(symbols))
+        self.assertNotEqual(a.get_quote('SYM0')['price'], SimulatedProvider(seed=8, clock=clock).get_quote('SYM0')['price'])
+
+    def test_simulated_feed_jumps_ahead_without_replaying_ticks(self):
+        import random
+        from .providers import SimulatedProvider
+        now = [0.0]
+        a = SimulatedProvider(seed=7, clock=lambda: now[0])
+        b = SimulatedProvider(seed=7, clock=lambda: now[0])
+        for hours in (1, 9, 30 * 24):
+            now[0] = hours * 3600.0
+            a.get_quote('SYM0')
+        with mock.patch.object(random.Random, 'gauss', autospec=True, side_effect=random.Random.gauss) as gauss:
+            self.assertEqual(b.get_quote('SYM0'), a.get_quote('SYM0'))
+        # 30 days is 2.6 million ticks.
+        self.assertLess(gauss.call_count, 3000)
+
+    def test_replay_feed_follows_recorded_time(self):
+        import tempfile
+        from .providers import ReplayProvider
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('timestamp,symbol,price,open\n0,AAA,10,9\n10,AAA,11,9\n20,AAA,12,9\n5,BBB,50,\n')
+        now = [0.0]
+        provider = ReplayProvider(f.name, speed=2.0, loop=False, clock=lambda: now[0])
+        self.assertEqual(provider.get_quotes(['AAA', 'BBB']), {'AAA': {'symbol': 'AAA', 'name': 'AAA', 'price': 10.0, 'open': 9.0}})
+        now[0] = 6.0  # 12 seconds of recording
+        quotes = provider.get_quotes(['AAA', 'BBB'])
+        self.assertEqual(quotes['AAA']['price'], 11.0)
+        self.assertEqual(quotes['BBB']['price'], 50.0)
+        self.assertIsNone(quotes['BBB']['open'])
+
+    def test_yfinance_bulk_download_is_parsed_per_symbol(self):
+        import pandas as pd
+        from .providers import YFinanceProvider
+        columns = pd.MultiIndex.from_product([['AAPL', 'MSFT'], ['Open', 'Close']])
+        frame = pd.DataFrame([[100.0, 110.0, 200.0, float('nan')]], columns=columns)
+        fake_yf = mock.Mock(**{'download.return_value': frame})
+        with mock.patch.dict('sys.modules', yfinance=fake_yf):
+            quotes = YFinanceProvider().get_quotes(['AAPL', 'MSFT'])
+        self.assertEqual(fake_yf.download.call_count, 1)
+        self.assertEqual(quotes, {'AAPL': {'symbol': 'AAPL', 'name': 'AAPL', 'price': 110.0, 'open': 100.0}})
+
+
+class PortfolioValuationEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_provider(self, FakeProvider())
+        self.user = User.objects.create_user(username='8888888888')
+
+    def add_holdings(self, count):
+        for i in range(Portfolio.objects.count(), count):
+            stock = Stock.objects.create(symbol=f'VAL{i}.NS', name=f'Company {i}')
+            Portfolio.objects.create(user=self.user, stock=stock, quantity=2, avg_price=Decimal('100.00'))
+
+    def test_query_count_does_not_grow_with_holdings(self):
+        from .valuation import PortfolioValuationEngine
+        engine = PortfolioValuationEngine()
+        for count in (1, 40):
+            self.add_holdings(count)
+            engine.value(self.user)  # warm the quote cache
+            with self.assertNumQueries(1):
+                valuation = engine.value(self.user)
+            self.assertEqual(len(valuation.holdings), count)
+
+    def test_totals(self):
+        from .valuation import PortfolioValuationEngine
+        self.add_holdings(3)
+        valuation = PortfolioValuationEngine().value(self.user)
+        self.assertEqual(valuation.total_invested, Decimal('600.00'))
+        self.assertEqual(valuation.current_value, Decimal('660.00'))
+        self.assertEqual(valuation.profit_loss, Decimal('60.00'))
+        self.assertEqual(valuation.pnl_percent, Decimal('10'))
+        self.assertEqual(valuation.holdings[0].pnl, Decimal('20.00'))
+        with self.assertRaises(Exception):
+            valuation.holdings[0].quantity = 5
+
+    def test_missing_quote_is_valued_at_average_price(self):
+        from .valuation import PortfolioValuationEngine
+        self.add_holdings(1)
+        valuation = PortfolioValuationEngine(quote_source=lambda symbols: {}).value(self.user)
+        self.assertEqual(valuation.current_value, Decimal('200.00'))
+        self.assertEqual(valuation.holdings[0].pnl, Decimal('0.00'))
+        self.assertFalse(valuation.holdings[0].priced)
+
+    def test_portfolio_lots_only_get_quoted_prices(self):
+        from .lots import lot_positions
+        self.add_holdings(2)
+        use_provider(self, FakeProvider(missing={'VAL1.NS'}))
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        with mock.patch('main.views.lot_positions', wraps=lot_positions) as lots:
+            self.assertEqual(self.client.get(reverse('portfolio')).status_code, 200)
+        self.assertEqual(lots.call_args.args[1], {'VAL0.NS': Decimal('110.00')})
+
+    def test_views_use_a_fixed_number_of_queries(self):
+        self.client.force_login(self.user)
+        Profile.objects.create(user=self.user)
+        counts = {}
+        for holdings in (1, 25):
+            self.add_holdings(holdings)
+            for name in ('dashboard', 'portfolio', 'investment_summary'):
+                self.client.get(reverse(name))
+                with CaptureQueriesContext(connection) as ctx:
+                    self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+                counts.setdefault(name, set()).add(len(ctx.captured_queries))
+        for name, seen in counts.items():
+            self.assertEqual(len(seen), 1, f'{name} query count varies with holdings: {seen}')
+
+
+class PriceHistoryTests(TestCase):
+    def setUp(self):
+        from .providers import SimulatedProvider
+        self.provider = SimulatedProvider(seed=3)
+        use_provider(self, self.provider)
+        patcher = mock.patch('main.management.commands.ingest_prices.get_provider', return_value=self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ingest_is_idempotent_and_charts_use_one_range_scan(self):
+        from django.core.management import call_command
+        from .models import PriceBar
+        from .timeseries import chart_points, get_series
+
+        call_command('ingest_prices', 'AAA.NS', 'BBB.NS', days=400, chunk_size=100, stdout=mock.MagicMock())
+        count = PriceBar.objects.count()
+        self.assertGreater(count, 2 * 250)
+        call_command('ingest_prices', 'AAA.NS', 'BBB.NS', days=400, stdout=mock.MagicMock())
+        self.assertEqual(PriceBar.objects.count(), count)
+
+        user = User.objects.create_user(username='7777777777')
+        for sym in ('AAA.NS', 'BBB.NS'):
+            Portfolio.objects.create(user=user, stock=Stock.objects.get(symbol=sym), quantity=3, avg_price=Decimal('1'))
+        holdings = list(Portfolio.objects.select_related('stock'))
+        for range_key in ('1W', '1M', '1Y'):
+            with self.assertNumQueries(1):
+                labels, data = chart_points(holdings, Decimal('123.45'), range_key, points=20)
+            self.assertLessEqual(len(data), 21)
+            self.assertEqual((labels[-1], data[-1]), ('Today', 123.45))
+
+        series = get_series('AAA.NS', timezone.now() - timedelta(days=365), points=30)
+        self.assertEqual(len(series), 30)
+
+    def test_ingest_upserts_without_a_conflict_target_where_unsupported(self):
+        from django.core.management import call_command
+        from .models import PriceBar
+
+        # MySQL's ON DUPLICATE KEY UPDATE takes no target; Django refuses one.
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(PriceBar.objects, 'bulk_create') as bulk_create:
+            call_command('ingest_prices', 'AAA.NS', '^NSEI', days=10, stdout=mock.MagicMock())
+        self.assertIsNone(bulk_create.call_args.kwargs['unique_fields'])
+        self.assertTrue(bulk_create.call_args.kwargs['update_conflicts'])
+        # The benchmark gets bars but is not an instrument.
+        self.assertEqual(dict(Stock.objects.values_list('symbol', 'is_active')), {'AAA.NS': True, '^NSEI': False})
+
+    def test_portfolio_series_prices_later_listings_from_their_first_bar(self):
+        from .models import PriceBar
+        from .timeseries import portfolio_series
+
+        start = timezone.now() - timedelta(days=10)
+        old = Stock.objects.create(symbol='OLD.NS', name='Old')
+        new = Stock.objects.create(symbol='NEW.NS', name='New')
+        PriceBar.objects.bulk_create(
+            [PriceBar(stock=old, timestamp=start + timedelta(days=i), open=10, high=10, low=10, close=10)
+             for i in range(6)]
+            + [PriceBar(stock=new, timestamp=start + timedelta(days=i), open=50, high=50, low=50, close=50)
+               for i in range(3, 6)])
+        holdings = [mock.Mock(stock=old, quantity=1), mock.Mock(stock=new, quantity=2)]
+        self.assertEqual([value for _, value in portfolio_series(holdings)], [110] * 6)
+
+    def test_lttb_keeps_endpoints_and_extremes(self):
+        from .timeseries import downsample_lttb
+        points = [(x, 0.0) for x in range(1000)]
+        points[500] = (500, 100.0)
+        sampled = downsample_lttb(points, 10)
+        self.assertEqual(len(sampled), 10)
+        self.assertEqual(sampled[0], points[0])
+        self.assertEqual(sampled[-1], points[-1])
+        self.assertIn((500, 100.0), sampled)
+
+
+class NavSnapshotTests(TestCase):
+    def setUp(self):
+        from .models import PriceBar, Transaction
+        self.today = timezone.localdate()
+        self.user = User.objects.create_user(username='6666666666')
+        Profile.objects.create(user=self.user, balance=Decimal('99600.00'))
+        self.stock = Stock.objects.create(symbol='AAA.NS', name='AAA')
+        Portfolio.objects.create(user=self.user, stock=self.stock, quantity=5, avg_price=Decimal('100.00'))
+        for days_ago, tx_type, quantity, price in ((3, 'BUY', 10, '100.00'), (1, 'SELL', 5, '120.00')):
+            tx = Transaction.objects.create(user=self.user, stock=self.stock, quantity=quantity,
+                                            price=Decimal(price), transaction_type=tx_type)
+            Transaction.objects.filter(pk=tx.pk).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        for days_ago, close in ((3, 100.0), (2, 110.0), (1, 120.0)):
+            PriceBar.objects.create(stock=self.stock, timestamp=timezone.now() - timedelta(days=days_ago),
+                                    open=close, high=close, low=close, close=close)
+
+    def snapshots(self):
+        from .models import NavSnapshot
+        return [(s.date, s.cash, s.holdings_value, s.nav)
+                for s in NavSnapshot.objects.filter(user=self.user).order_by('date')]
+
+    def test_build_replays_positions_cash_and_prices(self):
+        from .nav import build_snapshots
+        self.assertEqual(build_snapshots([self.user.id]), 4)
+        day = lambda n: self.today - timedelta(days=n)
+        self.assertEqual(self.snapshots(), [
+            (day(3), Decimal('99000.00'), Decimal('1000.00'), Decimal('100000.00')),
+            (day(2), Decimal('99000.00'), Decimal('1100.00'), Decimal('100100.00')),
+            (day(1), Decimal('99600.00'), Decimal('600.00'), Decimal('100200.00')),
+            (day(0), Decimal('99600.00'), Decimal('600.00'), Decimal('100200.00')),
+        ])
+        # Nothing left to do until a new day or transaction.
+        self.assertEqual(build_snapshots([self.user.id]), 0)
+
+    def test_new_transaction_invalidates_only_from_its_date(self):
+        from .models import Transaction
+        from .nav import build_snapshots
+        build_snapshots([self.user.id])
+        Transaction.objects.create(user=self.user, stock=self.stock, quantity=1,
+                                   price=Decimal('120.00'), transaction_type='BUY')
+        Profile.objects.filter(user=self.user).update(balance=Decimal('99480.00'))
+        Portfolio.objects.filter(user=self.user).update(quantity=6)
+        self.assertEqual(len(self.snapshots()), 3)
+        self.assertEqual(build_snapshots([self.user.id]), 1)
+        self.assertEqual(self.snapshots()[-1][1:], (Decimal('99480.00'), Decimal('720.00'), Decimal('100200.00')))
+
+
+class OrderExecutionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='trader')
+        Profile.objects.create(user=self.user, balance=Decimal('1000.00'))
+        self.stock = Stock.objects.create(symbol='ORD.NS', name='Orders')
+
+    def balance(self):
+        return Profile.objects.get(user=self.user).balance
+
+    def test_buy_averages_price_and_debits_balance(self):
+        from .orders import execute_buy
+        execute_buy(self.user, self.stock, 2, Decimal('100.00'))
+        execute_buy(self.user, self.stock, 1, Decimal('130.00'))
+        holding = Portfolio.objects.get(user=self.user, stock=self.stock)
+        self.assertEqual((holding.quantity, holding.avg_price), (3, Decimal('110.00')))
+        self.assertEqual(self.balance(), Decimal('670.00'))
+
+    def test_rejected_orders_leave_no_trace(self):
+        from .models import Transaction
+        from .orders import InsufficientFunds, InsufficientHoldings, PriceUnavailable, execute_buy, execute_sell
+        with self.assertRaises(InsufficientFunds):
+            execute_buy(self.user, self.stock, 11, Decimal('100.00'))
+        with self.assertRaises(InsufficientHoldings):
+            execute_sell(self.user, self.stock, 1, Decimal('100.00'))
+        with self.assertRaises(PriceUnavailable):
+            execute_buy(self.user, self.stock, 1, 0)
+        self.assertEqual(self.balance(), Decimal('1000.00'))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(Portfolio.objects.exists())
+
+    def test_selling_everything_removes_the_holding(self):
+        from .orders import execute_buy, execute_sell
+        execute_buy(self.user, self.stock, 2, Decimal('100.00'))
+        execute_sell(self.user, self.stock, 1, Decimal('150.00'))
+        self.assertEqual(Portfolio.objects.get(user=self.user).quantity, 1)
+        execute_sell(self.user, self.stock, 1, Decimal('150.00'))
+        self.assertFalse(Portfolio.objects.exists())
+        self.assertEqual(self.balance(), Decimal('1100.00'))
+
+
+    def test_stale_quote_does_not_fill_a_market_order(self):
+        from .models import Transaction
+        cache.clear()
+        fake = FakeProvider(missing={'ORD.NS'})
+        use_provider(self, fake)
+        self.client.force_login(self.user)
+        cache.set('stock_data_ORD.NS', {'symbol': 'ORD.NS', 'name': 'Orders', 'price': Decimal('50.00'),
+                                        'fetched_at': 0})
+        url = reverse('buy_stock', args=[self.stock.id])
+        with mock.patch('main.utils._fetch_pool'):
+            response = self.client.post(url, {'quantity': 1, 'order_type': 'MARKET'}, follow=True)
+            self.assertContains(response, 'Live price unavailable')
+            self.assertFalse(Transaction.objects.exists())
+
+            # A fresh refetch fills at the live price, not the stale one.
+            fake.missing.clear()
+            cache.delete('stock_data_failed_ORD.NS')
+            self.client.post(url, {'quantity': 1, 'order_type': 'MARKET'})
+        self.assertEqual(Transaction.objects.get().price, Decimal('110.00'))
+
+class ConcurrentOrderTests(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_ledger_survives_contended_orders(self):
+        from .management.commands.stress_orders import run_stress
+        stats = run_stress(users=2, orders=200, threads=16)
+        self.assertEqual(stats['errors'], [])
+        self.assertEqual(stats['violations'], [])
+        self.assertEqual(stats['filled'] + stats['rejected'], 200)
+
+
+class TriggerBookTests(TestCase):
+    def test_crossed_returns_only_reached_triggers(self):
+        from .trigger_book import TriggerBook
+        book = TriggerBook()
+        book.add(1, 'A', Decimal('95.00'), fires_on_fall=True)    # buy limit
+        book.add(2, 'A', Decimal('90.00'), fires_on_fall=True)
+        book.add(3, 'A', Decimal('105.00'), fires_on_fall=False)  # sell limit
+        book.add(4, 'B', Decimal('50.00'), fires_on_fall=True)
+        book.add(5, 'A', Decimal('92.00'), fires_on_fall=True)
+        book.discard(5)
+        self.assertEqual(book.crossed('A', 100), [])
+        self.assertEqual(book.crossed('A', 95), [1])
+        self.assertEqual(sorted(book.crossed('A', 110)), [3])
+        self.assertEqual(book.crossed('A', 80), [2])
+        self.assertEqual(book.crossed('C', 1), [])
+        self.assertEqual(len(book), 1)
+
+    def test_refresh_settles_triggered_orders(self):
+        from django.core.management import call_command
+        from .models import PendingOrder
+        cache.clear()
+        use_provider(self, FakeProvider())  # every quote is 110
+        user = User.objects.create_user(username='limits')
+        Profile.objects.create(user=user, balance=Decimal('1000.00'))
+        stock = Stock.objects.create(symbol='TRIG.NS', name='Trigger')
+
+        def order(side, order_type, trigger, quantity=1):
+            return PendingOrder.objects.create(user=user, stock=stock, side=side, order_type=order_type,
+                                               quantity=quantity, trigger_price=Decimal(trigger))
+        buy_limit = order('BUY', 'LIMIT', '120.00')
+        too_big = order('BUY', 'STOP', '105.00', quantity=100)
+        resting = order('BUY', 'LIMIT', '100.00')
+        cancelled = order('BUY', 'LIMIT', '115.00')
+        cancelled.status = 'CANCELLED'
+        cancelled.save()
+
+        call_command('refresh_quotes', once=True, stdout=mock.MagicMock())
+        status = dict(PendingOrder.objects.values_list('id', 'status'))
+        self.assertEqual(status, {buy_limit.id: 'FILLED', too_big.id: 'REJECTED',
+                                  resting.id: 'OPEN', cancelled.id: 'CANCELLED'})
+        self.assertEqual(PendingOrder.objects.get(id=buy_limit.id).transaction.price, Decimal('110.00'))
+        self.assertEqual(Profile.objects.get(user=user).balance, Decimal('890.00'))
+
+
+    def test_orders_that_fail_unexpectedly_keep_resting(self):
+        from .models import PendingOrder
+        from .orders import settle_pending
+        from .trigger_book import TriggerBook
+        user = User.objects.create_user(username='flaky')
+        Profile.objects.create(user=user, balance=Decimal('1000.00'))
+        stock = Stock.objects.create(symbol='FLAKY.NS', name='Flaky')
+        order = PendingOrder.objects.create(user=user, stock=stock, side='BUY', order_type='LIMIT',
+                                            quantity=1, trigger_price=Decimal('120.00'))
+        book = TriggerBook()
+        book.sync()
+        triggered = book.crossed('FLAKY.NS', 110)
+        with mock.patch('main.orders.execute_buy', side_effect=RuntimeError('database went away')), \
+                self.assertLogs('main.orders', 'ERROR') as logged:
+            self.assertEqual(settle_pending(triggered, {'FLAKY.NS': Decimal('110.00')}), (0, 0))
+        self.assertIn('RuntimeError: database went away', logged.output[0])
+        self.assertEqual(PendingOrder.objects.get(id=order.id).status, 'OPEN')
+        self.assertEqual(book.restore(triggered), 1)
+        self.assertEqual(book.crossed('FLAKY.NS', 110), [order.id])
+
+
+class SIPSchedulerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_provider(self, FakeProvider(missing={'GONE.NS'}))  # every quote is 110
+        self.user = User.objects.create_user(username='saver')
+        Profile.objects.create(user=self.user, balance=Decimal('500.00'))
+        self.stock = Stock.objects.create(symbol='SIP.NS', name='SIP')
+        self.today = timezone.localdate()
+
+    def plan(self, amount, frequency='MONTHLY', stock=None, days_ago=0):
+        from .models import SIPPlan
+        return SIPPlan.objects.create(user=self.user, stock=stock or self.stock, amount=Decimal(amount),
+                                      frequency=frequency, next_run_date=self.today - timedelta(days=days_ago))
+
+    def test_due_plans_settle_once_per_date(self):
+        from .models import SIPPlan, Transaction
+        from .sip import next_run, run_due_plans
+        weekly = self.plan('250.00', 'WEEKLY')
+        small = self.plan('100.00')
+        gone = self.plan('300.00', stock=Stock.objects.create(symbol='GONE.NS', name='Gone'))
+        later = self.plan('300.00', days_ago=-3)
+
+        self.assertEqual(list(run_due_plans(self.today, chunk_size=2)), [(2, 1), (3, 1)])
+        # Only the unpriced plan is still due, and is retried once per run.
+        self.assertEqual(list(run_due_plans(self.today)), [(1, 0)])
+
+        holding = Portfolio.objects.get(user=self.user, stock=self.stock)
+        self.assertEqual((holding.quantity, holding.avg_price), (2, Decimal('110.00')))
+        self.assertEqual(Profile.objects.get(user=self.user).balance, Decimal('280.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+        plans = {p.id: p for p in SIPPlan.objects.all()}
+        self.assertEqual(plans[weekly.id].next_run_date, self.today + timedelta(weeks=1))
+        self.assertEqual(plans[small.id].last_status, "Skipped: amount below one share")
+        self.assertEqual(plans[small.id].next_run_date, next_run(self.today, 'MONTHLY'))
+        self.assertEqual(plans[gone.id].last_status, "Skipped: price unavailable, will retry")
+        self.assertEqual(plans[gone.id].next_run_date, self.today)
+        self.assertIsNone(plans[later.id].last_run_date)
+
+    def test_instalments_are_only_bought_at_fresh_prices(self):
+        from .sip import run_due_plans
+        stale = {'symbol': 'SIP.NS', 'name': 'SIP', 'price': Decimal('50.00'), 'fetched_at': 0}
+        cache.set('stock_data_SIP.NS', stale)
+        cache.set('stock_data_GONE.NS', dict(stale, symbol='GONE.NS'))
+        self.plan('250.00')
+        gone = self.plan('300.00', stock=Stock.objects.create(symbol='GONE.NS', name='Gone'))
+        self.assertEqual(list(run_due_plans(self.today)), [(2, 1)])
+        # Refetched at 110 rather than bought at the stale 50, keeping the company name.
+        self.assertEqual(Portfolio.objects.get(user=self.user).quantity, 2)
+        self.assertEqual(cache.get('stock_data_SIP.NS')['name'], 'SIP')
+        gone.refresh_from_db()
+        self.assertEqual((gone.next_run_date, gone.last_status), (self.today, "Skipped: price unavailable, will retry"))
+
+    def test_missed_dates_catch_up_and_months_clamp(self):
+        from datetime import date
+        from .sip import add_months, run_due_plans
+        self.assertEqual(add_months(date(2024, 1, 31)), date(2024, 2, 29))
+        self.assertEqual(add_months(date(2024, 12, 15)), date(2025, 1, 15))
+        self.plan('110.00', 'WEEKLY', days_ago=15)
+        self.assertEqual(list(run_due_plans(self.today)), [(1, 1), (2, 2), (3, 3)])
+        self.assertEqual(Portfolio.objects.get(user=self.user).quantity, 3)
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        from .models import Transaction
+        self.user = User.objects.create_user(username='history')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.a = Stock.objects.create(symbol='A.NS', name='A')
+        self.b = Stock.objects.create(symbol='B.NS', name='B')
+        txs = Transaction.objects.bulk_create([
+            Transaction(user=self.user, stock=self.a if i % 3 else self.b, quantity=i + 1,
+                        price=Decimal('10.00'), transaction_type='BUY' if i % 2 else 'SELL')
+            for i in range(120)
+        ])
+        # Several rows share each timestamp, so the id tiebreak matters.
+        now = timezone.now()
+        for i, tx in enumerate(txs):
+            tx.timestamp = now - timedelta(hours=i // 4)
+        Transaction.objects.bulk_update(txs, ['timestamp'])
+
+    def test_pages_walk_every_row_once_in_both_directions(self):
+        from .models import Transaction
+        from .pagination import keyset_page
+        qs = Transaction.objects.filter(user=self.user)
+        expected = list(qs.order_by('-timestamp', '-id').values_list('id', flat=True))
+        seen, cursor, pages = [], None, []
+        while True:
+            rows, newer, older = keyset_page(qs, after=cursor, size=50)
+            pages.append(newer)
+            seen += [row.id for row in rows]
+            if not older:
+                break
+            cursor = older
+        self.assertEqual(seen, expected)
+        self.assertIsNone(pages[0])
+        rows, newer, older = keyset_page(qs, before=pages[-1], size=50)
+        self.assertEqual([row.id for row in rows], expected[50:100])
+        self.assertEqual(keyset_page(qs, after='garbage', size=50)[0][0].id, expected[0])
+
+    def test_filtered_page_is_a_fixed_number_of_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('transactions'), {'symbol': 'b.ns', 'type': 'SELL'})
+        rows = response.context['transactions']
+        self.assertTrue(rows)
+        self.assertTrue(all(tx.stock_id == self.b.id and tx.transaction_type == 'SELL' for tx in rows))
+        self.assertLessEqual(len(ctx.captured_queries), 6)
+
+        response = self.client.get(reverse('transactions'), {'after': response.context['older_cursor'] or ''})
+        self.assertEqual(len(response.context['transactions']), 50)
+
+
+class StatementExportTests(TestCase):
+    def setUp(self):
+        from .orders import execute_buy, execute_sell
+        self.user = User.objects.create_user(username='audited')
+        Profile.objects.create(user=self.user, balance=Decimal('1000.00'))
+        stock = Stock.objects.create(symbol='STMT.NS', name='Statement')
+        execute_buy(self.user, stock, 2, Decimal('100.00'))
+        execute_buy(self.user, stock, 2, Decimal('120.00'))
+        execute_sell(self.user, stock, 3, Decimal('130.00'))
+
+    def test_rows_carry_running_balance_and_realized_pnl(self):
+        from .statements import HEADER, statement_rows
+        # Balance, net flow, then two bounded chunk queries of at most two rows.
+        with self.assertNumQueries(4):
+            rows = list(statement_rows(self.user.id, chunk_size=2))
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual([row[6] for row in rows[1:]], [Decimal('800.00'), Decimal('560.00'), Decimal('950.00')])
+        self.assertEqual([row[7] for row in rows[1:]], ['', '', Decimal('70.00')])
+
+    def test_endpoint_and_command_stream_the_same_csv(self):
+        import gzip
+        import os
+        import tempfile
+        from django.core.management import call_command
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('statement_export'))
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        with tempfile.TemporaryDirectory() as out:
+            call_command('export_statements', 'audited', output_dir=out, workers=1, stdout=mock.MagicMock())
+            with gzip.open(os.path.join(out, f'statement-{self.user.id}.csv.gz'), 'rt', newline='') as f:
+                self.assertEqual(f.read(), body)
+        self.assertEqual(len(body.splitlines()), 4)
+
+
+class FifoLotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='fifo')
+        Profile.objects.create(user=self.user, balance=Decimal('10000.00'))
+        self.stock = Stock.objects.create(symbol='FIFO.NS', name='Fifo')
+
+    def trade(self):
+        from .orders import execute_buy, execute_sell
+        execute_buy(self.user, self.stock, 10, Decimal('100.00'))
+        execute_buy(self.user, self.stock, 10, Decimal('120.00'))
+        first = execute_sell(self.user, self.stock, 15, Decimal('130.00'))
+        second = execute_sell(self.user, self.stock, 2, Decimal('110.00'))
+        return first, second
+
+    def test_sells_consume_oldest_lots_and_book_realized_pnl(self):
+        from .lots import lot_positions
+        from .models import Lot
+        first, second = self.trade()
+        # 10 @ 100 and 5 @ 120, then 2 more @ 120.
+        self.assertEqual(first.realized_pnl, Decimal('350.00'))
+        self.assertEqual(second.realized_pnl, Decimal('-20.00'))
+        self.assertEqual(list(Lot.objects.values_list('quantity', 'cost_price')), [(3, Decimal('120.00'))])
+        self.assertEqual(Profile.objects.get(user=self.user).realized_pnl, Decimal('330.00'))
+        position = lot_positions(self.user, {'FIFO.NS': Decimal('125.00')})[self.stock.id]
+        self.assertEqual((position.quantity, position.cost, position.unrealized, position.holding_days),
+                         (3, Decimal('360.00'), Decimal('15.00'), 0))
+
+    def test_rebuild_replays_history_to_the_same_state(self):
+        from django.core.management import call_command
+        from .models import Lot, Transaction
+        self.trade()
+        live = (list(Lot.objects.values_list('quantity', 'cost_price', 'opened_at')),
+                list(Transaction.objects.order_by('id').values_list('realized_pnl', flat=True)))
+        Lot.objects.all().delete()
+        Transaction.objects.update(realized_pnl=None)
+        Profile.objects.update(realized_pnl=0)
+
+        call_command('rebuild_lots', stdout=mock.MagicMock())
+        rebuilt = (list(Lot.objects.values_list('quantity', 'cost_price', 'opened_at')),
+                   list(Transaction.objects.order_by('id').values_list('realized_pnl', flat=True)))
+        self.assertEqual(rebuilt, live)
+        self.assertEqual(Profile.objects.get(user=self.user).realized_pnl, Decimal('330.00'))
+
+
+class ApiConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fake = FakeProvider()
+        use_provider(self, self.fake)
+        self.user = User.objects.create_user(username='poller')
+        Profile.objects.create(user=self.user)
+        self.stock = Stock.objects.create(symbol='API.NS', name='Api')
+        self.client.force_login(self.user)
+
+    def test_unchanged_poll_is_a_304_without_valuation(self):
+        from .orders import execute_buy
+        execute_buy(self.user, self.stock, 2, Decimal('100.00'))
+        url = reverse('api_portfolio')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['fields'][:2], ['symbol', 'quantity'])
+        self.assertEqual(first.json()['rows'][0][:2], ['API.NS', 2])
+
+        with mock.patch('main.api.PortfolioValuationEngine.value_rows') as value_rows:
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+        self.assertFalse(again.content)
+        value_rows.assert_not_called()
+
+        execute_buy(self.user, self.stock, 1, Decimal('100.00'))
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['rows'][0][1], 3)
+
+    def test_quote_etag_follows_fetch_time(self):
+        url = reverse('api_quotes')
+        first = self.client.get(url, {'symbols': 'a.ns,B.NS,a.ns'})
+        self.assertEqual([row[0] for row in first.json()['rows']], ['A.NS', 'B.NS'])
+        self.assertEqual(self.client.get(url, {'symbols': 'A.NS,B.NS'},
+                                         HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        cache.clear()
+        with mock.patch('main.utils.time.time', return_value=first.json()['rows'][0][4] + 60):
+            refetched = self.client.get(url, {'symbols': 'A.NS,B.NS'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(refetched.status_code, 200)
+
+    def test_quote_etag_follows_stale_flag(self):
+        url = reverse('api_quotes')
+        quote = {'symbol': 'A.NS', 'price': 10.0, 'change': 0.0, 'change_percent': 0.0, 'fetched_at': 1000.0}
+        with mock.patch('main.api.get_multiple_stocks', return_value={'A.NS': quote}):
+            first = self.client.get(url, {'symbols': 'A.NS'})
+        with mock.patch('main.api.get_multiple_stocks', return_value={'A.NS': dict(quote, stale=True)}):
+            marked = self.client.get(url, {'symbols': 'A.NS'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(marked.status_code, 200)
+
+    def test_lot_rebuild_changes_the_transactions_etag(self):
+        from .lots import rebuild_user_lots
+        from .orders import execute_buy, execute_sell
+        execute_buy(self.user, self.stock, 2, Decimal('100.00'))
+        execute_sell(self.user, self.stock, 1, Decimal('110.00'))
+        url = reverse('api_transactions')
+        first = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_user_lots(self.user.id)
+        rebuilt = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(rebuilt.status_code, 200)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_watchlist')).status_code, 403)
+
+
+class QuoteStreamTests(TestCase):
+    def test_hub_fans_out_one_poll_and_coalesces(self):
+        from .streaming import QuoteHub, event_stream
+
+        fetches = []
+
+        def fetch(symbols):
+            fetches.append(sorted(symbols))
+            return {}
+
+        async def scenario():
+            hub = QuoteHub(interval=60, fetch=fetch)
+            a, b = hub.subscribe(['A.NS', 'B.NS']), hub.subscribe(['B.NS'])
+            await asyncio.sleep(0)
+            hub.publish({'B.NS': {'price': 10, 'change_percent': 1}})
+            hub.publish({'B.NS': {'price': 10, 'change_percent': 1}})
+            hub.publish({'B.NS': {'price': 11, 'change_percent': 2}})
+            self.assertEqual(await b.next_batch(1), {'B.NS': {'price': 11, 'change_percent': 2}})
+            self.assertEqual(a.coalesced, 1)
+            self.assertEqual(await b.next_batch(0.01), {})
+            hub.unsubscribe(a)
+            hub.unsubscribe(b)
+            self.assertFalse(hub.subscribers)
+
+            stream = event_stream(hub, ['C.NS'], heartbeat=0.01)
+            self.assertTrue((await stream.__anext__()).startswith('retry:'))
+            self.assertEqual(await stream.__anext__(), ': ping\n\n')
+            hub.publish({'C.NS': {'price': 5, 'change_percent': 0, 'fetched_at': 1}})
+            self.assertEqual(await stream.__anext__(), 'event: quotes\ndata: {"C.NS":[5,0,1]}\n\n')
+            await stream.aclose()
+            self.assertFalse(hub.subscribers)
+            hub._task.cancel()
+
+        asyncio.run(scenario())
+        self.assertEqual(fetches, [['A.NS', 'B.NS']])
+
+    def test_poll_keeps_company_names(self):
+        from .streaming import _fetch
+
+        use_provider(self, FakeProvider())
+        Stock.objects.create(symbol='NAMED.NS', name='Named Industries')
+        self.assertEqual(_fetch(['NAMED.NS'])['NAMED.NS']['name'], 'Named Industries')
+
+    def test_failed_poll_is_logged_with_its_traceback(self):
+        from .streaming import QuoteHub
+
+        async def scenario():
+            hub = QuoteHub(interval=60, fetch=mock.Mock(side_effect=ConnectionError("down")))
+            hub.subscribe(['A.NS'])
+            await asyncio.sleep(0.1)
+            hub._task.cancel()
+
+        with self.assertLogs('main.streaming', 'ERROR') as logged:
+            asyncio.run(scenario())
+        self.assertIn('ConnectionError', logged.output[0])
+
+    def test_stream_needs_asgi(self):
+        user = User.objects.create_user(username='streamer', password='pw')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('quote_stream')).status_code, 501)
+
+
+class InstrumentSearchTests(TestCase):
+    def setUp(self):
+        # The index is only invalidated once the master change commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reliance = Stock.objects.create(symbol='RELIANCE.NS', name='Reliance Industries Ltd',
+                                                 exchange='NSE', isin='INE002A01018')
+            self.relaxo = Stock.objects.create(symbol='RELAXO.NS', name='Relaxo Footwears Ltd', exchange='NSE')
+            self.tata = Stock.objects.create(symbol='TATAMOTORS.NS', name='Tata Motors Ltd', exchange='NSE')
+            Stock.objects.create(symbol='OLD.NS', name='Delisted Industries', is_active=False)
+        self.user = User.objects.create_user(username='searcher', password='pw')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def test_search_ranks_symbols_then_names(self):
+        from . import instruments
+
+        self.assertEqual([i.symbol for i in instruments.search('rel')], ['RELAXO.NS', 'RELIANCE.NS'])
+        self.assertEqual([i.symbol for i in instruments.search('RELIANCE.NS')], ['RELIANCE.NS'])
+        self.assertEqual([i.symbol for i in instruments.search('tata mot')], ['TATAMOTORS.NS'])
+        self.assertEqual([i.symbol for i in instruments.search('industries')], ['RELIANCE.NS'])
+        self.assertEqual([i.symbol for i in instruments.search('ltd', limit=2)], ['RELAXO.NS', 'RELIANCE.NS'])
+        self.assertEqual(instruments.resolve('ine002a01018').symbol, 'RELIANCE.NS')
+        self.assertIsNone(instruments.resolve('OLD.NS'))
+
+    def test_index_rebuilds_when_master_changes(self):
+        from . import instruments
+
+        self.assertIsNone(instruments.resolve('INFY.NS'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            Stock.objects.create(symbol='INFY.NS', name='Infosys Ltd')
+            self.assertIsNone(instruments.resolve('INFY.NS'))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(instruments.resolve('infy.ns').name, 'Infosys Ltd')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tata.is_active = False
+            self.tata.save()
+        self.assertEqual(instruments.search('tata'), [])
+
+    def test_validation_and_autocomplete_stay_off_the_network(self):
+        with mock.patch('main.views.get_stock_data') as fetch:
+            self.client.get(reverse('add_watchlist', args=['reliance.ns']))
+            self.client.get(reverse('add_watchlist', args=['NOPE.NS']))
+        fetch.assert_not_called()
+        self.assertEqual(list(Watchlist.objects.filter(user=self.user).values_list('stock__symbol', flat=True)),
+                         ['RELIANCE.NS'])
+        self.assertFalse(Stock.objects.filter(symbol='NOPE.NS').exists())
+
+        rows = self.client.get(reverse('api_instruments'), {'q': 'tata'}).json()['rows']
+        self.assertEqual(rows, [['TATAMOTORS.NS', 'Tata Motors Ltd', 'NSE', '', 'INR']])
+
+
+class UniverseLoaderTests(TestCase):
+    NSE = ("SYMBOL,NAME OF COMPANY, SERIES, DATE OF LISTING, PAID UP VALUE, MARKET LOT, ISIN NUMBER, FACE VALUE\n"
+           "RELIANCE,Reliance Industries Limited,EQ,29-NOV-1995,10,1,INE002A01018,10\n"
+           "TCS,Tata Consultancy Services Limited,EQ,25-AUG-2004,1,1,INE467B01029,1\n")
+    NASDAQ = ("Symbol|Security Name|Market Category|Test Issue|Financial Status|Round Lot Size|ETF|NextShares\n"
+              "AAPL|Apple Inc. - Common Stock|Q|N|N|100|N|N\n"
+              "ZAZZT|Tick Pilot Test Stock|G|Y|N|100|N|N\n"
+              "File Creation Time: 0101202612:00|||||||\n")
+
+    def load(self, nse, nasdaq=None):
+        from .universe import UniverseLoader, parse_nasdaq, parse_nse
+
+        loader = UniverseLoader(chunk_size=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            loader.load('NSE', parse_nse(io.StringIO(nse)))
+            if nasdaq:
+                loader.load('NASDAQ', parse_nasdaq(io.StringIO(nasdaq)))
+            loader.finish()
+        return loader
+
+    @skipUnlessDBFeature('supports_update_conflicts')
+    def test_upserts_and_deactivates_delisted(self):
+        from . import instruments
+
+        stale = Stock.objects.create(symbol='TCS.NS', name='Old name')
+        loader = self.load(self.NSE, self.NASDAQ)
+        self.assertEqual((loader.upserted, loader.deactivated), (3, 0))
+        stale.refresh_from_db()
+        self.assertEqual((stale.name, stale.exchange, stale.isin), ('Tata Consultancy Services Limited', 'NSE',
+                                                                    'INE467B01029'))
+        self.assertEqual(instruments.resolve('AAPL').currency, 'USD')
+        self.assertIsNone(instruments.resolve('ZAZZT'))
+
+        loader = self.load(self.NSE.rsplit('TCS', 1)[0])
+        self.assertEqual((loader.upserted, loader.deactivated), (1, 1))
+        self.assertFalse(Stock.objects.get(symbol='TCS.NS').is_active)
+        self.assertTrue(Stock.objects.get(symbol='AAPL').is_active)
+        self.assertIsNone(instruments.resolve('TCS.NS'))
+        self.assertEqual(Stock.objects.count(), 3)
+
+
+    def test_upserts_without_a_conflict_target_where_unsupported(self):
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(Stock.objects, 'bulk_create') as bulk_create:
+            self.load(self.NSE)
+        self.assertIsNone(bulk_create.call_args.kwargs['unique_fields'])
+        self.assertTrue(bulk_create.call_args.kwargs['update_conflicts'])
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_provider(self, FakeProvider())
+        self.user = User.objects.create_user(username='fragments')
+        Profile.objects.create(user=self.user, balance=Decimal('5000.00'))
+        self.stock = Stock.objects.create(symbol='FRAG.NS', name='Fragment')
+        self.client.force_login(self.user)
+
+    def test_repeat_loads_skip_queries_and_templates(self):
+        for name in ('dashboard', 'watchlist'):
+            self.client.get(reverse(name))
+            with CaptureQueriesContext(connection) as queries, \
+                    mock.patch('main.fragments.render_to_string') as render:
+                self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+            render.assert_not_called()
+            # Only the session, the user and the nav bar's balance remain.
+            self.assertLessEqual(len(queries), 3, [q['sql'] for q in queries])
+
+    def test_user_changes_invalidate_their_fragments(self):
+        from .orders import execute_buy
+
+        other = User.objects.create_user(username='bystander')
+        Profile.objects.create(user=other)
+        self.assertContains(self.client.get(reverse('dashboard')), '₹5000.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            execute_buy(self.user, self.stock, 10, Decimal('110.00'))
+            Watchlist.objects.create(user=self.user, stock=self.stock)
+        self.assertContains(self.client.get(reverse('dashboard')), '₹3900.00')
+        self.assertContains(self.client.get(reverse('watchlist')), 'data-live-price="FRAG.NS"')
+
+        self.client.force_login(other)
+        self.assertNotContains(self.client.get(reverse('watchlist')), 'data-live-price="FRAG.NS"')
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        use_provider(self, FakeProvider())
+        self.user = User.objects.create_user(username='measured')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def test_dashboard_breakdown_is_recorded_per_view(self):
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        state = metrics.export()
+        view = (('view', 'dashboard'),)
+        buckets, counts, total = state['histograms']['request_duration_seconds', view]
+        self.assertEqual(sum(counts), 2)
+        self.assertGreater(state['histograms']['request_render_seconds', view][2], 0)
+        self.assertGreater(state['histograms']['request_db_queries', view][2], 0)
+        self.assertEqual(state['counters']['upstream_calls', view], 1)
+        self.assertEqual(state['counters']['quote_cache_misses', view], 6)
+        self.assertEqual(state['counters']['quote_cache_hits', view], 6)
+        self.assertEqual(state['counters']['responses', (('status', '200'), ('view', 'dashboard'))], 2)
+        self.assertEqual(sum(state['histograms']['upstream_fetch_seconds', (('call', 'quotes'),)][1]), 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_sums_workers_in_prometheus_format(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.get(reverse('watchlist'))
+        metrics.publish(force=True)
+        cache.set('metrics:slot:5', 'other')
+        cache.set('metrics:worker:other', metrics.export())
+
+        body = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('# TYPE tradex_request_duration_seconds histogram', body)
+        self.assertIn('tradex_request_duration_seconds_count{view="watchlist"} 2', body)
+        self.assertIn('tradex_responses_total{status="200",view="watchlist"} 2', body)
+        self.assertIn('tradex_request_db_queries_bucket{view="watchlist",le="+Inf"} 2', body)
+
+    @override_settings(METRICS_WORKER_SLOTS=2)
+    def test_workers_claim_their_own_slots(self):
+        metrics.publish(force=True)
+        parent = metrics.worker_id()
+        with mock.patch('main.metrics.os.getpid', return_value=-1):
+            # A worker forked from a preloaded parent takes its own id and slot.
+            self.assertNotEqual(metrics.worker_id(), parent)
+            metrics.publish(force=True)
+            self.assertEqual(set(cache.get_many(['metrics:slot:0', 'metrics:slot:1']).values()),
+                             {parent, metrics.worker_id()})
+
+        with mock.patch('main.metrics.os.getpid', return_value=-2), \
+                self.assertLogs('main.metrics', 'WARNING'):
+            metrics.publish(force=True)
+            self.assertIsNone(cache.get(f'metrics:worker:{metrics.worker_id()}'))
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_log_lists_top_queries(self):
+        with self.assertLogs('main.middleware', 'WARNING') as logged:
+            self.client.get(reverse('portfolio'))
+        lines = logged.records[0].getMessage().splitlines()
+        self.assertTrue(lines[0].startswith('Slow request: GET /portfolio/ (portfolio)'))
+        self.assertIn('SELECT', lines[1])
+
+
+class BenchFlowsTests(TestCase):
+    def test_compare_flags_latency_and_query_regressions(self):
+        from .management.commands.bench_flows import compare
+
+        baseline = {'views': {'dashboard': {'p95_ms': 10.0, 'queries': 4.0},
+                              'portfolio': {'p95_ms': 20.0, 'queries': 6.0}}}
+        results = {'views': {'dashboard': {'p95_ms': 12.0, 'queries': 4.0},
+                             'portfolio': {'p95_ms': 21.0, 'queries': 9.0},
+                             'watchlist': {'p95_ms': 99.0, 'queries': 50.0}}}
+        self.assertEqual(compare(results, baseline, 0.25), ['portfolio: queries 6.0 -> 9.0'])
+        self.assertEqual(compare(results, baseline, 0.1), ['dashboard: p95 10.0ms -> 12.0ms',
+                                                           'portfolio: queries 6.0 -> 9.0'])
+
+
+@override_settings(LOGIN_ATTEMPTS_PER_PHONE=3, LOGIN_ATTEMPTS_PER_IP=5)
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='9876543210', password='right')
+        Profile.objects.create(user=self.user, phone_number='9876543210')
+
+    def attempt(self, password, phone='98765 43210', ip='198.51.100.1'):
+        from django.contrib.auth import authenticate
+        from django.test import RequestFactory
+
+        request = RequestFactory().post('/login/', REMOTE_ADDR=ip)
+        return authenticate(request, username=phone, password=password), request
+
+    def test_over_limit_attempts_are_refused_before_hashing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.attempt('right')[0], self.user)
+        self.assertEqual(len(queries), 1)
+
+        with mock.patch('django.contrib.auth.base_user.AbstractBaseUser.check_password',
+                        return_value=False) as check:
+            for _ in range(3):
+                self.assertIsNone(self.attempt('wrong')[0])
+            self.assertEqual(check.call_count, 3)
+            user, request = self.attempt('right')
+        self.assertIsNone(user)
+        self.assertTrue(request.login_throttled)
+        self.assertEqual(check.call_count, 3)
+
+        # Another phone from a fresh address is unaffected; the shared
+        # address runs out after five attempts in all.
+        self.assertFalse(getattr(self.attempt('x', phone='9000000000', ip='198.51.100.2')[1], 'login_throttled', False))
+        self.assertTrue(self.attempt('x', phone='9000000001')[1].login_throttled)
+
+    @override_settings(LOGIN_TRUSTED_PROXIES=1)
+    def test_per_ip_limit_counts_the_forwarded_client(self):
+        from django.contrib.auth import authenticate
+        from django.test import RequestFactory
+        from .auth_backends import client_ip
+
+        factory = RequestFactory()
+        self.assertEqual(client_ip(factory.get('/', REMOTE_ADDR='10.0.0.1',
+                                               HTTP_X_FORWARDED_FOR='1.2.3.4, 198.51.100.7')), '198.51.100.7')
+        self.assertEqual(client_ip(factory.get('/', REMOTE_ADDR='10.0.0.1')), '10.0.0.1')
+        with override_settings(LOGIN_TRUSTED_PROXIES=0):
+            self.assertEqual(client_ip(factory.get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4')),
+                             '10.0.0.1')
+
+        # Clients behind the same proxy each get their own allowance.
+        for i in range(6):
+            request = factory.post('/login/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'198.51.100.{i}')
+            authenticate(request, username=f'900000000{i}', password='x')
+            self.assertFalse(getattr(request, 'login_throttled', False))
+
+    def test_login_view_reports_throttling(self):
+        for _ in range(4):
+            response = self.client.post(reverse('login'), {'phone_number': '9876543210', 'password': 'nope'},
+                                        follow=True)
+        self.assertContains(response, 'Too many login attempts')
+
+
+class RiskMetricsTests(TestCase):
+    def setUp(self):
+        import numpy as np
+
+        cache.clear()
+        self.np = np
+        self.returns = np.random.default_rng(7).normal(0.0005, 0.01, 120)
+        use_provider(self, FakeProvider())
+        self.user = User.objects.create_user(username='risk')
+        Profile.objects.create(user=self.user)
+
+    def test_compute_matches_definitions(self):
+        from .risk import compute
+
+        np = self.np
+        market = 100 * np.cumprod(np.concatenate([[1], 1 + self.returns]))
+        leveraged = 100 * np.cumprod(np.concatenate([[1], 1 + 2 * self.returns]))
+        prices = np.column_stack([leveraged, market])
+        indices = np.column_stack([market, np.full(len(market), np.nan)])
+        result = compute(prices, np.array([0.5, 0.5]), indices)
+
+        portfolio = 1.5 * self.returns
+        self.assertAlmostEqual(result['betas'][0], 1.5)
+        self.assertIsNone(result['betas'][1])
+        self.assertAlmostEqual(result['volatility'], portfolio.std(ddof=1) * np.sqrt(252))
+        self.assertAlmostEqual(result['var_historical'], -np.percentile(portfolio, 5))
+        self.assertEqual(result['correlation'], [[1.0, 1.0], [1.0, 1.0]])
+        growth, peak, worst = 1.0, 1.0, 0.0
+        for r in portfolio:
+            growth *= 1 + r
+            peak = max(peak, growth)
+            worst = max(worst, 1 - growth / peak)
+        self.assertAlmostEqual(result['max_drawdown'], worst)
+
+    def test_summary_shows_cached_metrics_per_portfolio_version(self):
+        from . import risk
+        from .models import PriceBar
+
+        np = self.np
+        start = timezone.now() - timedelta(days=len(self.returns) + 5)
+        closes = 100 * np.cumprod(1 + self.returns)
+        for symbol, scale, skip in (('RSKA.NS', 1, None), ('RSKB.NS', 3, None), ('^NSEI', 1, 10)):
+            stock = Stock.objects.create(symbol=symbol, name=symbol)
+            PriceBar.objects.bulk_create([
+                PriceBar(stock=stock, timestamp=start + timedelta(days=i), open=c, high=c, low=c, close=c)
+                for i, c in enumerate((closes * scale).tolist()) if i != skip
+            ])
+        stock = Stock.objects.get(symbol='RSKA.NS')
+        with self.captureOnCommitCallbacks(execute=True):
+            Portfolio.objects.create(user=self.user, stock=stock, quantity=5, avg_price=Decimal('100.00'))
+        holdings = list(Portfolio.objects.filter(user=self.user).select_related('stock'))
+
+        result = risk.portfolio_risk(self.user, holdings)
+        # The index's missing day is carried over, which only blurs two returns.
+        self.assertAlmostEqual(result['betas']['NIFTY 50'], 1.0, places=1)
+        self.assertIsNone(result['betas']['S&P 500'])
+        self.assertEqual(result['symbols'], ['RSKA.NS'])
+        with self.assertNumQueries(0):
+            self.assertEqual(risk.portfolio_risk(self.user, holdings), result)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Portfolio.objects.create(user=self.user, stock=Stock.objects.get(symbol='RSKB.NS'),
+                                     quantity=5, avg_price=Decimal('300.00'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('investment_summary'))
+        self.assertContains(response, 'Beta vs NIFTY 50')
+        self.assertEqual(response.context['risk']['symbols'], ['RSKA.NS', 'RSKB.NS'])
+        self.assertContains(response, 'Correlation of Daily Returns')
+
+
+class SIPProjectionTests(TestCase):
+    def setUp(self):
+        import numpy as np
+        from .models import PriceBar
+
+        cache.clear()
+        self.np = np
+        self.user = User.objects.create_user(username='projector')
+        with self.captureOnCommitCallbacks(execute=True):
+            stock = Stock.objects.create(symbol='PROJ.NS', name='Projection')
+            Stock.objects.create(symbol='NOHIST.NS', name='No History')
+        closes = 100 * np.cumprod(1 + np.random.default_rng(3).normal(0.0005, 0.01, 300))
+        start = timezone.now() - timedelta(days=320)
+        PriceBar.objects.bulk_create([
+            PriceBar(stock=stock, timestamp=start + timedelta(days=i), open=c, high=c, low=c, close=c)
+            for i, c in enumerate(closes.tolist())
+        ])
+        self.client.force_login(self.user)
+
+    def test_simulate_compounds_each_instalment(self):
+        from .projection import bands, simulate
+
+        np = self.np
+        corpus = simulate(np.log([1.1]), 3, 4, np.random.default_rng(0), np.array([1, 3]))
+        self.assertEqual(corpus.shape, (2, 4))
+        np.testing.assert_allclose(corpus[:, 0], [1.1, ((1.1 + 1) * 1.1 + 1) * 1.1], rtol=1e-6)
+        np.testing.assert_allclose(bands(np.arange(100, dtype=np.float32)[None, :]), [[10, 50, 90]])
+
+    def test_projection_bands_are_memoized_across_amounts(self):
+        url = reverse('api_sip_projection')
+        params = {'symbol': 'proj.ns', 'amount': '1000', 'frequency': 'MONTHLY', 'years': '2'}
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['symbol'], body['paths']), ('PROJ.NS', 10000))
+        rows = [dict(zip(body['fields'], row)) for row in body['rows']]
+        self.assertEqual(len(rows), 24)
+        self.assertEqual((rows[-1]['period'], rows[-1]['invested']), (24, 24000))
+        self.assertTrue(all(r['p10'] <= r['p50'] <= r['p90'] for r in rows))
+
+        with mock.patch('main.projection.simulate') as simulate:
+            doubled = self.client.get(url, dict(params, amount='2000')).json()
+        simulate.assert_not_called()
+        self.assertAlmostEqual(doubled['rows'][-1][4], 2 * body['rows'][-1][4], delta=0.02)
+
+        self.assertEqual(self.client.get(url, dict(params, symbol='NOPE')).status_code, 404)
+        self.assertEqual(self.client.get(url, dict(params, symbol='NOHIST.NS')).status_code, 404)
+        self.assertEqual(self.client.get(url, dict(params, frequency='DAILY')).status_code, 400)
+
+    @override_settings(RISK_LOOKBACK_DAYS=100)
+    def test_projection_reads_its_own_lookback_after_risk_metrics(self):
+        from .projection import unit_projection
+        from .risk import load_closes
+
+        # The risk metrics cache a shorter window of the same symbol first.
+        _, risk_closes = load_closes(['PROJ.NS'], settings.RISK_LOOKBACK_DAYS)['PROJ.NS']
+        self.assertLess(len(risk_closes), 100)
+        self.assertEqual(unit_projection('PROJ.NS', 'MONTHLY', 1)['history_days'], 300)
+        _, again = load_closes(['PROJ.NS'], settings.RISK_LOOKBACK_DAYS)['PROJ.NS']
+        self.assertEqual(len(again), len(risk_closes))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.cache import cache
+
+
+class SlidingWindow:
+    """
+    Approximate sliding-window counter kept in the shared cache: one
+    counter per fixed window, with the previous window's count weighted by
+    how much of it still overlaps the sliding one. Two small cache entries
+    per key, whatever the traffic.
+    """
+
+    def __init__(self, prefix, limit, window, clock=time.time):
+        self.prefix = prefix
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+
+    def _keys(self, key):
+        now = self.clock()
+        slot, offset = divmod(now, self.window)
+        slot = int(slot)
+        return (f'{self.prefix}:{key}:{slot}', f'{self.prefix}:{key}:{slot - 1}',
+                1 - offset / self.window)
+
+    def hit(self, key):
+        """
+        Counts one attempt and returns the windowed total including it.
+        """
+        current, previous, overlap = self._keys(key)
+        cache.add(current, 0, self.window * 2)
+        try:
+            count = cache.incr(current)
+        except ValueError:
+            # Evicted between add and incr; start the window again.
+            cache.set(current, 1, self.window * 2)
+            count = 1
+        return count + (cache.get(previous) or 0) * overlap
+
+    def clear(self, key):
+        current, previous, _ = self._keys(key)
+        cache.delete_many([current, previous])
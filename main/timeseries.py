@@ -0,0 +1,140 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import PriceBar
+
+# Chart ranges offered by the portfolio views: lookback and bar interval.
+CHART_RANGES = {
+    '1W': (timedelta(days=7), '1d'),
+    '1M': (timedelta(days=30), '1d'),
+    '1Y': (timedelta(days=365), '1d'),
+    '5Y': (timedelta(days=5 * 365), '1d'),
+}
+DEFAULT_CHART_POINTS = 60
+
+
+def downsample_lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of [(x, y), ...] sorted by x.
+    Keeps the first and last points and the visually significant ones in
+    between, in O(n).
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third vertex of the triangle.
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        span = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in span) / len(span)
+        avg_y = sum(p[1] for p in span) / len(span)
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def downsample_minmax(points, buckets):
+    """
+    Keeps the minimum and maximum of each of `buckets` equal-width buckets,
+    in x order, so spikes survive downsampling.
+    """
+    n = len(points)
+    if buckets * 2 >= n or buckets < 1:
+        return list(points)
+    size = n / buckets
+    sampled = []
+    for i in range(buckets):
+        chunk = points[int(i * size):int((i + 1) * size)]
+        if not chunk:
+            continue
+        lo = min(chunk, key=lambda p: p[1])
+        hi = max(chunk, key=lambda p: p[1])
+        sampled.extend(sorted({lo, hi}))
+    return sampled
+
+
+def _x(ts):
+    return ts.timestamp()
+
+
+def get_series(symbol, start, end=None, interval='1d', points=DEFAULT_CHART_POINTS, method='lttb'):
+    """
+    Closing prices for one symbol between start and end, downsampled to at
+    most `points` (timestamp, close) pairs with one indexed range scan.
+    """
+    rows = PriceBar.objects.filter(stock__symbol=symbol, interval=interval, timestamp__gte=start)
+    if end is not None:
+        rows = rows.filter(timestamp__lt=end)
+    raw = [(_x(ts), close, ts) for ts, close in rows.order_by('timestamp').values_list('timestamp', 'close')]
+    return _downsample(raw, points, method)
+
+
+def _downsample(raw, points, method):
+    by_x = {x: ts for x, _, ts in raw}
+    pairs = [(x, y) for x, y, _ in raw]
+    sampled = downsample_minmax(pairs, max(1, points // 2)) if method == 'minmax' else downsample_lttb(pairs, points)
+    return [(by_x[x], y) for x, y in sampled]
+
+
+def portfolio_series(holdings, range_key='1M', points=DEFAULT_CHART_POINTS):
+    """
+    Value of the given holdings (anything with .stock and .quantity) over
+    the chart range, priced at each bar's close. All holdings are read with
+    one range scan; a stock without a bar on some date carries its last
+    close forward, and before its first bar in the range it is priced at
+    that first close, so a later-listed stock does not make the series jump.
+    """
+    lookback, interval = CHART_RANGES[range_key]
+    quantities = {h.stock.id: h.quantity for h in holdings}
+    if not quantities:
+        return []
+
+    rows = (PriceBar.objects
+            .filter(stock_id__in=list(quantities), interval=interval,
+                    timestamp__gte=timezone.now() - lookback)
+            .order_by('timestamp')
+            .values_list('timestamp', 'stock_id', 'close'))
+
+    closes_by_ts = defaultdict(dict)
+    first_close = {}
+    for ts, stock_id, close in rows:
+        closes_by_ts[ts][stock_id] = close
+        first_close.setdefault(stock_id, close)
+
+    last_close = first_close
+    raw = []
+    for ts in sorted(closes_by_ts):
+        last_close.update(closes_by_ts[ts])
+        value = sum(quantities[sid] * close for sid, close in last_close.items())
+        raw.append((_x(ts), value, ts))
+    return _downsample(raw, points, 'lttb')
+
+
+def chart_points(holdings, current_value, range_key='1M', points=DEFAULT_CHART_POINTS):
+    """
+    Chart labels and values for the portfolio views: the historical series
+    followed by today's live value.
+    """
+    series = portfolio_series(holdings, range_key, points)
+    date_format = '%d %b %Y' if range_key in ('1Y', '5Y') else '%d %b'
+    labels = [ts.strftime(date_format) for ts, _ in series] + ['Today']
+    data = [round(value, 2) for _, value in series] + [float(current_value)]
+    return labels, data
@@ -0,0 +1,123 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from .models import PendingOrder
+
+
+class _Ladder:
+    """
+    Order ids sorted by key, kept so that crossed orders are always the
+    tail: a price update is one bisect plus a slice of the k hits.
+    """
+    __slots__ = ('keys', 'ids')
+
+    def __init__(self):
+        self.keys = []
+        self.ids = []
+
+    def add(self, key, order_id):
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.ids.insert(i, order_id)
+
+    def remove(self, key, order_id):
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.ids[i] == order_id:
+                del self.keys[i]
+                del self.ids[i]
+                return True
+            i += 1
+        return False
+
+    def pop_from(self, key):
+        i = bisect_left(self.keys, key)
+        hit = self.ids[i:]
+        del self.keys[i:]
+        del self.ids[i:]
+        return hit
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class TriggerBook:
+    """
+    In-memory index of open PendingOrders, one pair of price ladders per
+    symbol. Orders that fire on a fall are keyed by trigger price and cross
+    when trigger >= price; orders that fire on a rise are keyed by the
+    negated trigger and cross when -trigger >= -price. Either way the
+    crossed orders are a tail found with one bisect, so `crossed()` costs
+    O(log n + k) however many orders are resting.
+    """
+
+    def __init__(self):
+        self._ladders = defaultdict(lambda: (_Ladder(), _Ladder()))
+        self._where = {}
+        self.last_id = 0
+
+    def add(self, order_id, symbol, trigger_price, fires_on_fall):
+        if order_id in self._where:
+            return
+        price = float(trigger_price)
+        key = price if fires_on_fall else -price
+        ladder = 0 if fires_on_fall else 1
+        self._ladders[symbol][ladder].add(key, order_id)
+        self._where[order_id] = (symbol, ladder, key)
+        self.last_id = max(self.last_id, order_id)
+
+    def discard(self, order_id):
+        where = self._where.pop(order_id, None)
+        if where:
+            symbol, ladder, key = where
+            self._ladders[symbol][ladder].remove(key, order_id)
+
+    def crossed(self, symbol, price):
+        """
+        Removes and returns the ids of every order on `symbol` that the
+        price has reached.
+        """
+        if symbol not in self._ladders:
+            return []
+        price = float(price)
+        falls, rises = self._ladders[symbol]
+        hit = falls.pop_from(price) + rises.pop_from(-price)
+        for order_id in hit:
+            del self._where[order_id]
+        return hit
+
+    def on_quotes(self, quotes):
+        """
+        Crossed order ids for a {symbol: quote} mapping as returned by
+        get_multiple_stocks or refresh_quotes.
+        """
+        hit = []
+        for symbol, data in quotes.items():
+            hit.extend(self.crossed(symbol, data['price']))
+        return hit
+
+    def sync(self):
+        """
+        Adds orders placed since the last sync. Cancelled orders are left
+        in place and skipped at settlement, which rechecks the status.
+        """
+        return self._load(PendingOrder.objects.filter(status='OPEN', id__gt=self.last_id))
+
+    def restore(self, order_ids):
+        """
+        Puts back crossed orders that are still open after settlement, e.g.
+        because settling them failed unexpectedly; sync() would never load
+        them again.
+        """
+        return self._load(PendingOrder.objects.filter(status='OPEN', id__in=list(order_ids)))
+
+    def _load(self, orders):
+        rows = orders.order_by('id').values_list('id', 'stock__symbol', 'side', 'order_type', 'trigger_price')
+        added = 0
+        for order_id, symbol, side, order_type, trigger_price in rows.iterator(chunk_size=5000):
+            self.add(order_id, symbol, trigger_price, (side == 'BUY') == (order_type == 'LIMIT'))
+            added += 1
+        return added
+
+    def __len__(self):
+        return len(self._where)
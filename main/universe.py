@@ -0,0 +1,136 @@
+import csv
+import time
+from collections import defaultdict
+
+from django.db import connection
+
+from . import instruments
+from .models import Stock
+
+UPDATE_FIELDS = ['name', 'exchange', 'isin', 'currency', 'is_active']
+
+# Instruments loaded when no exchange files are given: every symbol the
+# dashboard and watchlist suggest, so a fresh install can trade them.
+DEFAULT_UNIVERSE = [
+    ('RELIANCE.NS', 'Reliance Industries Ltd', 'NSE', 'INE002A01018', 'INR'),
+    ('TCS.NS', 'Tata Consultancy Services Ltd', 'NSE', 'INE467B01029', 'INR'),
+    ('HDFCBANK.NS', 'HDFC Bank Ltd', 'NSE', 'INE040A01034', 'INR'),
+    ('INFY.NS', 'Infosys Ltd', 'NSE', 'INE009A01021', 'INR'),
+    ('ICICIBANK.NS', 'ICICI Bank Ltd', 'NSE', 'INE090A01021', 'INR'),
+    ('AAPL', 'Apple Inc.', 'NASDAQ', 'US0378331005', 'USD'),
+    ('TSLA', 'Tesla Inc.', 'NASDAQ', 'US88160R1014', 'USD'),
+    ('MSFT', 'Microsoft Corporation', 'NASDAQ', 'US5949181045', 'USD'),
+    ('AMZN', 'Amazon.com Inc.', 'NASDAQ', 'US0231351067', 'USD'),
+    ('GOOGL', 'Alphabet Inc. Class A', 'NASDAQ', 'US02079K3059', 'USD'),
+    ('NVDA', 'NVIDIA Corporation', 'NASDAQ', 'US67066G1040', 'USD'),
+]
+
+
+def _clean(row):
+    return {key.strip().upper(): (value or '').strip() for key, value in row.items() if key}
+
+
+def parse_nse(f):
+    """
+    NSE EQUITY_L.csv: SYMBOL, NAME OF COMPANY, SERIES, ..., ISIN NUMBER.
+    """
+    for row in csv.DictReader(f):
+        row = _clean(row)
+        if row.get('SYMBOL'):
+            yield f"{row['SYMBOL']}.NS", row.get('NAME OF COMPANY', ''), row.get('ISIN NUMBER', ''), 'INR', True
+
+
+def parse_bse(f):
+    """
+    BSE equity list: Security Id, Security Name, Status, ISIN No, ...
+    Rows not marked Active are loaded as inactive.
+    """
+    for row in csv.DictReader(f):
+        row = _clean(row)
+        if row.get('SECURITY ID'):
+            name = row.get('SECURITY NAME') or row.get('ISSUER NAME', '')
+            yield (f"{row['SECURITY ID']}.BO", name, row.get('ISIN NO', ''), 'INR',
+                   row.get('STATUS', 'Active').lower() == 'active')
+
+
+def parse_nasdaq(f):
+    """
+    nasdaqlisted.txt: pipe-delimited Symbol|Security Name|...|Test Issue|...
+    ending in a "File Creation Time" trailer. Test issues are skipped.
+    """
+    for row in csv.DictReader(f, delimiter='|'):
+        row = _clean(row)
+        symbol = row.get('SYMBOL', '')
+        if not symbol or symbol.startswith('FILE CREATION TIME') or row.get('TEST ISSUE') == 'Y':
+            continue
+        yield symbol, row.get('SECURITY NAME', ''), '', 'USD', True
+
+
+PARSERS = {'NSE': parse_nse, 'BSE': parse_bse, 'NASDAQ': parse_nasdaq}
+
+
+def _stocks(exchange, rows, seen):
+    """
+    Stock instances for parsed rows, skipping over-long symbols and any
+    symbol already loaded (a chunk must not upsert the same row twice).
+    """
+    for symbol, name, isin, currency, active in rows:
+        symbol = symbol.upper()
+        if len(symbol) <= 20 and symbol not in seen:
+            seen.add(symbol)
+            yield Stock(symbol=symbol, name=name[:100], exchange=exchange, isin=isin[:12],
+                        currency=currency, is_active=active)
+
+
+class UniverseLoader:
+    """
+    Upserts instruments in chunks with one INSERT ... ON CONFLICT per chunk
+    and, once every source has been read, deactivates the instruments of
+    each loaded exchange that no source listed. Source files are read as a
+    stream, so memory is bounded by the chunk plus the set of symbols seen.
+    `timings` holds seconds spent per phase.
+    """
+
+    def __init__(self, chunk_size=5000):
+        self.chunk_size = chunk_size
+        self.seen = defaultdict(set)
+        self.timings = defaultdict(float)
+        self.upserted = 0
+        self.deactivated = 0
+
+    def load(self, exchange, rows):
+        rows = _stocks(exchange, rows, self.seen[exchange])
+        while True:
+            started = time.perf_counter()
+            chunk = [stock for _, stock in zip(range(self.chunk_size), rows)]
+            self.timings['parse'] += time.perf_counter() - started
+            if not chunk:
+                break
+            self._upsert(chunk)
+
+    def load_file(self, exchange, path):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            self.load(exchange, PARSERS[exchange](f))
+
+    def _upsert(self, chunk):
+        started = time.perf_counter()
+        # MySQL upserts on any unique key (only symbol here) and rejects a target.
+        target = ['symbol'] if connection.features.supports_update_conflicts_with_target else None
+        Stock.objects.bulk_create(chunk, update_conflicts=True, unique_fields=target, update_fields=UPDATE_FIELDS)
+        self.upserted += len(chunk)
+        self.timings['upsert'] += time.perf_counter() - started
+
+    def deactivate_missing(self):
+        started = time.perf_counter()
+        for exchange, seen in self.seen.items():
+            listed = Stock.objects.filter(exchange=exchange, is_active=True).values_list('id', 'symbol')
+            gone = [stock_id for stock_id, symbol in listed.iterator(chunk_size=self.chunk_size)
+                    if symbol not in seen]
+            for i in range(0, len(gone), self.chunk_size):
+                self.deactivated += Stock.objects.filter(id__in=gone[i:i + self.chunk_size]).update(is_active=False)
+        self.timings['deactivate'] += time.perf_counter() - started
+
+    def finish(self, deactivate=True):
+        if deactivate:
+            self.deactivate_missing()
+        instruments.invalidate()
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -15,12 +15,25 @@ urlpatterns = [
     path('buy/search/', views.buy_stock, name='buy_stock_search'),
     path('sell/<int:stock_id>/', views.sell_stock, name='sell_stock'),
     path('transactions/', views.transactions_view, name='transactions'),
+    path('transactions/statement.csv', views.statement_export, name='statement_export'),
+    path('orders/', views.orders_view, name='orders'),
+    path('orders/<int:order_id>/cancel/', views.cancel_order, name='cancel_order'),
     
     path('watchlist/add/<str:symbol>/', views.add_to_watchlist, name='add_watchlist'),
     path('watchlist/remove/<int:stock_id>/', views.remove_from_watchlist, name='remove_watchlist'),
     
     path('sip/', views.sip_view, name='sip'),
+    path('sip/<int:plan_id>/cancel/', views.cancel_sip, name='cancel_sip'),
     path('fo/', views.fo_view, name='fo'),
     path('profile/', views.profile_view, name='profile'),
     path('investment/', views.investment_summary, name='investment_summary'),
+
+    path('api/quotes/', api.quotes, name='api_quotes'),
+    path('api/portfolio/', api.portfolio, name='api_portfolio'),
+    path('api/watchlist/', api.watchlist, name='api_watchlist'),
+    path('api/instruments/', api.instrument_search, name='api_instruments'),
+    path('api/transactions/', api.transactions, name='api_transactions'),
+    path('api/sip/projection/', api.sip_projection, name='api_sip_projection'),
+    path('stream/quotes/', views.quote_stream, name='quote_stream'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -1,54 +1,379 @@
-import yfinance as yf
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from decimal import Decimal
+
+from django.conf import settings
 from django.core.cache import cache
 
-def get_stock_data(symbol):
+from . import metrics
+from .providers import get_provider
+
+# Symbols every user sees: the dashboard market overview and the
+# "popular stocks" block on the watchlist page.
+MARKET_SYMBOLS = ['RELIANCE.NS', 'TCS.NS', 'HDFCBANK.NS', 'AAPL', 'TSLA', 'MSFT']
+POPULAR_SYMBOLS = ['INFY.NS', 'ICICIBANK.NS', 'AMZN', 'GOOGL', 'NVDA']
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Fetches currently running in this process, keyed by symbol.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _cache_key(symbol):
+    return f"stock_data_{symbol}"
+
+
+def _lock_key(symbol):
+    return f"stock_data_lock_{symbol}"
+
+
+def _negative_key(symbol):
+    return f"stock_data_failed_{symbol}"
+
+
+def _fetch_pool():
     """
-    Fetches live stock data from yfinance with a 5-minute cache.
+    Returns the thread pool shared by every request for concurrent fetches.
+    Its size caps how many upstream requests this process runs at once.
     """
-    cache_key = f"stock_data_{symbol}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        return cached_data
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=_setting('QUOTE_FETCH_WORKERS', 8),
+                    thread_name_prefix='quote-fetch',
+                )
+    return _pool
+
+
+def _build_quote(symbol, name, last_price, open_price):
+    """
+    Shapes raw upstream prices into the quote dict the views and templates use.
+    """
+    if open_price:
+        change = Decimal(str(last_price - open_price))
+        change_percent = Decimal(str((last_price - open_price) / open_price * 100))
+    else:
+        change = Decimal('0.00')
+        change_percent = Decimal('0.00')
+
+    return {
+        'symbol': symbol,
+        'name': name,
+        'price': Decimal(str(round(last_price, 2))),
+        'change': change.quantize(Decimal('0.01')),
+        'change_percent': change_percent.quantize(Decimal('0.01')),
+        'fetched_at': time.time(),
+    }
+
+
+def _is_fresh(data):
+    return time.time() - data.get('fetched_at', 0) < _setting('QUOTE_CACHE_TTL', 300)
+
+
+def _store_quotes(quotes):
+    """
+    Caches quotes for QUOTE_STALE_TTL. They count as fresh for the first
+    QUOTE_CACHE_TTL seconds and are served stale while revalidating after.
+    """
+    if not quotes:
+        return
+    cache.set_many({_cache_key(sym): data for sym, data in quotes.items()},
+                   _setting('QUOTE_STALE_TTL', 24 * 60 * 60))
+    cache.delete_many([_negative_key(sym) for sym in quotes])
+
+
+def _record_failures(symbols):
+    """
+    Remembers symbols the upstream could not price, backing off
+    exponentially from QUOTE_NEGATIVE_TTL up to QUOTE_NEGATIVE_MAX_TTL so
+    delisted or mistyped symbols stop costing an upstream call per request.
+    """
+    if not symbols:
+        return
+    base = _setting('QUOTE_NEGATIVE_TTL', 30)
+    ceiling = _setting('QUOTE_NEGATIVE_MAX_TTL', 900)
+    previous = cache.get_many([_negative_key(sym) for sym in symbols])
+    now = time.time()
+    entries = {}
+    for sym in symbols:
+        failures = previous.get(_negative_key(sym), {}).get('failures', 0) + 1
+        backoff = min(base * 2 ** (failures - 1), ceiling)
+        entries[_negative_key(sym)] = {'failures': failures, 'retry_at': now + backoff}
+    # Keep the failure count around past the backoff so it keeps growing.
+    cache.set_many(entries, ceiling * 2)
+    metrics.incr('quote_fetch_failures', len(symbols))
+
+
+def _is_backing_off(entry):
+    return entry is not None and time.time() < entry['retry_at']
+
+
+def _single_flight(symbol, fetch):
+    """
+    Runs fetch() unless another thread in this process is already fetching
+    the symbol, in which case it waits for and shares that result.
+    """
+    with _inflight_lock:
+        future = _inflight.get(symbol)
+        leader = future is None
+        if leader:
+            future = _inflight[symbol] = Future()
+    if not leader:
+        metrics.incr('quote_fetch_coalesced')
+        try:
+            return future.result(timeout=_setting('QUOTE_FETCH_TIMEOUT', 10))
+        except Exception:
+            return None
 
+    result = None
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.fast_info
-        last_price = info.last_price
-        
-        long_name = getattr(ticker, 'info', {}).get('longName', symbol)
-        
-        history = ticker.history(period="1d")
-        if not history.empty:
-            open_price = history['Open'].iloc[0]
-            change = Decimal(str(last_price - open_price))
-            change_percent = Decimal(str((last_price - open_price) / open_price * 100))
-        else:
-            change = Decimal('0.00')
-            change_percent = Decimal('0.00')
-
-        data = {
-            'symbol': symbol,
-            'name': long_name,
-            'price': Decimal(str(round(last_price, 2))),
-            'change': change.quantize(Decimal('0.01')),
-            'change_percent': change_percent.quantize(Decimal('0.01')),
-        }
-        
-        # Cache the result for 5 minutes (300 seconds)
-        cache.set(cache_key, data, 300)
+        result = fetch()
+        return result
+    finally:
+        future.set_result(result)
+        with _inflight_lock:
+            _inflight.pop(symbol, None)
+
+
+def _claim(symbols):
+    """
+    Takes the cross-process fetch lock for each symbol and returns the ones
+    this process won; the others are already being fetched elsewhere.
+    """
+    timeout = _setting('QUOTE_FETCH_TIMEOUT', 10) * 2
+    return [sym for sym in symbols if cache.add(_lock_key(sym), 1, timeout)]
+
+
+def _release(symbols):
+    cache.delete_many([_lock_key(sym) for sym in symbols])
+
+
+def _fetch_one(symbol):
+    """
+    Fetches a single symbol, including its long name, the way the trade and
+    watchlist views need it for symbols that have never been seen before.
+    """
+    if not _claim([symbol]):
+        # Another process is fetching it; wait for its result to land, or
+        # for its failure to be recorded.
+        deadline = time.monotonic() + _setting('QUOTE_FETCH_TIMEOUT', 10)
+        while time.monotonic() < deadline:
+            cached = cache.get_many([_cache_key(symbol), _negative_key(symbol)])
+            if cached.get(_cache_key(symbol)):
+                return cached[_cache_key(symbol)]
+            if _is_backing_off(cached.get(_negative_key(symbol))):
+                return None
+            time.sleep(0.05)
+        return None
+
+    try:
+        started = time.perf_counter()
+        try:
+            raw = get_provider().get_quote(symbol)
+        finally:
+            metrics.record_upstream('quote', time.perf_counter() - started)
+        if raw is None:
+            raise LookupError("no price available")
+        data = _build_quote(symbol, raw['name'], raw['price'], raw['open'])
+        _store_quotes({symbol: data})
         return data
     except Exception as e:
         print(f"Error fetching stock data for {symbol}: {e}")
+        _record_failures([symbol])
         return None
+    finally:
+        _release([symbol])
+
+
+def get_stock_data(symbol):
+    """
+    Fetches live stock data from the market-data provider with a 5-minute cache.
+
+    Expired quotes are served stale while a single background fetch
+    revalidates them, concurrent misses share one upstream call, and
+    symbols that fail upstream are not retried until their backoff expires.
+    """
+    cached = cache.get_many([_cache_key(symbol), _negative_key(symbol)])
+    cached_data = cached.get(_cache_key(symbol))
+    metrics.record_cache(1 if cached_data else 0, 0 if cached_data else 1)
+    if cached_data:
+        if _is_fresh(cached_data):
+            return cached_data
+        _revalidate({symbol: cached_data})
+        return dict(cached_data, stale=True)
+
+    if _is_backing_off(cached.get(_negative_key(symbol))):
+        metrics.incr('quote_negative_hits')
+        return None
+    return _single_flight(symbol, lambda: _fetch_one(symbol))
+
+
+def _fetch_quotes_bulk(symbols, names):
+    """
+    Fetches all symbols with a single provider request. Names are passed in
+    by the caller so no per-symbol lookup (or database access from pool
+    threads) is needed.
+    """
+    started = time.perf_counter()
+    try:
+        raw = get_provider().get_quotes(list(symbols))
+    except Exception as e:
+        print(f"Error fetching stock data for {', '.join(symbols)}: {e}")
+        raw = {}
+    metrics.record_upstream('quotes', time.perf_counter() - started)
+
+    results = {
+        sym: _build_quote(sym, names.get(sym, quote['name']), quote['price'], quote['open'])
+        for sym, quote in raw.items()
+    }
+    _store_quotes(results)
+    _record_failures([sym for sym in symbols if sym not in results])
+    return results
+
+
+def _refresh_claimed(symbols, names):
+    try:
+        return _fetch_quotes_bulk(symbols, names)
+    finally:
+        _release(symbols)
+
+
+def _revalidate(entries):
+    """
+    Schedules one background refresh for the expired quotes in `entries`
+    (symbol -> last known quote), skipping symbols another thread or
+    process is already refreshing.
+    """
+    claimed = _claim(list(entries))
+    if not claimed:
+        return
+    metrics.incr('quote_revalidations', len(claimed))
+    names = {sym: entries[sym].get('name', sym) for sym in claimed}
+    _fetch_pool().submit(_refresh_claimed, claimed, names)
+
+
+def _fetch_concurrently(symbols, names, known):
+    """
+    Claims the symbols, fans the ones this process won out over the shared
+    pool in chunks and waits at most QUOTE_FETCH_DEADLINE seconds. Symbols
+    that miss the deadline, or that another process is already fetching,
+    are served from their last known quote (`known`, or one that has
+    landed in the cache meanwhile), marked stale; their fetch keeps running
+    and warms the cache for the next request.
+    """
+    claimed = _claim(symbols)
+    size = max(1, _setting('QUOTE_FETCH_CHUNK_SIZE', 5))
+    chunks = [claimed[i:i + size] for i in range(0, len(claimed), size)]
+    pool = _fetch_pool()
+    # Each chunk runs in a copy of this context so its upstream time is
+    # still charged to the request waiting on it.
+    futures = {pool.submit(contextvars.copy_context().run, _refresh_claimed, chunk, names): chunk
+               for chunk in chunks}
+    done, pending = wait(futures, timeout=_setting('QUOTE_FETCH_DEADLINE', 0.4)) if futures else ((), ())
+
+    results = {}
+    for future in done:
+        results.update(future.result())
+
+    late = [sym for future in pending for sym in futures[future]]
+    if late:
+        metrics.incr('quote_fetch_timeouts', len(late))
+    claimed = set(claimed)
+    late += [sym for sym in symbols if sym not in claimed]
+    if late:
+        landed = get_cached_quotes([sym for sym in late if sym not in known])
+        for sym in late:
+            data = landed.get(sym) or known.get(sym)
+            if data and _is_fresh(data):
+                results[sym] = data
+            elif data:
+                results[sym] = dict(data, stale=True)
+                metrics.incr('quote_stale_fallbacks')
+            else:
+                metrics.incr('quote_fallback_misses')
+    return results
+
+
+def refresh_quotes(symbols, names):
+    """
+    Fetches the given symbols upstream regardless of what is cached and
+    stores the results. Used by the `refresh_quotes` management command.
+    """
+    return _fetch_quotes_bulk(list(symbols), names)
+
+
+def get_cached_quotes(symbols):
+    """
+    Returns the last known quote for each symbol without going upstream.
+    """
+    cached = cache.get_many([_cache_key(sym) for sym in symbols])
+    return {sym: cached[_cache_key(sym)] for sym in symbols if _cache_key(sym) in cached}
+
 
 def get_multiple_stocks(symbols):
     """
-    Fetch multiple stocks efficiently using individual cache checks.
+    Fetch multiple stocks with one cache round trip and one bulk upstream
+    request for whatever is missing from the cache. Expired quotes are
+    returned stale and revalidated in the background, as in get_stock_data.
+    When QUOTE_FETCH_MODE is 'concurrent', misses and expired quotes are
+    fetched together in parallel chunks under QUOTE_FETCH_DEADLINE.
+
+    With QUOTE_CACHE_ONLY enabled the request path never goes upstream:
+    the `refresh_quotes` command is expected to keep the cache warm.
     """
+    from .models import Stock
+
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+
+    cached = cache.get_many(
+        [_cache_key(sym) for sym in symbols] + [_negative_key(sym) for sym in symbols]
+    )
     results = {}
+    expired = {}
+    misses = []
     for sym in symbols:
-        data = get_stock_data(sym)
+        data = cached.get(_cache_key(sym))
         if data:
-            results[sym] = data
-    return results
+            if _is_fresh(data):
+                results[sym] = data
+            else:
+                results[sym] = dict(data, stale=True)
+                expired[sym] = data
+        elif _is_backing_off(cached.get(_negative_key(sym))):
+            metrics.incr('quote_negative_hits')
+        else:
+            misses.append(sym)
+    metrics.record_cache(len(results), len(symbols) - len(results))
+
+    if _setting('QUOTE_CACHE_ONLY', False):
+        if misses:
+            metrics.incr('quote_cache_only_misses', len(misses))
+    elif _setting('QUOTE_FETCH_MODE', 'batch') == 'concurrent':
+        # Expired quotes are refreshed alongside the misses, within the
+        # same deadline, and stay stale only if their fetch runs late.
+        if misses or expired:
+            names = {sym: data.get('name', sym) for sym, data in expired.items()}
+            if misses:
+                names.update(Stock.objects.filter(symbol__in=misses).values_list('symbol', 'name'))
+            results.update(_fetch_concurrently(misses + list(expired), names, expired))
+    else:
+        if expired:
+            _revalidate(expired)
+        if misses:
+            names = dict(Stock.objects.filter(symbol__in=misses).values_list('symbol', 'name'))
+            results.update(_fetch_quotes_bulk(misses, names))
+
+    # Preserve the caller's ordering; views iterate the returned dict directly.
+    return {sym: results[sym] for sym in symbols if sym in results}
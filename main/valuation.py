@@ -0,0 +1,96 @@
+from dataclasses import dataclass
+from decimal import Decimal
+
+from .models import Portfolio
+from .utils import get_multiple_stocks
+
+ZERO = Decimal('0.00')
+
+
+@dataclass(frozen=True)
+class HoldingValuation:
+    id: int
+    stock: object
+    quantity: int
+    avg_price: Decimal
+    current_price: Decimal
+    invested: Decimal
+    current_value: Decimal
+    pnl: Decimal
+    pnl_percent: Decimal
+    stale: bool
+    # False when there was no quote and current_price is the average price.
+    priced: bool
+
+
+@dataclass(frozen=True)
+class PortfolioValuation:
+    holdings: tuple
+    total_invested: Decimal
+    current_value: Decimal
+    profit_loss: Decimal
+    pnl_percent: Decimal
+
+
+class PortfolioValuationEngine:
+    """
+    Values a user's open holdings against live quotes.
+
+    Holdings and their stocks are loaded with one query and every quote is
+    looked up in one batch, so the cost does not grow with the number of
+    holdings. The arithmetic stays in Decimal so amounts match the ledger
+    exactly. Holdings without a live quote are valued at their average
+    price and marked unpriced. `dashboard`, `portfolio_view` and
+    `investment_summary` all use this engine.
+    """
+
+    def __init__(self, quote_source=get_multiple_stocks):
+        self.quote_source = quote_source
+
+    def load(self, user):
+        return list(
+            Portfolio.objects.filter(user=user, quantity__gt=0)
+            .select_related('stock')
+            .order_by('stock__symbol')
+        )
+
+    def value(self, user):
+        rows = self.load(user)
+        quotes = self.quote_source([h.stock.symbol for h in rows])
+        return self.value_rows(rows, quotes)
+
+    @staticmethod
+    def value_rows(rows, quotes):
+        holdings = []
+        total_invested = ZERO
+        current_value = ZERO
+        for h in rows:
+            quote = quotes.get(h.stock.symbol)
+            price = quote['price'] if quote else h.avg_price
+            invested = h.quantity * h.avg_price
+            value = h.quantity * price
+            pnl = value - invested
+            holdings.append(HoldingValuation(
+                id=h.id,
+                stock=h.stock,
+                quantity=h.quantity,
+                avg_price=h.avg_price,
+                current_price=price,
+                invested=invested,
+                current_value=value,
+                pnl=pnl,
+                pnl_percent=(pnl / invested * 100) if invested > 0 else ZERO,
+                stale=bool(quote and quote.get('stale')),
+                priced=quote is not None,
+            ))
+            total_invested += invested
+            current_value += value
+
+        profit_loss = current_value - total_invested
+        return PortfolioValuation(
+            holdings=tuple(holdings),
+            total_invested=total_invested,
+            current_value=current_value,
+            profit_loss=profit_loss,
+            pnl_percent=(profit_loss / total_invested * 100) if total_invested > 0 else ZERO,
+        )
@@ -1,12 +1,26 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.models import User
 from django.contrib import messages
-from .models import Stock, Portfolio, Transaction, Watchlist, Profile
-from .utils import get_stock_data, get_multiple_stocks
-from .forms import TradeXRegistrationForm, TradeXLoginForm, BuyStockForm, SellStockForm, SIPForm
+from django.utils import timezone
+from .models import Stock, Portfolio, Transaction, Watchlist, Profile, PendingOrder, SIPPlan
+from .utils import get_stock_data, get_multiple_stocks, refresh_quotes, MARKET_SYMBOLS, POPULAR_SYMBOLS
+from .forms import TradeXRegistrationForm, TradeXLoginForm, BuyStockForm, SellStockForm, SIPForm, TransactionFilterForm
+from .valuation import PortfolioValuationEngine
+from .orders import execute_buy, execute_sell, OrderError
+from .timeseries import CHART_RANGES, chart_points
+from .pagination import keyset_page
+from .statements import csv_lines, statement_rows
+from .lots import lot_positions
+from .streaming import event_stream, get_hub
+from . import fragments, instruments, metrics, nav, risk
+from datetime import datetime, time, timedelta
 from decimal import Decimal
+import hmac
 import json
 
 def home(request):
@@ -55,108 +69,140 @@ def login_view(request):
             if user:
                 login(request, user)
                 return redirect('dashboard')
+            elif getattr(request, 'login_throttled', False):
+                messages.error(request, "Too many login attempts. Please wait a few minutes and try again.")
             else:
                 messages.error(request, "Invalid phone number or password")
     else:
         form = TradeXLoginForm()
     return render(request, 'registration/login.html', {'form': form})
 
+def _stock_ids(quotes):
+    """
+    Returns symbol -> Stock id for the quoted symbols, creating any missing
+    Stock rows in one bulk insert.
+    """
+    ids = dict(Stock.objects.filter(symbol__in=list(quotes)).values_list('symbol', 'id'))
+    missing = [sym for sym in quotes if sym not in ids]
+    if missing:
+        Stock.objects.bulk_create(
+            [Stock(symbol=sym, name=quotes[sym]['name']) for sym in missing],
+            ignore_conflicts=True,
+        )
+        ids.update(Stock.objects.filter(symbol__in=missing).values_list('symbol', 'id'))
+    return ids
+
+
 @login_required
 def dashboard(request):
-    profile, created = Profile.objects.get_or_create(user=request.user)
-    holdings = Portfolio.objects.filter(user=request.user)
-    
-    # Fetch live data for current holdings
-    symbols = [h.stock.symbol for h in holdings]
-    live_data = get_multiple_stocks(symbols)
-    
-    total_invested = sum(h.quantity * h.avg_price for h in holdings)
-    current_value = Decimal('0.00')
-    
-    for h in holdings:
-        price = live_data.get(h.stock.symbol, {}).get('price', h.avg_price)
-        current_value += h.quantity * price
-        
-    profit_loss = current_value - total_invested
-    pnl_percent = (profit_loss / total_invested * 100) if total_invested > 0 else 0
-    
-    # Market overview (Top stocks)
-    market_symbols = ['RELIANCE.NS', 'TCS.NS', 'HDFCBANK.NS', 'AAPL', 'TSLA', 'MSFT']
-    market_data = get_multiple_stocks(market_symbols)
-    
-    # Create Stock objects if they don't exist for the UI loops
-    top_stocks = []
-    for sym, data in market_data.items():
-        stock_obj, _ = Stock.objects.get_or_create(symbol=sym, defaults={'name': data['name']})
-        data['id'] = stock_obj.id
-        top_stocks.append(data)
-
-    # Simulated performance data
-    chart_labels = ['1w', '6d', '5d', '4d', '3d', '2d', 'Today']
-    chart_data = [
-        float(total_invested - 5000), float(total_invested - 3000), 
-        float(total_invested + 2000), float(total_invested - 1000), 
-        float(total_invested + 4000), float(total_invested + 1000), 
-        float(current_value)
-    ]
+    user_id = request.user.id
+    held = fragments.cached_for_user('held_symbols', user_id, lambda: list(
+        Portfolio.objects.filter(user_id=user_id).values_list('stock__symbol', flat=True)))
 
-    context = {
-        'profile': profile,
-        'total_invested': total_invested,
-        'current_value': current_value,
-        'profit_loss': profit_loss,
-        'pnl_percent': pnl_percent,
-        'top_stocks': top_stocks,
-        'recent_transactions': Transaction.objects.filter(user=request.user).order_by('-timestamp')[:5],
-        'chart_labels': json.dumps(chart_labels),
-        'chart_data': json.dumps(chart_data),
-    }
-    return render(request, 'main/dashboard.html', context)
+    def summary():
+        profile, created = Profile.objects.get_or_create(user=request.user)
+        valuation = PortfolioValuationEngine().value(request.user)
+        # Holdings value over the last week from NAV snapshots, falling back
+        # to today's holdings priced at stored daily bars
+        chart = nav.chart_points(nav.nav_rows(request.user, '1W'), valuation.current_value, '1W')
+        chart_labels, chart_data = chart or chart_points(valuation.holdings, valuation.current_value, '1W')
+        return {
+            'profile': profile,
+            'total_invested': valuation.total_invested,
+            'current_value': valuation.current_value,
+            'profit_loss': valuation.profit_loss,
+            'pnl_percent': valuation.pnl_percent,
+            'chart_labels': json.dumps(chart_labels),
+            'chart_data': json.dumps(chart_data),
+        }
+
+    # Market overview (Top stocks), shared by every user
+    market_data = get_multiple_stocks(MARKET_SYMBOLS)
+
+    def market_pulse():
+        # Stock ids for the buy links
+        stock_ids = _stock_ids(market_data)
+        top_stocks = []
+        for sym, data in market_data.items():
+            top_stocks.append(dict(data, id=stock_ids[sym]))
+        return {'top_stocks': top_stocks}
+
+    return render(request, 'main/dashboard.html', {
+        'summary': fragments.render_fragment(
+            'dashboard_summary', 'main/fragments/dashboard_summary.html', summary,
+            fragments.quote_version(get_multiple_stocks(held)), timezone.localdate(), user_id=user_id),
+        'market_pulse': fragments.render_fragment(
+            'market_pulse', 'main/fragments/market_pulse.html', market_pulse,
+            fragments.quote_version(market_data)),
+    })
 
 @login_required
 def portfolio_view(request):
-    holdings = Portfolio.objects.filter(user=request.user, quantity__gt=0)
-    symbols = [h.stock.symbol for h in holdings]
-    live_data = get_multiple_stocks(symbols)
-    
-    for h in holdings:
-        data = live_data.get(h.stock.symbol, {})
-        h.current_price = data.get('price', Decimal('0.00'))
-        h.pnl = (h.current_price - h.avg_price) * h.quantity
-        h.pnl_percent = ((h.current_price - h.avg_price) / h.avg_price * 100) if h.avg_price > 0 else 0
-
-    return render(request, 'main/portfolio.html', {'holdings': holdings})
+    valuation = PortfolioValuationEngine().value(request.user)
+    prices = {h.stock.symbol: h.current_price for h in valuation.holdings if h.priced and not h.stale}
+    lots = lot_positions(request.user, prices)
+    realized = Profile.objects.filter(user=request.user).values_list('realized_pnl', flat=True).first()
+    return render(request, 'main/portfolio.html', {
+        'holdings': [(h, lots.get(h.stock.id)) for h in valuation.holdings],
+        'realized_pnl': realized or Decimal('0.00'),
+    })
 
 @login_required
 def watchlist_view(request):
-    watchlist_items = Watchlist.objects.filter(user=request.user)
-    symbols = [item.stock.symbol for item in watchlist_items]
+    user_id = request.user.id
+    symbols = fragments.cached_for_user('watched_symbols', user_id, lambda: list(
+        Watchlist.objects.filter(user_id=user_id).values_list('stock__symbol', flat=True)))
     live_data = get_multiple_stocks(symbols)
-    
-    for item in watchlist_items:
-        data = live_data.get(item.stock.symbol, {})
-        item.price = data.get('price')
-        item.change_percent = data.get('change_percent')
-
-    # Popular stocks to add
-    popular_symbols = ['INFY.NS', 'ICICIBANK.NS', 'AMZN', 'GOOGL', 'NVDA']
-    popular_data = get_multiple_stocks(popular_symbols)
-    
+
+    def watchlist_items():
+        items = list(Watchlist.objects.filter(user_id=user_id).select_related('stock'))
+        for item in items:
+            data = live_data.get(item.stock.symbol, {})
+            item.price = data.get('price')
+            item.change_percent = data.get('change_percent')
+        return {'watchlist': items}
+
+    # Popular stocks to add, shared by every user
+    popular_data = get_multiple_stocks(POPULAR_SYMBOLS)
+
     return render(request, 'main/watchlist.html', {
-        'watchlist': watchlist_items,
-        'popular_stocks': popular_data.values()
+        'watchlist_items': fragments.render_fragment(
+            'watchlist_items', 'main/fragments/watchlist_items.html', watchlist_items,
+            fragments.quote_version(live_data), user_id=user_id),
+        'popular_stocks': fragments.render_fragment(
+            'popular_stocks', 'main/fragments/popular_stocks.html',
+            lambda: {'popular_stocks': popular_data.values()}, fragments.quote_version(popular_data)),
+        'live_stream': isinstance(request, ASGIRequest),
     })
 
+def resolve_stock(symbol):
+    """
+    The listed Stock for a symbol or ISIN, checked against the in-memory
+    instrument master rather than the market-data provider.
+    """
+    instrument = instruments.resolve(symbol)
+    return Stock.objects.filter(id=instrument.id).first() if instrument else None
+
+def market_price(stock, live_data):
+    """
+    The price a market order fills at. A stale quote is fine to show but
+    not to trade on, so it is fetched upstream again; when there is still
+    no fresh quote the price is 0, which execute_buy and execute_sell
+    refuse as unavailable.
+    """
+    if live_data and live_data.get('stale'):
+        live_data = refresh_quotes([stock.symbol], {stock.symbol: stock.name}).get(stock.symbol)
+    if not live_data or live_data.get('stale'):
+        return Decimal('0.00')
+    return live_data['price']
+
 @login_required
 def buy_stock(request, stock_id=None):
     stock = None
     if stock_id:
         stock = get_object_or_404(Stock, id=stock_id)
     elif request.GET.get('symbol'):
-        symbol = request.GET.get('symbol').upper()
-        data = get_stock_data(symbol)
-        if data:
-            stock, _ = Stock.objects.get_or_create(symbol=symbol, defaults={'name': data['name']})
+        stock = resolve_stock(request.GET.get('symbol'))
     
     if not stock:
         messages.error(request, "Stock not found")
@@ -171,30 +217,15 @@ def buy_stock(request, stock_id=None):
         form = BuyStockForm(request.POST)
         if form.is_valid():
             quantity = form.cleaned_data['quantity']
-            total_cost = price * quantity
-            
-            if profile.balance >= total_cost:
-                profile.balance -= total_cost
-                profile.save()
-                
-                holding, created = Portfolio.objects.get_or_create(
-                    user=request.user, stock=stock, 
-                    defaults={'quantity': 0, 'avg_price': 0}
-                )
-                
-                new_total_qty = holding.quantity + quantity
-                holding.avg_price = ((holding.avg_price * holding.quantity) + total_cost) / new_total_qty
-                holding.quantity = new_total_qty
-                holding.save()
-                
-                Transaction.objects.create(
-                    user=request.user, stock=stock, quantity=quantity,
-                    price=price, transaction_type='BUY'
-                )
+            if form.cleaned_data['order_type'] != 'MARKET':
+                return place_pending_order(request, stock, 'BUY', form.cleaned_data)
+            try:
+                execute_buy(request.user, stock, quantity, market_price(stock, live_data))
+            except OrderError as e:
+                messages.error(request, str(e))
+            else:
                 messages.success(request, f"Successfully bought {quantity} shares of {stock.symbol}")
                 return redirect('portfolio')
-            else:
-                messages.error(request, "Insufficient balance in your wallet.")
     else:
         form = BuyStockForm()
 
@@ -217,26 +248,15 @@ def sell_stock(request, stock_id):
         form = SellStockForm(request.POST)
         if form.is_valid():
             quantity = form.cleaned_data['quantity']
-            if quantity <= holding.quantity:
-                total_revenue = price * quantity
-                profile = Profile.objects.get(user=request.user)
-                profile.balance += total_revenue
-                profile.save()
-                
-                holding.quantity -= quantity
-                if holding.quantity == 0:
-                    holding.delete()
-                else:
-                    holding.save()
-                    
-                Transaction.objects.create(
-                    user=request.user, stock=stock, quantity=quantity,
-                    price=price, transaction_type='SELL'
-                )
+            if form.cleaned_data['order_type'] != 'MARKET':
+                return place_pending_order(request, stock, 'SELL', form.cleaned_data)
+            try:
+                execute_sell(request.user, stock, quantity, market_price(stock, live_data))
+            except OrderError as e:
+                messages.error(request, str(e))
+            else:
                 messages.success(request, f"Successfully sold {quantity} shares of {stock.symbol}")
                 return redirect('portfolio')
-            else:
-                messages.error(request, f"You only have {holding.quantity} shares available to sell.")
     else:
         form = SellStockForm(initial={'quantity': 1})
 
@@ -247,18 +267,95 @@ def sell_stock(request, stock_id):
         'form': form
     })
 
+def place_pending_order(request, stock, side, data):
+    order = PendingOrder.objects.create(
+        user=request.user, stock=stock, side=side, order_type=data['order_type'],
+        quantity=data['quantity'], trigger_price=data['trigger_price'],
+    )
+    messages.success(request, f"{order.get_order_type_display()} {side.lower()} order for {order.quantity} "
+                              f"{stock.symbol} placed at ₹{order.trigger_price}")
+    return redirect('orders')
+
+@login_required
+def orders_view(request):
+    orders = (PendingOrder.objects.filter(user=request.user)
+              .select_related('stock').order_by('-created_at')[:100])
+    return render(request, 'main/orders.html', {'orders': orders})
+
+@login_required
+def cancel_order(request, order_id):
+    if request.method == 'POST':
+        cancelled = (PendingOrder.objects.filter(id=order_id, user=request.user, status='OPEN')
+                     .update(status='CANCELLED', closed_at=timezone.now()))
+        if cancelled:
+            messages.success(request, "Order cancelled")
+        else:
+            messages.error(request, "That order is no longer open")
+    return redirect('orders')
+
 @login_required
 def transactions_view(request):
-    txs = Transaction.objects.filter(user=request.user).order_by('-timestamp')
-    return render(request, 'main/transactions.html', {'transactions': txs})
+    txs = Transaction.objects.filter(user=request.user).select_related('stock')
+    form = TransactionFilterForm(request.GET)
+    if form.is_valid():
+        filters = form.cleaned_data
+        if filters['type']:
+            txs = txs.filter(transaction_type=filters['type'])
+        if filters['symbol']:
+            # Filter on the id so the (user, stock, timestamp) index applies.
+            stock_id = Stock.objects.filter(symbol=filters['symbol']).values_list('id', flat=True).first()
+            txs = txs.filter(stock_id=stock_id) if stock_id else txs.none()
+        tz = timezone.get_current_timezone()
+        if filters['start']:
+            txs = txs.filter(timestamp__gte=datetime.combine(filters['start'], time.min, tz))
+        if filters['end']:
+            txs = txs.filter(timestamp__lt=datetime.combine(filters['end'] + timedelta(days=1), time.min, tz))
+
+    rows, newer, older = keyset_page(txs, request.GET.get('after'), request.GET.get('before'))
+    params = request.GET.copy()
+    for key in ('after', 'before'):
+        params.pop(key, None)
+    return render(request, 'main/transactions.html', {
+        'transactions': rows,
+        'form': form,
+        'filter_query': params.urlencode(),
+        'newer_cursor': newer,
+        'older_cursor': older,
+    })
+
+@login_required
+def statement_export(request):
+    response = StreamingHttpResponse(csv_lines(statement_rows(request.user.id)), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="statement-{timezone.localdate():%Y%m%d}.csv"'
+    return response
+
+async def quote_stream(request):
+    """
+    Server-sent quote updates for the symbols the user holds or watches.
+    Only served over ASGI: a WSGI worker would be pinned by every open
+    stream.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Live quotes need an ASGI server", status=501)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    symbols = {sym async for sym in Portfolio.objects.filter(user=user, quantity__gt=0)
+               .values_list('stock__symbol', flat=True)}
+    symbols.update([sym async for sym in Watchlist.objects.filter(user=user).values_list('stock__symbol', flat=True)])
+    response = StreamingHttpResponse(event_stream(get_hub(), symbols), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @login_required
 def add_to_watchlist(request, symbol):
-    data = get_stock_data(symbol)
-    if data:
-        stock, _ = Stock.objects.get_or_create(symbol=symbol, defaults={'name': data['name']})
+    stock = resolve_stock(symbol)
+    if stock:
         Watchlist.objects.get_or_create(user=request.user, stock=stock)
-        messages.success(request, f"Added {symbol} to watchlist")
+        messages.success(request, f"Added {stock.symbol} to watchlist")
+    else:
+        messages.error(request, f"{symbol} is not a listed instrument")
     return redirect('watchlist')
 
 @login_required
@@ -272,11 +369,28 @@ def sip_view(request):
     if request.method == 'POST':
         form = SIPForm(request.POST)
         if form.is_valid():
-            messages.success(request, "SIP scheduled successfully! (Simulation)")
-            return redirect('dashboard')
+            stock = resolve_stock(form.cleaned_data['symbol'])
+            if stock:
+                SIPPlan.objects.create(
+                    user=request.user, stock=stock,
+                    amount=form.cleaned_data['amount'],
+                    frequency=form.cleaned_data['frequency'],
+                    next_run_date=timezone.localdate(),
+                )
+                messages.success(request, f"SIP in {stock.symbol} scheduled. The first instalment runs today.")
+                return redirect('sip')
+            form.add_error('symbol', "Stock not found")
     else:
         form = SIPForm()
-    return render(request, 'main/sip.html', {'form': form})
+    plans = SIPPlan.objects.filter(user=request.user, is_active=True).select_related('stock').order_by('next_run_date')
+    return render(request, 'main/sip.html', {'form': form, 'plans': plans})
+
+@login_required
+def cancel_sip(request, plan_id):
+    if request.method == 'POST':
+        SIPPlan.objects.filter(id=plan_id, user=request.user).update(is_active=False)
+        messages.success(request, "SIP cancelled")
+    return redirect('sip')
 
 @login_required
 def fo_view(request):
@@ -290,40 +404,43 @@ def profile_view(request):
 
 @login_required
 def investment_summary(request):
-    holdings = Portfolio.objects.filter(user=request.user)
-    symbols = [h.stock.symbol for h in holdings]
-    live_data = get_multiple_stocks(symbols)
+    valuation = PortfolioValuationEngine().value(request.user)
+    total_invested = valuation.total_invested
+    current_value = valuation.current_value
     
-    total_invested = sum(h.quantity * h.avg_price for h in holdings)
-    current_value = Decimal('0.00')
-    
-    for h in holdings:
-        price = live_data.get(h.stock.symbol, {}).get('price', h.avg_price)
-        current_value += h.quantity * price
-        
-    profit_loss = current_value - total_invested
-    pnl_percent = (profit_loss / total_invested * 100) if total_invested > 0 else 0
-    
-    # Calculate performance history for chart (Simulated for this demo)
-    # In production, this would pull from historical price snapshots
-    chart_labels = ['1W', '6D', '5D', '4D', '3D', '2D', 'Today']
-    chart_data = [
-        float(total_invested * Decimal('0.95')),
-        float(total_invested * Decimal('0.98')),
-        float(total_invested * Decimal('1.02')),
-        float(total_invested * Decimal('0.99')),
-        float(total_invested * Decimal('1.04')),
-        float(total_invested * Decimal('1.03')),
-        float(current_value)
-    ]
+    # Performance history for the chart, from NAV snapshots when they exist
+    chart_range = request.GET.get('range', '1M')
+    if chart_range not in CHART_RANGES:
+        chart_range = '1M'
+    nav_rows = nav.nav_rows(request.user, chart_range)
+    chart = nav.chart_points(nav_rows, current_value, chart_range)
+    chart_labels, chart_data = chart or chart_points(valuation.holdings, current_value, chart_range)
+    balance = Profile.objects.filter(user=request.user).values_list('balance', flat=True).first()
+    period_return = nav.period_return(nav_rows, (balance or Decimal('0.00')) + current_value)
     
     context = {
         'total_invested': total_invested,
         'current_value': current_value,
-        'profit_loss': profit_loss,
-        'pnl_percent': pnl_percent,
-        'holdings': holdings,
+        'profit_loss': valuation.profit_loss,
+        'pnl_percent': valuation.pnl_percent,
+        'holdings': valuation.holdings,
+        'chart_range': chart_range,
+        'chart_ranges': list(CHART_RANGES),
+        'period_return': period_return,
         'chart_labels': json.dumps(chart_labels),
         'chart_data': json.dumps(chart_data),
+        'risk': risk.portfolio_risk(request.user, valuation.holdings),
     }
     return render(request, 'main/investment_summary.html', context)
+
+def metrics_view(request):
+    """
+    Request and quote metrics of every worker in Prometheus text format.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    bearer = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (request.user.is_staff or (token and hmac.compare_digest(bearer, token))):
+        return HttpResponseForbidden()
+    counters, histograms = metrics.collect()
+    return HttpResponse(metrics.render_prometheus(counters, histograms),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')